@@ -2,163 +2,208 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, date, time, timedelta
 from pathlib import Path
-import re
+import calendar
+import io
+import threading
+from time import perf_counter
+
+from scheduler import (
+    DATA,
+    DB,
+    DEFAULT_MAX_MINUTES,
+    GRID_PERIODS,
+    PAGE_SIZES,
+    PUBLISH_HOOKS,
+    TABLES,
+    ReminderWorker,
+    BookingConflict,
+    Compactor,
+    StaleDataError,
+    BREAKDOWNS,
+    archive,
+    batch_conflicts,
+    booking_rows,
+    commit_booking,
+    commit_rows,
+    commit_save,
+    compact,
+    day_bookings,
+    ensure_sheet,
+    entitlements,
+    export_to_excel,
+    export_to_sqlite,
+    find_slots,
+    get_setting,
+    grid_window,
+    is_open,
+    label_of,
+    labels,
+    load_stats,
+    machine_lists_for_user,
+    make_human,
+    merge_edits,
+    page_of,
+    parse_booking_csv,
+    perf,
+    persisted,
+    reminders,
+    read_journal,
+    read_sheets,
+    storage,
+    table_index,
+    utilisation_report,
+    week_bookings,
+    weekly_starts,
+    workshop_grid,
+)
 
 # ---------- App config ----------
 st.set_page_config(page_title="Woodturners Scheduler", page_icon="🪵", layout="wide")
 BASE = Path(__file__).resolve().parent
-DB = BASE / "data" / "db.xlsx"
 ASSETS = BASE / "assets"
 DATE_FMT = "DD/MM/YYYY"  # Streamlit display format
 
-# ---------- Data IO ----------
+# ---------- Timing ----------
+_run_t0 = perf_counter()
+_stale = st.session_state.pop("perf_profiler", None)
+if _stale is not None:
+    _stale.disable()  # a profiled run that stopped early (st.rerun) never reached the end
+_profiler = None
+if st.session_state.pop("perf_profile", False):
+    _profiler = st.session_state["perf_profiler"] = perf.start_profile()
+_load = threading.local()  # set when load_db misses its cache in this thread
+
+# ---------- Core glue ----------
 @st.cache_data
-def load_db() -> dict:
-    """Read all sheets from the Excel DB into dataframes."""
+def load_db(rev: int = None) -> dict:
+    """Read all sheets from the Excel DB into dataframes (keyed on the data revision)."""
+    _load.miss = True
     try:
-        xls = pd.ExcelFile(DB, engine="openpyxl")
+        return read_sheets()
     except Exception as e:
         st.error(f"Could not open database at {DB}. Error: {e}")
         raise
-    sheets = {}
-    for name in xls.sheet_names:
-        sheets[name] = pd.read_excel(DB, sheet_name=name, engine="openpyxl")
-    return sheets
-
-def save_db(sheets: dict):
-    """Write all known sheets back to Excel and clear cache so next run reloads."""
-    with pd.ExcelWriter(DB, engine="openpyxl", mode="w") as w:
-        for name, df in sheets.items():
-            if isinstance(df, pd.DataFrame):
-                df.to_excel(w, sheet_name=name, index=False)
+
+PUBLISH_HOOKS["load_db"] = load_db.clear  # drop superseded snapshots; the next run reloads at the new revision
+
+def open_store():
+    """The configured backend; the Excel one is bound to this run's cached snapshot."""
+    _load.miss = False
+    with perf.span("load_db") as rec:
+        store = storage.open_store(load_db)
+        if store.kind == "excel":
+            rec["hit"] = not _load.miss
+    return store
+
+def section_store():
+    """The store this full run opened at the top; a fragment-only rerun skips the top, so the
+    section opens its own and still sees other people's commits."""
+    store = st.session_state.pop("run_store", None)
+    return store if store is not None else open_store()
+
+def save_db(sheets: dict, appended: dict = None) -> bool:
+    """Write the sheets this run changed back to storage; reports a stale sheet or busy lock in the UI."""
     try:
-        load_db.clear()  # invalidate cache so st.rerun() sees fresh data
-    except Exception:
-        pass
-
-def ensure_sheet(sheets: dict, name: str, columns: list) -> pd.DataFrame:
-    if name not in sheets or not isinstance(sheets[name], pd.DataFrame):
-        sheets[name] = pd.DataFrame(columns=columns)
-    # add any missing columns (won't drop extras)
-    for c in columns:
-        if c not in sheets[name].columns:
-            sheets[name][c] = None
-    return sheets[name]
-
-# ---------- Helpers ----------
-def get_setting(sheets: dict, key: str, default: str = "") -> str:
-    S = sheets.get("Settings", pd.DataFrame(columns=["key", "value"]))
-    row = S[S["key"] == key]
-    return default if row.empty else str(row.iloc[0]["value"])
-
-def parse_hhmm_or_ampm(s: str):
-    """Accept '9:00', '09:00', '9am', '5:30pm', '17', '1700' etc → (h, m) or None."""
-    if s is None:
-        return None
+        commit_save(sheets, appended)
+    except (StaleDataError, TimeoutError) as e:
+        st.error(str(e))
+        return False
+    return True
+
+def insert_rows(store, name: str, rows: pd.DataFrame, key: str = None) -> bool:
+    """Append new rows for *name* (ids assigned at commit) without rewriting the other sheets."""
     try:
-        s = str(s).strip()
-        if not s:
-            return None
-        s2 = s.lower().replace(" ", "")
-        ampm = None
-        if s2.endswith("am") or s2.endswith("pm"):
-            ampm = s2[-2:]
-            s2 = s2[:-2]
-        # accept 1700 style
-        if re.fullmatch(r"\d{3,4}", s2):
-            if len(s2) == 3:
-                h = int(s2[0])
-                m = int(s2[1:])
-            else:
-                h = int(s2[:2])
-                m = int(s2[2:])
-            if ampm == "pm" and h != 12:
-                h += 12
-            if ampm == "am" and h == 12:
-                h = 0
-            return h, m
-        parts = re.split(r"[:h]", s2)
-        h = int(parts[0])
-        m = int(parts[1]) if len(parts) > 1 else 0
-        if ampm == "pm" and h != 12:
-            h += 12
-        if ampm == "am" and h == 12:
-            h = 0
-        return h, m
-    except Exception:
-        return None
-
-def is_open(sheets: dict, d: date, start_t: time, end_t: time):
-    """Check closed dates + operating hours for a given day/time window."""
-    CD = sheets.get("ClosedDates", pd.DataFrame(columns=["date", "reason"])).copy()
-    if not CD.empty:
-        CD["date"] = pd.to_datetime(CD["date"], errors="coerce").dt.normalize()
-    dn = pd.Timestamp(d).normalize()
-    if not CD.empty and (CD["date"] == dn).any():
-        return False, "Closed (holiday/maintenance)"
-    OH = sheets.get("OperatingHours", pd.DataFrame(columns=["day_of_week", "open_time", "close_time"]))
-    row = OH[OH["day_of_week"] == pd.Timestamp(d).dayofweek]
-    if row.empty:
-        return False, "Closed"
-    ot = parse_hhmm_or_ampm(row.iloc[0]["open_time"])
-    ct = parse_hhmm_or_ampm(row.iloc[0]["close_time"])
-    if not ot or not ct:
-        return False, "Closed"
-    o_h, o_m = ot
-    c_h, c_m = ct
-    st_min = start_t.hour * 60 + start_t.minute
-    en_min = end_t.hour * 60 + end_t.minute
-    ok = (o_h * 60 + o_m) <= st_min and en_min <= (c_h * 60 + c_m)
-    return ok, f"{o_h:02d}:{o_m:02d}–{c_h:02d}:{c_m:02d}"
-
-def user_licence_ids(sheets: dict, uid: int) -> set:
-    UL = sheets.get("UserLicences", pd.DataFrame(columns=["user_id", "licence_id", "valid_from", "valid_to"])).copy()
-    if UL.empty:
-        return set()
-    UL["valid_from"] = pd.to_datetime(UL["valid_from"], errors="coerce")
-    UL["valid_to"] = pd.to_datetime(UL["valid_to"], errors="coerce")
-    today = pd.Timestamp.today().normalize()
-    valid = UL[(UL["user_id"].astype("Int64") == uid) & (UL["valid_from"] <= today) & (UL["valid_to"] >= today)]
-    return set(pd.to_numeric(valid["licence_id"], errors="coerce").dropna().astype(int))
-
-def machine_lists_for_user(sheets: dict, uid: int):
-    lids = user_licence_ids(sheets, uid)
-    M = sheets.get("Machines", pd.DataFrame(columns=["machine_id", "machine_name", "licence_id", "max_duration_minutes"])).copy()
-    for c in ["machine_id", "licence_id", "max_duration_minutes"]:
-        if c in M.columns:
-            M[c] = pd.to_numeric(M[c], errors="coerce")
-    allowed = M[M["licence_id"].isin(lids)]
-    blocked = M[~M["licence_id"].isin(lids)]
-    return allowed, blocked
-
-def day_bookings(sheets: dict, machine_id: int, d: date) -> pd.DataFrame:
-    B = sheets.get("Bookings", pd.DataFrame(columns=["booking_id", "user_id", "machine_id", "start", "end", "purpose", "notes", "status"])).copy()
-    if B.empty:
-        return B
-    B["start"] = pd.to_datetime(B["start"], errors="coerce")
-    B["end"] = pd.to_datetime(B["end"], errors="coerce")
-    ds = pd.Timestamp.combine(d, time(0, 0))
-    de = ds + timedelta(days=1)
-    view = B[(pd.to_numeric(B["machine_id"], errors="coerce") == machine_id) & (B["start"] < de) & (B["end"] > ds)].copy()
-    return view.sort_values("start")
-
-def make_human(df: pd.DataFrame, sheets: dict) -> pd.DataFrame:
-    """Merge in human-friendly labels for user/machine/licence where possible."""
-    if df is None or df.empty:
-        return df
-    U = sheets.get("Users", pd.DataFrame())
-    M = sheets.get("Machines", pd.DataFrame())
-    L = sheets.get("Licences", pd.DataFrame())
-    if "user_id" in df.columns and "user_id" in U.columns and "name" in U.columns:
-        df = df.merge(U[["user_id", "name"]], on="user_id", how="left")
-    if "machine_id" in df.columns and {"machine_id", "machine_name"}.issubset(M.columns):
-        df = df.merge(M[["machine_id", "machine_name"]], on="machine_id", how="left")
-    if "licence_id" in df.columns and {"licence_id", "licence_name"}.issubset(L.columns):
-        df = df.merge(L[["licence_id", "licence_name"]], on="licence_id", how="left")
-    return df
+        commit_rows(store, name, rows, key)
+    except TimeoutError as e:
+        st.error(str(e))
+        return False
+    return True
+
+@st.cache_data(max_entries=4)
+def logo_bytes(path: str, mtime_ns: int, width: int = 800) -> bytes:
+    """The logo scaled to the header column once; st.image would re-scale a large file on every run."""
+    from PIL import Image  # ships with streamlit
+
+    with Image.open(path) as im:
+        if im.width <= width:
+            return Path(path).read_bytes()
+        out = io.BytesIO()
+        im.resize((width, round(im.height * width / im.width)), Image.LANCZOS).save(out, format="PNG")
+    return out.getvalue()
+
+@st.cache_resource
+def reminder_worker() -> ReminderWorker:
+    """The server's one reminder worker, started by the first run of any session."""
+    worker = ReminderWorker()
+    worker.start()
+    return worker
+
+@st.cache_resource
+def compactor() -> Compactor:
+    """The server's one journal compactor; page loads only read the journal, this folds it in."""
+    worker = Compactor()
+    worker.start()
+    return worker
+
+GRID_SHEETS = ("Bookings", "Machines", "OperatingHours")  # what workshop_grid reads
+
+@st.cache_data(max_entries=64)
+def shop_grid(_store, window_start: pd.Timestamp, period: str, versions: tuple) -> pd.DataFrame:
+    """workshop_grid, cached per (window start, period, versions of GRID_SHEETS), so every day of a week or month shares one entry."""
+    return workshop_grid(_store, window_start.date(), period)
+
+def style_grid(grid: pd.DataFrame, cap_min: float):
+    """Shade each cell by how much of *cap_min* is booked; blank cells are free."""
+    def shade(v):
+        return f"background-color: rgba(160, 95, 45, {min(v / cap_min, 1) * 0.85:.2f})" if v else ""
+    fmt = (lambda v: f"{v:.0f}" if v else "") if cap_min <= 60 else (lambda v: f"{v / 60:.1f} h" if v else "")
+    return grid.style.map(shade).format(fmt)
+
+def table_filters(store, sheet: str, key: str):
+    """Search, filter, sort and page controls for *sheet*; returns (row positions on this page, filter state)."""
+    idx = table_index(store, sheet)
+    spec = TABLES[sheet]
+    c1, c2, c3 = st.columns([3, 2, 2])
+    query = c1.text_input("Search", key=f"{key}_q", placeholder="Any words, e.g. a name or machine")
+    status = start = end = None
+    if spec.get("status"):
+        status = c2.multiselect(spec["status"].replace("_", " ").capitalize(), idx.options(spec["status"]), key=f"{key}_status")
+    if spec.get("date"):
+        picked = c3.date_input(f"{spec['date'].replace('_', ' ').capitalize()} between", value=(), format=DATE_FMT, key=f"{key}_dates")
+        if len(picked) == 2:
+            start, end = pd.Timestamp(picked[0]), pd.Timestamp(picked[1]) + pd.Timedelta(days=1)
+    c1, c2, c3, c4 = st.columns([2, 1, 1, 2])
+    sorts = [""] + idx.sortable()
+    sort = c1.selectbox("Sort by", sorts, index=sorts.index(spec["sort"] or ""), format_func=lambda c: c or "as stored", key=f"{key}_sort")
+    desc = c2.toggle("Descending", value=spec.get("descending", False), key=f"{key}_desc")
+    size = c3.selectbox("Rows", PAGE_SIZES, key=f"{key}_size")
+    matched = idx.select(query, status, start, end, sort or None, desc)
+    pages = page_of(matched, 1, size)[2]
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages  # the filter shrank the result
+    page = c4.number_input(f"Page (of {pages})", 1, pages, key=f"{key}_page")
+    st.caption(f"{len(matched)} of {idx.size} rows")
+    return page_of(matched, page, size)[0], (query, tuple(status or ()), start, end, sort, desc, size, page)
+
+def paged_table(store, sheet: str, key: str, columns: list):
+    """One page of *sheet* with names filled in; only that page is labelled and sent to the browser."""
+    pos, _ = table_filters(store, sheet, key)
+    rows = make_human(store.table(sheet).iloc[pos], store)
+    cols = [c for c in columns if c in rows.columns]
+    st.dataframe(rows[cols] if cols else rows, use_container_width=True, hide_index=True)
+
+def edit_filtered(store, sheet: str, df: pd.DataFrame, key: str, **editor) -> pd.DataFrame:
+    """data_editor over the filtered page of *df*; returns all of *df* with the edits merged back."""
+    pos, state = table_filters(store, sheet, key)
+    # a new filter or page starts a fresh editor, so pending edits never land on other rows
+    edited = st.data_editor(df.iloc[pos].reset_index(drop=True), key=f"{key}_{abs(hash(state))}", **editor)
+    return merge_edits(df, df.index[pos], edited)
 
 # ---------- Load data ----------
-sheets = load_db()
+store = st.session_state["run_store"] = open_store()  # handed to this run's section
+sheets = store.sheets
+reminder_worker()  # reminders go out from its thread, never during a rerun
+compactor()  # and db.xlsx is rewritten from its thread, never during a page load
 
 # ---------- Header (logo only, centred) ----------
 logo_file = get_setting(sheets, "active_logo", "logo1.png")
@@ -166,7 +211,7 @@ c1, c2, c3 = st.columns([1, 2, 1])
 with c2:
     logo_path = ASSETS / logo_file
     if logo_path.exists():
-        st.image(str(logo_path), use_column_width=True)
+        st.image(logo_bytes(str(logo_path), logo_path.stat().st_mtime_ns), use_column_width=True)
     else:
         st.write("")  # keep spacing
 
@@ -202,18 +247,56 @@ if "me_id" in st.session_state:
 else:
     st.sidebar.warning("Select your name and sign in to continue.")
 
-# ---------- Tabs ----------
-tabs = st.tabs(["Book a Machine", "Calendar", "Mentoring", "Issues & Maintenance", "Admin"])
+# ---------- Sections ----------
+# Each section is a fragment: its own widgets rerun just that section, and only the section
+# picked in the nav bar runs at all. On a full run the section takes the store opened above;
+# a fragment rerun re-opens it (see section_store).
 
 # --- Book a Machine ---
-with tabs[0]:
+@st.fragment
+@perf.timed()
+def book_section():
+    store = section_store()
+    sheets = store.sheets
     if not me:
         st.info("Sign in to book a machine.")
     else:
         st.subheader("Book a Machine")
-        allowed, blocked = machine_lists_for_user(sheets, int(me["user_id"]))
+        allowed, blocked = machine_lists_for_user(store, int(me["user_id"]))
         if allowed.empty:
             st.warning("No machines available for your current licences.")
+        else:
+            with st.expander("Find me a slot"):
+                longest = int(allowed["max_duration_minutes"].fillna(DEFAULT_MAX_MINUTES).max())
+                f1, f2 = st.columns(2)
+                find_dur = f1.slider("Duration (minutes)", 30, longest, min(60, longest), step=30, key="find_dur")
+                find_weeks = f2.slider("Look ahead (weeks)", 1, 8, 4, key="find_weeks")
+                if st.button("Find earliest slots", key="find_go"):
+                    st.session_state["found_slots"] = find_slots(store, int(me["user_id"]), find_dur, find_weeks * 7)
+                found = st.session_state.get("found_slots")
+                if found is not None and found.empty:
+                    st.info("No free slot of that length in the period. Try a shorter duration or look further ahead.")
+                elif found is not None:
+                    pick = st.selectbox(
+                        "Free slots",
+                        range(len(found)),
+                        format_func=lambda i: f"{found['start'].iloc[i]:%a %d/%m %H:%M}–{found['end'].iloc[i]:%H:%M} • {found['machine_name'].iloc[i]}",
+                        key="find_pick",
+                    )
+                    if st.button("Book this slot", type="primary", key="find_book"):
+                        slot = found.iloc[pick]
+                        new = pd.DataFrame(
+                            [[None, int(me["user_id"]), int(slot["machine_id"]), slot["start"], slot["end"], "use", "", "confirmed"]],
+                            columns=["booking_id", "user_id", "machine_id", "start", "end", "purpose", "notes", "status"],
+                        )
+                        try:
+                            commit_booking(store, new)
+                        except (BookingConflict, TimeoutError) as e:
+                            st.error(f"Not booked: {e}")
+                        else:
+                            del st.session_state["found_slots"]
+                            st.success("Booked.")
+                            st.rerun()
         sel_machine = st.selectbox(
             "Machine (only those you’re licensed for appear)",
             [f"{r.machine_id} - {r.machine_name}" for r in allowed.itertuples()],
@@ -226,7 +309,7 @@ with tabs[0]:
             book_start = st.time_input("Start time", value=time(9, 0), key="book_start")
             # Max duration from Machines; default 240 mins
             M = sheets.get("Machines", pd.DataFrame())
-            max_mins = 240
+            max_mins = DEFAULT_MAX_MINUTES
             try:
                 max_mins = int(M.loc[M["machine_id"] == mid, "max_duration_minutes"].iloc[0])
             except Exception:
@@ -237,8 +320,8 @@ with tabs[0]:
             st.caption(f"{start_dt.strftime('%d/%m/%Y %H:%M')} → {end_dt.strftime('%H:%M')}  ({dur} min)")
 
             # Availabilities today for this machine
-            todays = day_bookings(sheets, mid, book_day)
-            show = make_human(todays.copy(), sheets)
+            todays = day_bookings(store, mid, book_day)
+            show = make_human(todays.copy(), store)
             if not show.empty:
                 cols = [c for c in ["start", "end", "name", "purpose", "status"] if c in show.columns]
                 st.write("Already booked:")
@@ -247,12 +330,8 @@ with tabs[0]:
                 st.write("No bookings yet today.")
 
             # Hours + overlap
-            ok_hours, hours_msg = is_open(sheets, book_day, start_dt.time(), end_dt.time())
-            overlap = False
-            for r in todays.itertuples():
-                if not (end_dt <= r.start or start_dt >= r.end):
-                    overlap = True
-                    break
+            ok_hours, hours_msg = is_open(store, book_day, start_dt.time(), end_dt.time(), mid)
+            overlap = store.overlaps(mid, start_dt, end_dt)
             if not ok_hours:
                 st.error(f"Outside operating hours ({hours_msg}).")
             if overlap:
@@ -265,49 +344,66 @@ with tabs[0]:
                     "Bookings",
                     ["booking_id", "user_id", "machine_id", "start", "end", "purpose", "notes", "status"],
                 )
-                next_id = 1 if B.empty else int(pd.to_numeric(B["booking_id"], errors="coerce").fillna(0).max()) + 1
                 new = pd.DataFrame(
-                    [[next_id, int(me["user_id"]), mid, start_dt, end_dt, "use", "", "confirmed"]],
+                    [[None, int(me["user_id"]), mid, start_dt, end_dt, "use", "", "confirmed"]],
                     columns=B.columns,
                 )
-                sheets["Bookings"] = pd.concat([B, new], ignore_index=True)
-                save_db(sheets)
-                st.success("Booked.")
-                st.rerun()
+                try:
+                    commit_booking(store, new)  # id allocation + overlap re-check happen under the lock
+                except (BookingConflict, TimeoutError) as e:
+                    st.error(f"Not booked: {e}")
+                else:
+                    st.success("Booked.")
+                    st.rerun()
 
 # --- Calendar ---
-with tabs[1]:
+@st.fragment
+@perf.timed()
+def calendar_section():
+    store = section_store()
+    sheets = store.sheets
     st.subheader("Calendar")
-    M = sheets.get("Machines", pd.DataFrame())
-    sel_cal_m = st.selectbox(
-        "Machine",
-        [f"{r.machine_id} - {r.machine_name}" for r in M.itertuples()],
-        key="cal_m_sel",
-    )
-    if sel_cal_m:
-        mid = int(sel_cal_m.split(" - ")[0])
-        base_day = st.date_input("Day", value=date.today(), format=DATE_FMT, key="cal_day")
-        view = st.radio("View", ["Day", "Week"], horizontal=True, key="cal_view")
-        if view == "Day":
-            DB = day_bookings(sheets, mid, base_day).copy()
-            DB = make_human(DB, sheets)
-            cols = [c for c in ["start", "end", "name", "purpose", "status"] if c in DB.columns]
-            st.dataframe(DB[cols] if cols else DB, use_container_width=True, hide_index=True)
+    scope = st.radio("Show", ["One machine", "Whole workshop"], horizontal=True, key="cal_scope")
+    if scope == "Whole workshop":
+        g_day = st.date_input("Day", value=date.today(), format=DATE_FMT, key="cal_grid_day")
+        period = st.radio("Period", list(GRID_PERIODS), horizontal=True, key="cal_grid_period")
+        G = shop_grid(store, grid_window(g_day, period)[0], period, tuple(store.sheets.versions.get(n, 0) for n in GRID_SHEETS))
+        if G.empty:
+            st.info("No machines set up yet.")
         else:
-            start_w = base_day - timedelta(days=base_day.weekday())
-            rows = []
-            for d in range(7):
-                dd = start_w + timedelta(days=d)
-                for r in day_bookings(sheets, mid, dd).itertuples():
-                    rows.append([dd.strftime("%d/%m/%Y"), r.start.strftime("%H:%M"), r.end.strftime("%H:%M"), getattr(r, "purpose", ""), r.user_id])
-            W = pd.DataFrame(rows, columns=["day", "start", "end", "purpose", "user_id"])
-            W = make_human(W, sheets)
-            if "name" in W.columns:
-                W = W[["day", "start", "end", "name", "purpose"]]
-            st.dataframe(W, use_container_width=True, hide_index=True)
+            cap = GRID_PERIODS[period] if period == "Day" else 24 * 60
+            if period != "Day":
+                oh = store.table("OperatingHours")
+                if {"_open_time_min", "_close_time_min"} <= set(oh.columns):
+                    longest = (oh["_close_time_min"] - oh["_open_time_min"]).groupby(oh["day_of_week"]).sum().max()
+                    cap = float(longest) if pd.notna(longest) and longest > 0 else cap
+            st.caption("Booked minutes per half hour." if period == "Day" else "Booked hours per day, shaded against the longest opening day.")
+            st.dataframe(style_grid(G, cap), use_container_width=True)
+    else:
+        M = sheets.get("Machines", pd.DataFrame())
+        sel_cal_m = st.selectbox(
+            "Machine",
+            [f"{r.machine_id} - {r.machine_name}" for r in M.itertuples()],
+            key="cal_m_sel",
+        )
+        if sel_cal_m:
+            mid = int(sel_cal_m.split(" - ")[0])
+            base_day = st.date_input("Day", value=date.today(), format=DATE_FMT, key="cal_day")
+            view = st.radio("View", ["Day", "Week"], horizontal=True, key="cal_view")
+            if view == "Day":
+                Dv = day_bookings(store, mid, base_day).copy()
+                Dv = make_human(Dv, store)
+                cols = [c for c in ["start", "end", "name", "purpose", "status"] if c in Dv.columns]
+                st.dataframe(Dv[cols] if cols else Dv, use_container_width=True, hide_index=True)
+            else:
+                st.dataframe(week_bookings(store, mid, base_day), use_container_width=True, hide_index=True)
 
 # --- Mentoring ---
-with tabs[2]:
+@st.fragment
+@perf.timed()
+def mentoring_section():
+    store = section_store()
+    sheets = store.sheets
     st.subheader("Mentoring & Competency Requests")
     if not me:
         st.info("Sign in to request mentoring.")
@@ -317,13 +413,9 @@ with tabs[2]:
         sel_lic = st.selectbox("Skill / Machine licence", list(lic_map.keys()), key="ment_lic")
         msg = st.text_area("What do you need help with?", key="ment_msg")
         # Suggested mentors (members who already hold this licence; admins/superusers shown)
-        UL = ensure_sheet(sheets, "UserLicences", ["user_id", "licence_id", "valid_from", "valid_to"]).copy()
         U = sheets["Users"]
-        today = pd.Timestamp.today().normalize()
-        UL["valid_from"] = pd.to_datetime(UL["valid_from"], errors="coerce")
-        UL["valid_to"] = pd.to_datetime(UL["valid_to"], errors="coerce")
         lic_id = lic_map[sel_lic]
-        holder_ids = UL[(pd.to_numeric(UL["licence_id"], errors="coerce") == lic_id) & (UL["valid_from"] <= today) & (UL["valid_to"] >= today)]["user_id"].astype(int).tolist()
+        holder_ids = entitlements(store).holders(lic_id)
         mentors = U[(U["user_id"].isin(holder_ids)) & (U["role"].isin(["admin", "superuser"]))][["name", "email", "phone"]]
         if mentors.empty:
             st.warning("No listed mentors for this licence yet.")
@@ -337,60 +429,61 @@ with tabs[2]:
                 "AssistanceRequests",
                 ["request_id", "requester_user_id", "licence_id", "message", "created", "status", "handled_by", "handled_on", "outcome", "notes"],
             )
-            req_id = 1 if AR.empty else int(pd.to_numeric(AR["request_id"], errors="coerce").fillna(0).max()) + 1
-            new = pd.DataFrame([[req_id, int(me["user_id"]), int(lic_id), msg, pd.Timestamp.today(), "open", None, None, None, None]], columns=AR.columns)
-            sheets["AssistanceRequests"] = pd.concat([AR, new], ignore_index=True)
-            save_db(sheets)
-            st.success("Request submitted.")
-            st.rerun()
+            new = pd.DataFrame([[None, int(me["user_id"]), int(lic_id), msg, pd.Timestamp.today(), "open", None, None, None, None]], columns=AR.columns)
+            if insert_rows(store, "AssistanceRequests", new, key="request_id"):
+                st.success("Request submitted.")
+                st.rerun()
 
         # My requests
         AR2 = sheets.get("AssistanceRequests", pd.DataFrame())
-        mine = AR2[AR2["requester_user_id"].astype("Int64") == int(me["user_id"])]
+        mine = AR2[AR2["requester_user_id"] == int(me["user_id"])]
         if mine.empty:
             st.info("No requests yet.")
         else:
             st.dataframe(mine.sort_values("created", ascending=False), hide_index=True, use_container_width=True)
 
 # --- Issues & Maintenance ---
-with tabs[3]:
+@st.fragment
+@perf.timed()
+def issues_section():
+    store = section_store()
+    sheets = store.sheets
     st.subheader("Issues & Maintenance")
     M = sheets.get("Machines", pd.DataFrame())
     sel_iss_m = st.selectbox("Machine", [f"{r.machine_id} - {r.machine_name}" for r in M.itertuples()], key="iss_m_sel")
     issue_txt = st.text_area("Describe an issue", key="iss_txt")
     if me and st.button("Submit issue", key="iss_btn"):
         I = ensure_sheet(sheets, "Issues", ["issue_id", "machine_id", "user_id", "created", "status", "notes"])
-        iid = 1 if I.empty else int(pd.to_numeric(I["issue_id"], errors="coerce").fillna(0).max()) + 1
         mid = int(sel_iss_m.split(" - ")[0]) if sel_iss_m else None
-        new = pd.DataFrame([[iid, mid, int(me["user_id"]), pd.Timestamp.today(), "open", issue_txt]], columns=I.columns)
-        sheets["Issues"] = pd.concat([I, new], ignore_index=True)
-        save_db(sheets)
-        st.success("Issue logged.")
-        st.rerun()
+        new = pd.DataFrame([[None, mid, int(me["user_id"]), pd.Timestamp.today(), "open", issue_txt]], columns=I.columns)
+        if insert_rows(store, "Issues", new, key="issue_id"):
+            st.success("Issue logged.")
+            st.rerun()
 
-    Iv = sheets.get("Issues", pd.DataFrame()).copy()
-    Iv = make_human(Iv, sheets)
-    cols = [c for c in ["issue_id", "created", "machine_name", "name", "status", "notes"] if c in Iv.columns]
-    st.dataframe(Iv[cols] if cols else Iv, use_container_width=True, hide_index=True)
+    paged_table(store, "Issues", "iss", ["issue_id", "created", "machine_name", "name", "status", "text", "notes"])
 
 # --- Admin ---
-with tabs[4]:
+@st.fragment
+@perf.timed()
+def admin_section():
+    store = section_store()
+    sheets = store.sheets
     if not me or str(me.get("role", "")).lower() not in ("admin", "superuser"):
         st.info("Admins only.")
     else:
-        at = st.tabs(["Users", "Licences", "User Licences", "Competency", "Machines", "Subscriptions", "Hours & Holidays", "Newsletter", "Settings"])
+        U = sheets["Users"]
+        page = st.radio("Admin page", ADMIN_PAGES, horizontal=True, key="admin_nav", label_visibility="collapsed")
 
-        with at[0]:
+        if page == "Users":
             st.markdown("### Users")
-            cols = [c for c in ["user_id", "name", "role", "email", "phone", "birth_date", "joined_date", "newsletter_opt_in"] if c in U.columns]
-            st.dataframe(U[cols] if cols else U, use_container_width=True, hide_index=True)
+            paged_table(store, "Users", "users", ["user_id", "name", "role", "email", "phone", "birth_date", "joined_date", "newsletter_opt_in"])
 
-        with at[1]:
+        if page == "Licences":
             st.markdown("### Licences")
             L = ensure_sheet(sheets, "Licences", ["licence_id", "licence_name", "notes"])
             st.dataframe(L, use_container_width=True, hide_index=True)
 
-        with at[2]:
+        if page == "User Licences":
             st.markdown("### User Licences")
             U = sheets["Users"]; L = sheets["Licences"]
             UL = ensure_sheet(sheets, "UserLicences", ["user_id", "licence_id", "valid_from", "valid_to"])
@@ -402,36 +495,32 @@ with tabs[4]:
                 uid = int(ulabel.split(" - ")[0])
                 lid = int(llabel.split(" - ")[0])
                 new = pd.DataFrame([[uid, lid, pd.Timestamp(vf), pd.Timestamp(vt)]], columns=UL.columns)
-                sheets["UserLicences"] = pd.concat([UL, new], ignore_index=True)
-                save_db(sheets)
-                st.success("Licence granted.")
-                st.rerun()
-            ULv = make_human(sheets.get("UserLicences", pd.DataFrame()).copy(), sheets)
-            # Reorder: show names first
-            order = [c for c in ["name", "licence_name", "valid_from", "valid_to", "user_id", "licence_id"] if c in ULv.columns]
-            st.dataframe(ULv[order] if order else ULv, use_container_width=True, hide_index=True)
+                if insert_rows(store, "UserLicences", new):
+                    st.success("Licence granted.")
+                    st.rerun()
+            # names first
+            paged_table(store, "UserLicences", "ul_table", ["name", "licence_name", "valid_from", "valid_to", "user_id", "licence_id"])
 
-        with at[3]:
+        if page == "Competency":
             st.markdown("### Competency Assessments")
             AR = ensure_sheet(
                 sheets,
                 "AssistanceRequests",
                 ["request_id", "requester_user_id", "licence_id", "message", "created", "status", "handled_by", "handled_on", "outcome", "notes"],
             ).copy()
-            U = sheets["Users"]; L = sheets["Licences"]
             open_reqs = AR[AR["status"].fillna("open").isin(["open", "in_review"])]
             if open_reqs.empty:
                 st.info("No open requests.")
             else:
-                disp = open_reqs.copy()
-                disp = disp.merge(U[["user_id", "name", "email"]], left_on="requester_user_id", right_on="user_id", how="left")
-                disp = disp.merge(L[["licence_id", "licence_name"]], on="licence_id", how="left")
+                disp = make_human(open_reqs, store)
+                disp["name"] = disp["requester_user_id"].map(labels(store, "Users", "name"))
+                disp["email"] = disp["requester_user_id"].map(labels(store, "Users", "email"))
                 cols = [c for c in ["request_id", "name", "email", "licence_name", "message", "status", "created"] if c in disp.columns]
                 st.dataframe(disp[cols] if cols else disp, use_container_width=True, hide_index=True)
 
                 sel_req = st.selectbox("Select request id", open_reqs["request_id"].tolist(), key="comp_sel")
                 req = open_reqs[open_reqs["request_id"] == sel_req].iloc[0]
-                st.write(f"**Member:** {U.loc[U['user_id']==req.requester_user_id,'name'].iloc[0]}  •  **Licence:** {L.loc[L['licence_id']==req.licence_id,'licence_name'].iloc[0]}")
+                st.write(f"**Member:** {label_of(store, 'Users', 'name', req.requester_user_id)}  •  **Licence:** {label_of(store, 'Licences', 'licence_name', req.licence_id)}")
                 notes = st.text_area("Assessment notes", key="comp_notes")
                 outcome = st.radio("Outcome", ["pass", "more_training", "fail"], horizontal=True, key="comp_outcome")
                 grant = st.checkbox("Issue licence on pass", value=True, key="comp_grant")
@@ -445,62 +534,122 @@ with tabs[4]:
                         notes,
                     ]
                     sheets["AssistanceRequests"] = AR
+                    granted = {}
                     if outcome == "pass" and grant:
                         UL = ensure_sheet(sheets, "UserLicences", ["user_id", "licence_id", "valid_from", "valid_to"])
                         new = pd.DataFrame([[int(req.requester_user_id), int(req.licence_id), pd.Timestamp.today().normalize(), pd.Timestamp(valid_to)]], columns=UL.columns)
                         sheets["UserLicences"] = pd.concat([UL, new], ignore_index=True)
-                    save_db(sheets)
-                    st.success("Saved.")
-                    st.rerun()
+                        granted["UserLicences"] = new  # entitlement index takes the new row in place
+                    if save_db(sheets, appended=granted):
+                        st.success("Saved.")
+                        st.rerun()
 
-        with at[4]:
+        if page == "Machines":
             st.markdown("### Machines (inline editor)")
             M = ensure_sheet(sheets, "Machines", ["machine_id", "machine_name", "licence_id", "serial", "next_service", "max_duration_minutes"])
-            edited = st.data_editor(M, num_rows="dynamic", use_container_width=True, key="mach_edit")
+            edited = edit_filtered(store, "Machines", M, "mach", num_rows="dynamic", use_container_width=True)
             if st.button("Save machines", key="mach_save"):
                 sheets["Machines"] = edited
-                save_db(sheets)
-                st.success("Machines saved.")
-                st.rerun()
+                if save_db(sheets):
+                    st.success("Machines saved.")
+                    st.rerun()
 
-        with at[5]:
+        if page == "Bulk Bookings":
+            st.markdown("### Bulk Bookings")
+            st.caption("Book a recurring class or a CSV of sessions in one go. Rows that clash are listed and left out.")
+            Mb = store.table("Machines", ["machine_id", "machine_name"])
+            Ub = store.table("Users", ["user_id", "name"])
+            how = st.radio("Source", ["Recurring series", "CSV upload"], horizontal=True, key="bulk_src")
+            if how == "Recurring series":
+                c1, c2 = st.columns(2)
+                b_m = c1.selectbox("Machine", [f"{r.machine_id} - {r.machine_name}" for r in Mb.itertuples()], key="bulk_m")
+                b_u = c2.selectbox("Booked for", [f"{r.user_id} - {r.name}" for r in Ub.itertuples()], key="bulk_u")
+                b_days = st.multiselect("Weekdays", range(7), default=[1], format_func=lambda d: calendar.day_name[d], key="bulk_days")
+                c1, c2, c3 = st.columns(3)
+                b_from = c1.date_input("From", value=date.today(), format=DATE_FMT, key="bulk_from")
+                b_to = c2.date_input("To", value=date.today() + timedelta(weeks=10), format=DATE_FMT, key="bulk_to")
+                b_every = c3.number_input("Every N weeks", 1, 8, 1, key="bulk_every")
+                c1, c2, c3 = st.columns(3)
+                b_at = c1.time_input("Start time", value=time(9, 0), key="bulk_at")
+                b_dur = c2.number_input("Duration (minutes)", 30, 12 * 60, 120, step=30, key="bulk_dur")
+                b_purpose = c3.text_input("Purpose", value="class", key="bulk_purpose")
+                if st.button("Check series", key="bulk_series") and b_m and b_u:
+                    starts = weekly_starts(b_from, b_to, b_days, b_at, b_every)
+                    st.session_state["bulk_rows"] = booking_rows(
+                        int(b_u.split(" - ")[0]), int(b_m.split(" - ")[0]), starts, int(b_dur), b_purpose or "use"
+                    )
+                    st.session_state["bulk_problems"] = []
+            else:
+                up = st.file_uploader(
+                    "Bookings CSV (machine_id, user_id, date, start, end or duration_minutes, purpose, notes)",
+                    type=["csv"],
+                    key="bulk_csv",
+                )
+                if st.button("Check file", key="bulk_file", disabled=up is None):
+                    st.session_state["bulk_rows"], st.session_state["bulk_problems"] = parse_booking_csv(up, store)
+            for msg in st.session_state.get("bulk_problems", [])[:20]:
+                st.warning(msg)
+            batch = st.session_state.get("bulk_rows")
+            if batch is not None:
+                if batch.empty:
+                    st.info("Nothing to book.")
+                else:
+                    clash = batch_conflicts(store, batch)
+                    accepted = batch.drop(index=clash["row"])
+                    st.write(f"{len(accepted)} of {len(batch)} sessions can be booked.")
+                    if not clash.empty:
+                        st.error(f"{len(clash)} sessions clash and will be skipped:")
+                        show = make_human(clash, store)
+                        st.dataframe(show[["date", "start", "end", "machine_name", "reason"]], use_container_width=True, hide_index=True)
+                    if st.button(f"Book {len(accepted)} sessions", type="primary", key="bulk_commit", disabled=accepted.empty):
+                        try:
+                            ids = commit_booking(store, accepted)  # one write, contiguous ids
+                        except (BookingConflict, TimeoutError) as e:
+                            st.error(f"Nothing booked: {e} Check again to see the latest clashes.")
+                        else:
+                            del st.session_state["bulk_rows"]
+                            st.success(f"Booked {len(ids)} sessions (ids {ids[0]}–{ids[-1]}).")
+
+        if page == "Subscriptions":
             st.markdown("### Subscriptions")
-            Sv = ensure_sheet(sheets, "Subscriptions", ["user_id", "type", "start_date", "end_date", "amount", "paid", "discount_percent", "discount_reason"])
-            Svv = Sv.copy()
-            Svv = make_human(Svv, sheets)
-            order = [c for c in ["name", "type", "start_date", "end_date", "amount", "paid", "discount_percent", "discount_reason", "user_id"] if c in Svv.columns]
-            st.dataframe(Svv[order] if order else Svv, use_container_width=True, hide_index=True)
+            ensure_sheet(sheets, "Subscriptions", ["user_id", "type", "start_date", "end_date", "amount", "paid", "discount_percent", "discount_reason"])
+            paged_table(store, "Subscriptions", "subs", ["name", "type", "start_date", "end_date", "amount", "paid", "discount_percent", "discount_reason", "user_id"])
 
-        with at[6]:
+        if page == "Hours & Holidays":
             st.markdown("### Weekly operating hours & holidays")
-            OH = ensure_sheet(sheets, "OperatingHours", ["day_of_week", "open_time", "close_time"])
-            CD = ensure_sheet(sheets, "ClosedDates", ["date", "reason"])
+            OH = ensure_sheet(sheets, "OperatingHours", ["day_of_week", "open_time", "close_time", "machine_id"])
+            CD = ensure_sheet(sheets, "ClosedDates", ["date", "reason", "start_time", "end_time", "machine_id"])
+            st.caption(
+                "Add a row per session for days with more than one (e.g. morning and evening). Rows with a "
+                "machine_id set that machine's own hours. A closed date with start and end times closes only "
+                "that part of the day; with a machine_id it closes only that machine."
+            )
             col1, col2 = st.columns(2)
             with col1:
                 st.markdown("**Operating hours (0=Mon … 6=Sun)**")
-                oh_edited = st.data_editor(OH, use_container_width=True, key="oh_edit")
+                oh_edited = st.data_editor(OH, column_order=list(persisted(OH).columns), use_container_width=True, key="oh_edit")
                 if st.button("Save hours", key="oh_save"):
                     sheets["OperatingHours"] = oh_edited
-                    save_db(sheets)
-                    st.success("Operating hours saved.")
-                    st.rerun()
+                    if save_db(sheets):
+                        st.success("Operating hours saved.")
+                        st.rerun()
                 if st.button("Set all weekdays open 09:00–17:00", key="oh_weekdays"):
                     sheets["OperatingHours"] = pd.DataFrame(
                         [{"day_of_week": d, "open_time": "09:00", "close_time": "17:00"} for d in range(5)]
                     )
-                    save_db(sheets)
-                    st.success("Set Mon–Fri 09:00–17:00.")
-                    st.rerun()
+                    if save_db(sheets):
+                        st.success("Set Mon–Fri 09:00–17:00.")
+                        st.rerun()
             with col2:
                 st.markdown("**Closed dates**")
-                cd_edited = st.data_editor(CD, use_container_width=True, key="cd_edit")
+                cd_edited = edit_filtered(store, "ClosedDates", CD, "cd", use_container_width=True)
                 if st.button("Save closed dates", key="cd_save"):
                     sheets["ClosedDates"] = cd_edited
-                    save_db(sheets)
-                    st.success("Closed dates saved.")
-                    st.rerun()
+                    if save_db(sheets):
+                        st.success("Closed dates saved.")
+                        st.rerun()
 
-        with at[7]:
+        if page == "Newsletter":
             st.markdown("### Newsletter")
             T = ensure_sheet(sheets, "Templates", ["key", "text"])
             row = T[T["key"] == "newsletter_prompt"]
@@ -512,16 +661,182 @@ with tabs[4]:
                 else:
                     T.loc[T["key"] == "newsletter_prompt", "text"] = txt
                 sheets["Templates"] = T
-                save_db(sheets)
-                st.success("Prompt saved.")
-                st.rerun()
+                if save_db(sheets):
+                    st.success("Prompt saved.")
+                    st.rerun()
 
-        with at[8]:
+        if page == "Settings":
             st.markdown("### Settings")
             S = ensure_sheet(sheets, "Settings", ["key", "value"])
-            S_edit = st.data_editor(S, use_container_width=True, key="settings_edit")
+            S_edit = edit_filtered(store, "Settings", S, "settings", use_container_width=True)
+            if store.kind == "excel":
+                pending, _ = read_journal()
+                if st.button(f"Compact journal into db.xlsx ({len(pending)} pending)", key="journal_compact", disabled=not pending):
+                    try:
+                        done = compact()
+                    except TimeoutError as e:
+                        st.error(str(e))
+                    else:
+                        if done:
+                            st.success("Journal compacted.")
+                            st.rerun()
+                        st.warning("db.xlsx was rewritten meanwhile; nothing compacted. Try again.")
+                month_start = pd.Timestamp.today().normalize().replace(day=1)
+                done = int(archive.finished(store.table("Bookings"), month_start).sum())
+                st.caption(
+                    f"{len(archive.months_between())} months of bookings archived in data/archive; "
+                    f"{done} bookings in db.xlsx finished before {month_start:%B}."
+                )
+                if st.button("Archive finished months", key="archive_rollup", disabled=not done):
+                    try:
+                        moved = archive.roll_up()
+                    except TimeoutError as e:
+                        st.error(str(e))
+                    else:
+                        st.success(f"Archived {sum(moved.values())} bookings from {len(moved)} months.")
+                        st.rerun()
+                if st.button("Export to SQLite (data/db.sqlite)", key="export_sqlite"):
+                    export_to_sqlite(read_sheets())
+                    st.success("Exported. Start the app with SCHEDULER_STORAGE=sqlite to use it.")
+            elif st.button("Export to Excel (data/db.xlsx)", key="export_excel"):
+                export_to_excel()
+                st.success("Exported.")
+            stats = load_stats()
+            if stats:
+                timings = [f"{k.split('_')[0]} {stats[k]:.0f} ms" for k in ("cold_ms", "warm_ms") if k in stats]
+                st.caption(f"Database load ({stats['last']}): " + " • ".join(timings))
+            if stats.get("raw_bytes"):
+                st.caption(f"In-memory size: {stats['typed_bytes'] / 1024:.0f} KiB typed vs {stats['raw_bytes'] / 1024:.0f} KiB as read")
             if st.button("Save settings", key="settings_save"):
                 sheets["Settings"] = S_edit
-                save_db(sheets)
-                st.success("Settings saved.")
-                st.rerun()
\ No newline at end of file
+                if save_db(sheets):
+                    st.success("Settings saved.")
+                    st.rerun()
+
+        if page == "Reminders":
+            st.markdown("### Reminders")
+            worker = reminder_worker()
+            enabled = reminders.setting(store, "reminders_enabled").strip().lower() in ("true", "yes", "1")
+            last = worker.runs[-1] if worker.runs else {}
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Sender", reminders.setting(store, "reminder_sender"))
+            c2.metric("Next run", worker.next_run.strftime("%H:%M") if enabled else "Off")
+            c3.metric("Last run", f"{last['ms']:.0f} ms" if "ms" in last else ("Failed" if last else "–"))
+            st.caption(
+                "A background worker checks licence expiries, membership renewals, machine services and the monthly "
+                "newsletter every reminder_interval_minutes, and sends each member one message and the admins one digest. "
+                "Each reminder is sent once; failed sends are retried on the next run. Settings: reminders_enabled, "
+                "reminder_sender (outbox writes .eml files to data/outbox, smtp uses smtp_host/smtp_port/smtp_from), "
+                "reminder_licence_days, reminder_renewal_days, reminder_service_days and reminder_admin_email. "
+                "Templates reminder_member and reminder_digest may use {name}, {items} and {org}."
+            )
+            if st.button("Run now", key="rem_run"):
+                worker.run_now()
+                st.info("Running in the background; reload this page to see the result.")
+            if worker.runs:
+                st.markdown("**Recent runs**")
+                st.dataframe(pd.DataFrame(list(worker.runs)[::-1]), use_container_width=True, hide_index=True)
+            with st.expander("Due now"):
+                due = reminders.due_items(store)
+                due = due[~due["key"].isin(reminders.settled_keys(store))]
+                st.dataframe(make_human(due, store) if not due.empty else due, use_container_width=True, hide_index=True)
+            st.markdown("**Sent and failed**")
+            if store.table("Reminders").empty:
+                st.write("Nothing sent yet.")
+            else:
+                paged_table(store, "Reminders", "rem", ["reminder_id", "at", "kind", "key", "name", "to", "result", "detail"])
+
+        if page == "Utilisation":
+            st.markdown("### Machine utilisation")
+            c1, c2, c3 = st.columns(3)
+            this_month = date.today().replace(day=1)
+            u_from = c1.date_input("From month", value=(pd.Timestamp(this_month) - pd.DateOffset(months=11)).date(), format=DATE_FMT, key="use_from")
+            u_to = c2.date_input("To month", value=date.today(), format=DATE_FMT, key="use_to")
+            by = c3.selectbox("Break down by", BREAKDOWNS, format_func=lambda b: "Top members" if b == "user" else b.title(), key="use_by")
+            M = store.table("Machines", ["machine_id", "machine_name"]).dropna(subset=["machine_id"])
+            picked = st.multiselect(
+                "Machines (all if none picked)",
+                M["machine_id"].astype(int).tolist(),
+                format_func=lambda m: f"{m} - {label_of(store, 'Machines', 'machine_name', m)}",
+                key="use_machines",
+            )
+            R = utilisation_report(store, by, u_from, u_to, picked or None)
+            if by != "user":
+                booked, opened = R["booked_hours"].sum(), R["open_hours"].sum()
+                c1, c2, c3 = st.columns(3)
+                c1.metric("Booked hours", f"{booked:,.0f}")
+                c2.metric("Open machine-hours", f"{opened:,.0f}")
+                c3.metric("Utilisation", f"{booked / opened:.1%}" if opened else "–")
+            st.caption(
+                "Booked hours against the hours each machine could be booked (its own hours where it has them), "
+                "for the months from the first date to the second. Cancelled bookings aren't counted, and past months "
+                "are measured against today's opening hours."
+            )
+            if by in ("month", "weekday", "hour"):
+                st.bar_chart(R.set_index(by)["utilisation_pct"])
+            st.dataframe(R, use_container_width=True, hide_index=True)
+            st.download_button(
+                "Download CSV",
+                R.to_csv(index=False).encode("utf-8"),
+                file_name=f"utilisation-{by}-{u_from:%Y-%m}-{u_to:%Y-%m}.csv",
+                mime="text/csv",
+                key="use_csv",
+            )
+
+        if page == "Performance":
+            st.markdown("### Performance")
+            recs = perf.records()
+            S = perf.summary(recs).set_index("name")
+
+            def stat(name, col, fmt):
+                return fmt.format(S.at[name, col]) if name in S.index and pd.notna(S.at[name, col]) else "–"
+
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("Full reruns", stat("rerun", "calls", "{:.0f}"))
+            c2.metric("Rerun p50", stat("rerun", "p50_ms", "{:.0f} ms"))
+            c3.metric("Rerun p95", stat("rerun", "p95_ms", "{:.0f} ms"))
+            c4.metric("Snapshot cache hits", stat("load_db", "hit_rate", "{:.0%}"))
+            st.caption(
+                f"The last {len(recs)} timed calls (up to {perf.PERF_RING}) from every session on this server. "
+                "Sections are timed on their own as well as within a full rerun; rerun time not spent in the calls "
+                "below is mostly Streamlit building and sending the page. Rows are rows scanned or returned per call."
+            )
+            st.dataframe(S.reset_index(), use_container_width=True, hide_index=True)
+            log = perf.log_path() or str(DATA / "perf.jsonl")
+            logging = st.toggle(f"Append timings to {log}", value=perf.log_path() is not None, key="perf_log")
+            if logging != (perf.log_path() is not None):
+                perf.log_to(log if logging else None)
+            c1, c2 = st.columns(2)
+            if c1.button("Clear timings", key="perf_clear"):
+                perf.clear()
+                st.rerun()
+            if c2.button("Profile the next full rerun", key="perf_profile_btn"):
+                st.session_state["perf_profile"] = True
+                st.rerun()
+            report = st.session_state.get("perf_profile_report")
+            if report:
+                st.markdown(f"**Profile of the rerun at {report['at']}**: top functions by cumulative time")
+                st.code(report["text"], language=None)
+                st.download_button("Download .prof (pstats / snakeviz)", report["prof"], file_name="rerun.prof", key="perf_prof_dl")
+            with st.expander("Recent calls"):
+                R = pd.DataFrame(recs[-200:][::-1])
+                if not R.empty:
+                    R["at"] = pd.to_datetime(R["at"], unit="s")
+                st.dataframe(R, use_container_width=True, hide_index=True)
+
+ADMIN_PAGES = ["Users", "Licences", "User Licences", "Competency", "Machines", "Bulk Bookings", "Subscriptions", "Hours & Holidays", "Newsletter", "Settings", "Reminders", "Utilisation", "Performance"]
+SECTIONS = {
+    "Book a Machine": book_section,
+    "Calendar": calendar_section,
+    "Mentoring": mentoring_section,
+    "Issues & Maintenance": issues_section,
+    "Admin": admin_section,
+}
+section = st.radio("Section", list(SECTIONS), horizontal=True, key="nav", label_visibility="collapsed")
+SECTIONS[section]()
+perf.record("rerun", (perf_counter() - _run_t0) * 1000, section=section)
+perf.flush()
+if _profiler is not None:
+    del st.session_state["perf_profiler"]
+    st.session_state["perf_profile_report"] = perf.profile_report(_profiler)
+    st.rerun()  # show the report on the Performance page
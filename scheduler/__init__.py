@@ -0,0 +1,26 @@
+"""Scheduler core: storage, commits and booking rules, with no Streamlit dependency.
+
+app.py is the Streamlit front end over this package; ``python -m scheduler`` is the batch CLI.
+"""
+from .batch import batch_conflicts, booking_rows, parse_booking_csv, weekly_starts
+from .commit import BookingConflict, Compactor, PUBLISH_HOOKS, StaleDataError, commit_booking, commit_rows, commit_save, compact
+from .db import DATA, DB, load_stats, read_journal, read_meta, read_sheets, revision, write_db
+from .grid import GRID_PERIODS, grid_window, occupancy_grid, workshop_grid
+from .hours import OpeningCalendar, free_intervals, is_open, opening_calendar
+from .indexes import booking_index, entitlements, label_of, labels
+from .reminders import SENDERS, OutboxSender, ReminderWorker, SmtpSender, due_items, run_reminders
+from .rules import (
+    day_bookings,
+    ensure_sheet,
+    get_setting,
+    machine_lists_for_user,
+    make_human,
+    parse_hhmm_or_ampm,
+    user_licence_ids,
+    week_bookings,
+)
+from .schema import SCHEMAS, apply_schema, persisted
+from .slots import DEFAULT_MAX_MINUTES, find_slots, open_intervals
+from .storage import ExcelStorage, SQLiteStorage, export_to_excel, export_to_sqlite, open_store
+from .tables import PAGE_SIZES, TABLES, merge_edits, page_of, table_index
+from .usage import BREAKDOWNS, Utilisation, utilisation, utilisation_report
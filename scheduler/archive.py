@@ -0,0 +1,141 @@
+"""Past bookings partitioned by month under data/archive, read only when a query reaches back that far.
+
+db.xlsx keeps the bookings that have not finished before the current month; roll_up moves
+finished months out into one CSV per month. Readers merge archive and workbook by booking_id,
+so a crash between writing a partition and rewriting db.xlsx only leaves a harmless duplicate.
+"""
+import json
+import os
+
+import pandas as pd
+
+from .db import DATA, commit_lock, read_meta, read_sheets, write_db
+from .indexes import BookingIndex
+from .perf import span
+from .schema import apply_schema, persisted
+
+ARCHIVE_DIR = DATA / "archive"
+MANIFEST = ARCHIVE_DIR / "manifest.json"  # archived months, rows per month, highest booking_id
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_PARTS = {}  # month → (file signature, bookings, BookingIndex), shared across sessions
+_MANIFEST = {}
+
+def _sig(path) -> tuple:
+    info = path.stat()
+    return info.st_mtime_ns, info.st_size
+
+def month_key(ts) -> str:
+    return pd.Timestamp(ts).strftime("%Y-%m")
+
+def manifest() -> dict:
+    try:
+        sig = _sig(MANIFEST)
+    except FileNotFoundError:
+        return {"months": {}, "max_id": 0}
+    if _MANIFEST.get("sig") != sig:
+        _MANIFEST.update(sig=sig, data=json.loads(MANIFEST.read_text(encoding="utf-8")))
+    return _MANIFEST["data"]
+
+def months_between(start=None, end=None) -> list:
+    """Archived months that may hold bookings overlapping [start, end); every month if unbounded."""
+    months = sorted(manifest()["months"])
+    if start is not None:
+        lo = month_key(pd.Timestamp(start) - pd.Timedelta(days=1))  # a booking can run past midnight
+        months = [m for m in months if m >= lo]
+    if end is not None:
+        months = [m for m in months if m <= month_key(end)]
+    return months
+
+def load_month(month: str):
+    """(bookings, BookingIndex) for one archived month, parsed once per file version."""
+    path = ARCHIVE_DIR / manifest()["months"][month]["file"]
+    sig = _sig(path)
+    with span("archive_month", month=month) as rec:
+        cached = _PARTS.get(month)
+        rec["hit"] = cached is not None and cached[0] == sig
+        if not rec["hit"]:
+            df = apply_schema("Bookings", pd.read_csv(path))
+            cached = _PARTS[month] = (sig, df, BookingIndex(df))
+            rec["rows"] = len(df)
+    return cached[1], cached[2]
+
+def _empty() -> pd.DataFrame:
+    return apply_schema("Bookings", pd.DataFrame(columns=["booking_id", "user_id", "machine_id", "start", "end", "purpose", "notes", "status"]))
+
+def between(machine_id: int, start, end) -> pd.DataFrame:
+    """Archived bookings on *machine_id* overlapping [start, end)."""
+    parts = []
+    for m in months_between(start, end):
+        df, idx = load_month(m)
+        parts.append(df.iloc[idx.query(machine_id, start, end)])
+    return pd.concat(parts, ignore_index=True) if parts else _empty()
+
+def in_range(start=None, end=None) -> pd.DataFrame:
+    """Archived bookings overlapping [start, end), all machines; the whole archive if unbounded."""
+    parts = []
+    for m in months_between(start, end):
+        df, _ = load_month(m)
+        keep = pd.Series(True, index=df.index)
+        if start is not None:
+            keep &= df["end"] > pd.Timestamp(start)
+        if end is not None:
+            keep &= df["start"] < pd.Timestamp(end)
+        parts.append(df[keep])
+    return pd.concat(parts, ignore_index=True) if parts else _empty()
+
+def overlaps(machine_id: int, start, end) -> bool:
+    return any(load_month(m)[1].overlaps(machine_id, start, end) for m in months_between(start, end))
+
+def merge(old: pd.DataFrame, hot: pd.DataFrame) -> pd.DataFrame:
+    """Archived rows plus workbook rows, the workbook's copy winning for a booking_id in both."""
+    if old.empty:
+        return hot
+    if hot.empty:
+        return old
+    old = old[~old["booking_id"].isin(hot["booking_id"])]
+    return pd.concat([old, hot], ignore_index=True).sort_values("start", kind="stable")
+
+def _replace(path, write):
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+def finished(B: pd.DataFrame, cutoff: pd.Timestamp) -> pd.Series:
+    """Rows of *B* that started and ended before *cutoff*."""
+    if B.empty or not {"start", "end"} <= set(B.columns):
+        return pd.Series(False, index=B.index)
+    return (B["start"] < cutoff) & (B["end"] <= cutoff)
+
+def roll_up(before=None) -> dict:
+    """Move bookings finished before the month of *before* (default: this month) from db.xlsx into
+    their month files; returns month → rows moved."""
+    from .commit import _publish  # commit imports the storage layer, which imports this module
+
+    cutoff = pd.Timestamp(before or pd.Timestamp.today()).normalize().replace(day=1)
+    with commit_lock():
+        meta = read_meta()
+        sheets = read_sheets()
+        B = sheets.get("Bookings", pd.DataFrame())
+        done = finished(B, cutoff)
+        if not done.any():
+            return {}
+        old = B[done]
+        man = json.loads(json.dumps(manifest()))
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        moved = {}
+        for month, part in old.groupby(old["start"].dt.strftime("%Y-%m")):
+            moved[month] = len(part)
+            if month in man["months"]:
+                part = merge(load_month(month)[0], part)
+            fname = f"bookings-{month}.csv"
+            rows = persisted(part.sort_values("start", kind="stable"))
+            _replace(ARCHIVE_DIR / fname, lambda tmp: rows.to_csv(tmp, index=False, date_format=TS_FORMAT))
+            man["months"][month] = {"file": fname, "rows": len(rows)}
+        ids = pd.to_numeric(old["booking_id"], errors="coerce")
+        man["max_id"] = max(int(man.get("max_id", 0)), int(ids.max()) if ids.notna().any() else 0)
+        _replace(MANIFEST, lambda tmp: tmp.write_text(json.dumps(man, indent=1, sort_keys=True), encoding="utf-8"))
+        sheets["Bookings"] = B[~done].reset_index(drop=True)
+        write_db(sheets)
+        _publish(meta, ["Bookings"])  # row positions moved: the booking index rebuilds
+    return moved
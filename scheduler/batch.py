@@ -0,0 +1,139 @@
+"""Recurring and bulk bookings, validated as one batch."""
+from datetime import date, time
+
+import numpy as np
+import pandas as pd
+
+from .perf import timed
+from .rules import parse_hhmm_or_ampm
+from .hours import opening_calendar
+
+BOOKING_COLUMNS = ["booking_id", "user_id", "machine_id", "start", "end", "purpose", "notes", "status"]
+CONFLICT_COLUMNS = ["row", "date", "machine_id", "start", "end", "reason"]
+
+def booking_rows(user_id, machine_id, starts, duration_min: int, purpose: str = "use", notes: str = "") -> pd.DataFrame:
+    """New confirmed booking rows (ids assigned at commit) for each start time."""
+    starts = pd.DatetimeIndex(starts)
+    return pd.DataFrame({
+        "booking_id": None,
+        "user_id": user_id,
+        "machine_id": machine_id,
+        "start": starts,
+        "end": starts + pd.Timedelta(minutes=duration_min),
+        "purpose": purpose,
+        "notes": notes,
+        "status": "confirmed",
+    }, columns=BOOKING_COLUMNS)
+
+def weekly_starts(first_day: date, last_day: date, weekdays, at: time, every: int = 1) -> pd.DatetimeIndex:
+    """Start times on *weekdays* (Mon=0) from *first_day* to *last_day* inclusive, every *every* weeks."""
+    days = pd.date_range(pd.Timestamp(first_day).normalize(), pd.Timestamp(last_day).normalize(), freq="D")
+    week = (days - days[0]).days // 7 if len(days) else np.empty(0, np.int64)
+    days = days[days.dayofweek.isin(list(weekdays)) & (np.asarray(week) % max(int(every), 1) == 0)]
+    return days + pd.Timedelta(hours=at.hour, minutes=at.minute)
+
+def parse_booking_csv(data, store):
+    """Booking rows from an uploaded CSV, plus a list of problems found while reading it.
+
+    Columns: machine_id, user_id, date (DD/MM/YYYY), start (e.g. 9:30 or 2pm) and either end or
+    duration_minutes; purpose and notes are optional.
+    """
+    raw = pd.read_csv(data, dtype=str, keep_default_na=False)
+    raw.columns = [str(c).strip().lower() for c in raw.columns]
+    missing = [c for c in ["machine_id", "user_id", "date", "start"] if c not in raw.columns]
+    if "end" not in raw.columns and "duration_minutes" not in raw.columns:
+        missing.append("end or duration_minutes")
+    if missing:
+        return pd.DataFrame(columns=BOOKING_COLUMNS), [f"Missing column(s): {', '.join(missing)}"]
+    day = pd.to_datetime(raw["date"].str.strip(), dayfirst=True, errors="coerce")
+
+    def at(col):
+        hm = raw[col].map(parse_hhmm_or_ampm)
+        return day + pd.to_timedelta(hm.map(lambda x: x[0] * 60 + x[1] if x else np.nan), unit="min")
+
+    start = at("start")
+    if "end" in raw.columns and raw["end"].str.strip().ne("").any():
+        end = at("end")
+    else:
+        end = start + pd.to_timedelta(pd.to_numeric(raw["duration_minutes"], errors="coerce"), unit="min")
+    rows = pd.DataFrame({
+        "booking_id": None,
+        "user_id": pd.to_numeric(raw["user_id"], errors="coerce"),
+        "machine_id": pd.to_numeric(raw["machine_id"], errors="coerce"),
+        "start": start,
+        "end": end,
+        "purpose": raw.get("purpose", pd.Series("use", index=raw.index)).replace("", "use"),
+        "notes": raw.get("notes", pd.Series("", index=raw.index)),
+        "status": "confirmed",
+    }, columns=BOOKING_COLUMNS)
+    known_m = store.table("Machines", ["machine_id"]).get("machine_id", pd.Series(dtype=float))
+    known_u = store.table("Users", ["user_id"]).get("user_id", pd.Series(dtype=float))
+    bad = {
+        "unreadable date or time": rows["start"].isna() | rows["end"].isna(),
+        "unknown machine_id": ~rows["machine_id"].isin(known_m.dropna()),
+        "unknown user_id": ~rows["user_id"].isin(known_u.dropna()),
+    }
+    problems = [f"Line {i + 2}: {why}" for i, why in sorted((i, why) for why, mask in bad.items() for i in np.flatnonzero(mask.to_numpy()))]
+    ok = ~np.logical_or.reduce([m.to_numpy() for m in bad.values()])
+    rows = rows[ok].reset_index(drop=True)
+    rows["user_id"] = rows["user_id"].astype(int)
+    rows["machine_id"] = rows["machine_id"].astype(int)
+    return rows, problems
+
+@timed(rows=len)
+def batch_conflicts(store, rows: pd.DataFrame, hours: bool = True) -> pd.DataFrame:
+    """Every row of a booking batch that can't be accepted, with the first reason found.
+
+    Hours and closed dates are checked for the whole batch at once; overlaps use each machine's
+    committed intervals from the booking index (an O(log n) lookup, not a scan of Bookings), then
+    sorted arrays per machine, which also catches rows in the batch that overlap each other.
+    """
+    if rows.empty:
+        return pd.DataFrame(columns=CONFLICT_COLUMNS)
+    mid = rows["machine_id"].to_numpy(dtype=np.int64)
+    starts, ends = pd.DatetimeIndex(rows["start"]), pd.DatetimeIndex(rows["end"])
+    s, e = starts.values.view(np.int64), ends.values.view(np.int64)
+    reason = np.full(len(rows), "", dtype=object)
+
+    def flag(mask, why):
+        reason[mask & (reason == "")] = why
+
+    flag(e <= s, "Ends before it starts")
+    if hours:
+        # one compiled calendar; rows are checked in groups by the schedule their machine follows
+        cal = opening_calendar(store, starts.min().normalize(), ends.max())
+        keys = np.array([-1 if cal.key(m) is None else cal.key(m) for m in mid])
+        day = starts.normalize().values.view(np.int64)
+        closed, shut, inside = np.zeros(len(rows), bool), np.zeros(len(rows), bool), np.zeros(len(rows), bool)
+        for key in np.unique(keys):
+            at, k = keys == key, None if key < 0 else int(key)
+            closed[at] = cal.closed(k, s[at], e[at])
+            shut[at] = ~cal.open_on(k, day[at])
+            inside[at] = cal.contains(k, s[at], e[at])
+        flag(closed, "Workshop closed (holiday/maintenance)")
+        flag(shut, "Workshop closed that day")
+        flag(~inside, "Outside operating hours")
+    taken, twin = np.zeros(len(rows), bool), np.zeros(len(rows), bool)
+    busy = store.busy_by_machine(np.unique(mid), pd.Timestamp(s.min()), pd.Timestamp(e.max()))
+    for m in np.unique(mid):
+        here = np.flatnonzero(mid == m)
+        b_s, b_e = busy[int(m)]
+        if len(b_s):
+            order = np.argsort(b_s, kind="stable")
+            bs, run_max = b_s[order], np.maximum.accumulate(b_e[order])
+            k = np.searchsorted(bs, e[here], "left")
+            taken[here] = (k > 0) & (run_max[np.maximum(k - 1, 0)] > s[here])
+        here = here[np.argsort(s[here], kind="stable")]
+        prev_end = np.maximum.accumulate(e[here])[:-1]
+        twin[here[1:]] = prev_end > s[here[1:]]  # overlaps an earlier row of the batch
+    flag(taken, "Overlaps an existing booking")
+    flag(twin, "Overlaps another booking in this batch")
+    hit = np.flatnonzero(reason != "")
+    return pd.DataFrame({
+        "row": hit,
+        "date": starts[hit].strftime("%a %d/%m/%Y"),
+        "machine_id": mid[hit],
+        "start": starts[hit].strftime("%H:%M"),
+        "end": ends[hit].strftime("%H:%M"),
+        "reason": reason[hit],
+    }, columns=CONFLICT_COLUMNS)
@@ -0,0 +1,271 @@
+"""Benchmarks for the scheduler hot paths over synthetic workbooks, saved as JSON for comparison.
+
+    python -m scheduler bench --size small --size medium
+    python -m scheduler bench --size large --repeat 50 --compare benchmarks/<older run>.json
+
+Each size runs in its own process against a throwaway data folder (SCHEDULER_DATA), so the
+module-level caches and the data paths start clean. Timings are wall-clock milliseconds; the
+run ends with a concurrency check where several processes race to book the same slot.
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from .db import BASE
+
+SIZES = {
+    "small": {"users": 200, "machines": 20, "bookings": 5_000, "years": 1},
+    "medium": {"users": 1_000, "machines": 60, "bookings": 50_000, "years": 2},
+    "large": {"users": 5_000, "machines": 200, "bookings": 500_000, "years": 4},
+}
+BENCH_DIR = BASE / "benchmarks"
+REGRESSION = 1.25  # a median this much slower than the baseline run is flagged
+STRESS_PROCS, STRESS_THREADS = 8, 4
+
+def _stats(samples: list) -> dict:
+    ms = np.asarray(samples) * 1000
+    return {
+        "n": len(ms),
+        "min_ms": round(float(ms.min()), 3),
+        "median_ms": round(float(np.median(ms)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+def _time(fn, args_list) -> dict:
+    """Time one call of *fn* per argument tuple."""
+    samples = []
+    for args in args_list:
+        t0 = perf_counter()
+        fn(*args)
+        samples.append(perf_counter() - t0)
+    return _stats(samples)
+
+# ---------- Concurrency check ----------
+def _race(rows: pd.DataFrame) -> list:
+    from .commit import BookingConflict, commit_booking
+    from .storage import open_store
+
+    def book(_):
+        try:
+            return commit_booking(open_store(), rows)
+        except BookingConflict:
+            return "conflict"
+        except TimeoutError:
+            return "timeout"
+
+    with ThreadPoolExecutor(STRESS_THREADS) as ex:
+        return list(ex.map(book, range(STRESS_THREADS)))
+
+def stress(machine_id: int, start: pd.Timestamp, minutes: int = 60) -> dict:
+    """Race STRESS_PROCS processes x STRESS_THREADS threads to book one slot; exactly one may win."""
+    from .batch import booking_rows
+    from .storage import open_store
+
+    rows = booking_rows(1, machine_id, [start], minutes)
+    t0 = perf_counter()
+    with ProcessPoolExecutor(STRESS_PROCS) as ex:
+        results = [r for rs in ex.map(_race, [rows] * STRESS_PROCS) for r in rs]
+    elapsed = perf_counter() - t0
+    wins = [r for r in results if isinstance(r, list)]
+    booked = open_store().bookings_between(machine_id, start, start + pd.Timedelta(minutes=minutes))
+    return {
+        "attempts": len(results),
+        "wins": len(wins),
+        "conflicts": results.count("conflict"),
+        "timeouts": results.count("timeout"),
+        "booked": len(booked),
+        "ok": len(wins) == 1 and len(booked) == 1,
+        "ms": round(elapsed * 1000, 1),
+    }
+
+# ---------- One size, inside the child process ----------
+def run_size(repeat: int, seed: int) -> dict:
+    """Time every hot path against the data under SCHEDULER_DATA."""
+    from . import archive
+    from .batch import batch_conflicts, booking_rows
+    from .commit import commit_booking, commit_save
+    from .db import CACHE_DIR, read_sheets
+    from .hours import is_open, opening_calendar
+    from .indexes import booking_index, derived_cache, entitlements
+    from .rules import day_bookings, make_human, user_licence_ids, week_bookings
+    from .storage import STORAGE, export_to_sqlite, open_store
+    from .tables import page_of, table_index
+    from .usage import utilisation, utilisation_report
+
+    rng = np.random.default_rng(seed)
+    ops = {}
+    if STORAGE == "sqlite":
+        t0 = perf_counter()
+        export_to_sqlite(read_sheets())
+        ops["export_to_sqlite"] = _stats([perf_counter() - t0])
+
+    def cold():
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        derived_cache().clear()
+        warm()
+
+    def warm():
+        open_store().table("Bookings")
+
+    ops["load_db_cold"] = _time(cold, [()])
+    ops["load_db_warm"] = _time(warm, [()] * repeat)
+    store = open_store()
+    M, U, B = store.table("Machines"), store.table("Users"), store.table("Bookings")
+    machines, users = M["machine_id"].to_numpy(), U["user_id"].to_numpy()
+    first, last = B["start"].min().normalize(), B["start"].max().normalize()
+    days = [(first + pd.Timedelta(days=int(d))).date() for d in rng.integers(0, (last - first).days + 1, repeat)]
+    mids = [int(m) for m in rng.choice(machines, repeat)]
+    uids = [int(u) for u in rng.choice(users, repeat)]
+
+    def rebuild(fn):
+        derived_cache().clear()
+        fn(store)
+
+    ops["booking_index_build"] = _time(rebuild, [(booking_index,)] * min(repeat, 5))
+    ops["entitlements_build"] = _time(rebuild, [(entitlements,)] * min(repeat, 5))
+    ops["opening_calendar_build"] = _time(rebuild, [(opening_calendar,)] * min(repeat, 5))
+    ops["utilisation_build"] = _time(rebuild, [(utilisation,)] * min(repeat, 5))
+    booking_index(store), entitlements(store), utilisation(store), make_human(B.head(1), store)  # warm, as in a live session
+    ops["day_bookings"] = _time(day_bookings, [(store, m, d) for m, d in zip(mids, days)])
+    starts = [pd.Timestamp(d) + pd.Timedelta(minutes=int(t)) for d, t in zip(days, rng.integers(8 * 2, 17 * 2, repeat) * 30)]
+    ops["is_open"] = _time(is_open, [(store, s.date(), s.time(), (s + timedelta(hours=1)).time()) for s in starts])
+    ops["user_licence_ids"] = _time(user_licence_ids, [(store, u) for u in uids])
+    sample = B.sample(min(len(B), 1_000), random_state=seed)
+    ops["make_human_1k"] = _time(make_human, [(sample, store)] * repeat)
+    ops["week_view"] = _time(week_bookings, [(store, m, d) for m, d in zip(mids, days)])
+    # what commit_booking checks under the lock, and the bulk-booking preview with opening hours
+    ops["overlap_check"] = _time(batch_conflicts, [(store, booking_rows(1, m, [s], 60), False) for m, s in zip(mids, starts)])
+    batch = [booking_rows(1, int(m), [s], 60) for m, s in zip(rng.choice(machines, 100), rng.choice(starts, 100))]
+    def search_page(query):
+        rows = table_index(store, "UserLicences").select(query, sort="name")
+        make_human(store.table("UserLicences").iloc[page_of(rows, 1, 25)[0]], store)
+
+    table_index(store, "UserLicences")
+    ops["licences_search_page"] = _time(search_page, [(str(n).split()[0],) for n in rng.choice(U["name"].dropna().to_numpy(), repeat)])
+    ops["utilisation_report"] = _time(utilisation_report, [(store, by, first, last) for by in ("machine", "month", "weekday", "hour", "user")] * max(1, repeat // 5))
+    ops["batch_check_100"] = _time(batch_conflicts, [(store, pd.concat(batch, ignore_index=True))] * min(repeat, 20))
+
+    # a booking committed from a snapshot one commit behind, as when someone else booked since the page loaded
+    stale, free = [], last + pd.Timedelta(days=7 - last.dayofweek + 56, hours=9)
+    for i in range(min(repeat, 20)):
+        behind = open_store()
+        commit_booking(open_store(), booking_rows(1, int(machines[0]), [free + pd.Timedelta(days=i)], 60))
+        t0 = perf_counter()
+        commit_booking(behind, booking_rows(1, int(machines[1]), [free + pd.Timedelta(days=i)], 60))
+        stale.append(perf_counter() - t0)
+    ops["commit_stale"] = _stats(stale)
+
+    def save():
+        commit_save(dict(open_store().sheets))  # a plain dict is written whole
+
+    def save_settings(i):
+        sheets = open_store().sheets
+        S = sheets["Settings"].copy()
+        S.loc[len(S)] = ["bench_edit", str(i)]
+        sheets["Settings"] = S  # only this sheet is dirty
+        commit_save(sheets)
+
+    ops["save_db"] = _time(save, [()])
+    ops["save_settings"] = _time(save_settings, [(i,) for i in range(min(repeat, 20))])
+    if STORAGE == "excel":
+        # the same data after rolling finished months into data/archive
+        ops["archive_roll_up"] = _time(archive.roll_up, [()])
+        ops["load_db_cold_archived"] = _time(cold, [()])
+        ops["save_db_archived"] = _time(save, [()])
+        past = open_store()
+        ops["day_bookings_archived"] = _time(day_bookings, [(past, m, d) for m, d in zip(mids, days)])
+    warm()  # the full saves moved every sheet's version on; a running app would already have reloaded
+    # a Monday well past the generated bookings, at 10:00
+    slot = last + pd.Timedelta(days=7 - last.dayofweek + 28, hours=10)
+    return {
+        "rows": {name: len(store.table(name)) for name in ("Users", "Machines", "Bookings", "UserLicences")},
+        "ops": ops,
+        "stress": stress(int(machines[0]), slot),
+    }
+
+# ---------- Driver ----------
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE, capture_output=True, text=True, timeout=10)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+def run(sizes: list, repeat: int = 20, seed: int = 0, storage: str = "excel", log=None) -> dict:
+    """Generate each size into a temp folder and benchmark it in a child process."""
+    from .synth import write_synthetic
+
+    log = log or (lambda msg: print(msg, file=sys.stderr))
+    result = {
+        "started": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "storage": storage,
+        "repeat": repeat,
+        "seed": seed,
+        "sizes": {},
+    }
+    for size in sizes:
+        params = SIZES[size]
+        with tempfile.TemporaryDirectory(prefix=f"scheduler-bench-{size}-") as folder:
+            log(f"{size}: generating {params}")
+            t0 = perf_counter()
+            write_synthetic(folder, seed=seed, **params)
+            generate = perf_counter() - t0
+            log(f"{size}: timing")
+            env = dict(os.environ, SCHEDULER_DATA=folder, SCHEDULER_STORAGE=storage)
+            child = subprocess.run(
+                [sys.executable, "-m", "scheduler.bench", str(repeat), str(seed)],
+                cwd=BASE, env=env, capture_output=True, text=True,
+            )
+            if child.returncode:
+                raise RuntimeError(f"Benchmark for {size} failed:\n{child.stderr}")
+            out = json.loads(child.stdout)
+        out["params"] = params
+        out["ops"] = {"generate_and_write": _stats([generate]), **out["ops"]}
+        result["sizes"][size] = out
+    return result
+
+def compare(old: dict, new: dict, threshold: float = REGRESSION) -> pd.DataFrame:
+    """Median per size and op in both runs, with the new/old ratio and a regression flag."""
+    rows = []
+    for size, res in new["sizes"].items():
+        before = old.get("sizes", {}).get(size, {}).get("ops", {})
+        for op, st in res["ops"].items():
+            was = before.get(op, {}).get("median_ms")
+            ratio = st["median_ms"] / was if was else None
+            rows.append((size, op, was, st["median_ms"], None if ratio is None else round(ratio, 2), bool(ratio and ratio > threshold)))
+    return pd.DataFrame(rows, columns=["size", "op", "old_ms", "new_ms", "ratio", "regressed"])
+
+def summary(result: dict) -> pd.DataFrame:
+    rows = [(size, op, st["n"], st["median_ms"], st["p95_ms"]) for size, res in result["sizes"].items() for op, st in res["ops"].items()]
+    return pd.DataFrame(rows, columns=["size", "op", "n", "median_ms", "p95_ms"])
+
+def save_result(result: dict, path: Path = None) -> Path:
+    if path is None:
+        stamp = result["started"].replace(":", "").replace("-", "")
+        path = BENCH_DIR / f"{stamp}-{result['commit'] or 'nogit'}.json"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    return path
+
+if __name__ == "__main__":
+    from scheduler.bench import run_size as _run  # so worker processes pickle functions by their real module
+
+    print(json.dumps(_run(int(sys.argv[1]), int(sys.argv[2]))))
@@ -0,0 +1,412 @@
+"""Batch jobs without the UI: imports, validation, exports and headless booking checks.
+
+    python -m scheduler validate
+    python -m scheduler import-members members.csv
+    python -m scheduler import-licences licences.csv
+    python -m scheduler export-bookings --from 01/03/2025 --to 31/03/2025 -o march.csv
+    python -m scheduler export-utilisation --by month --from 01/01/2025 --to 31/12/2025
+    python -m scheduler check-slot --machine 3 --start "14/10/2025 09:30" --minutes 90
+    python -m scheduler find-slots --user 7 --minutes 60
+    python -m scheduler check-bookings term.csv --commit
+    python -m scheduler archive-bookings
+    python -m scheduler compact-journal --if-due
+    python -m scheduler send-reminders --dry-run
+    python -m scheduler synth /tmp/bigclub --size large
+    python -m scheduler bench --size small --size medium --compare benchmarks/<older run>.json
+
+Dates are day-first like the app; ISO dates work too. Set SCHEDULER_DATA to point at another
+data folder and SCHEDULER_STORAGE=sqlite to use the SQLite backend.
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from . import archive
+from .batch import batch_conflicts, booking_rows, parse_booking_csv
+from .commit import BookingConflict, StaleDataError, commit_booking, commit_rows, compact
+from .indexes import labels
+from .reminders import run_reminders
+from .rules import make_human
+from .slots import find_slots
+from .storage import open_store
+from .usage import BREAKDOWNS, utilisation_report
+
+MEMBER_COLUMNS = ["name", "role", "email", "phone", "birth_date", "joined_date", "newsletter_opt_in"]
+KEYED_SHEETS = {
+    "Users": "user_id",
+    "Machines": "machine_id",
+    "Licences": "licence_id",
+    "Bookings": "booking_id",
+    "Issues": "issue_id",
+    "AssistanceRequests": "request_id",
+}
+# (sheet, column) → lookup sheet whose id it must name
+REFERENCES = {
+    ("Bookings", "user_id"): "Users",
+    ("Bookings", "machine_id"): "Machines",
+    ("UserLicences", "user_id"): "Users",
+    ("UserLicences", "licence_id"): "Licences",
+    ("Machines", "licence_id"): "Licences",
+    ("Issues", "machine_id"): "Machines",
+    ("OperatingHours", "machine_id"): "Machines",
+    ("ClosedDates", "machine_id"): "Machines",
+}
+
+def _day(text: str) -> pd.Timestamp:
+    ts = pd.to_datetime(text, dayfirst=True, errors="coerce")
+    if pd.isna(ts):
+        raise SystemExit(f"Can't read the date {text!r}.")
+    return ts
+
+def _read_csv(path: str) -> pd.DataFrame:
+    raw = pd.read_csv(path, dtype=str, keep_default_na=False)
+    raw.columns = [str(c).strip().lower() for c in raw.columns]
+    return raw.apply(lambda c: c.str.strip())
+
+def _show(df: pd.DataFrame, out=None):
+    print(df.to_string(index=False) if not df.empty else "(none)", file=out or sys.stdout)
+
+def _skip(reasons: dict) -> np.ndarray:
+    """Report each CSV line a reason applies to, in file order; return the rows to keep."""
+    hits = sorted((i, why) for why, mask in reasons.items() for i in np.flatnonzero(mask.to_numpy()))
+    for i, why in hits:
+        print(f"Line {i + 2}: skipped, {why}", file=sys.stderr)
+    return ~np.logical_or.reduce([m.to_numpy() for m in reasons.values()])
+
+def _commit(store, name: str, rows: pd.DataFrame, key: str = None) -> int:
+    try:
+        ids = commit_rows(store, name, rows, key)
+    except (StaleDataError, TimeoutError) as e:
+        print(f"Nothing imported: {e}", file=sys.stderr)
+        return 1
+    print(f"Imported {len(rows)} rows into {name}" + (f" (ids {ids[0]}–{ids[-1]})." if ids else "."))
+    return 0
+
+# ---------- Imports ----------
+def import_members(store, args) -> int:
+    raw = _read_csv(args.file)
+    if "name" not in raw.columns:
+        print("Missing column: name", file=sys.stderr)
+        return 1
+    U = store.table("Users")
+    known_names = set(U["name"].dropna().astype(str).str.lower()) if "name" in U.columns else set()
+    known_emails = set(U["email"].dropna().astype(str).str.lower()) if "email" in U.columns else set()
+    email = raw.get("email", pd.Series("", index=raw.index)).str.lower()
+    skip = {
+        "no name": raw["name"].eq(""),
+        "email already registered": email.ne("") & email.isin(known_emails),
+        "name already registered": email.eq("") & raw["name"].str.lower().isin(known_names),
+        "repeated in this file": raw.duplicated(subset=["name"] if "email" not in raw.columns else ["name", "email"]),
+    }
+    rows = raw.loc[_skip(skip), [c for c in MEMBER_COLUMNS if c in raw.columns]].replace("", None)
+    if "role" not in rows.columns or rows["role"].isna().any():
+        rows["role"] = rows.get("role", pd.Series(index=rows.index, dtype=object)).fillna("member")
+    rows.insert(0, "user_id", None)
+    ignored = sorted(set(raw.columns) - set(MEMBER_COLUMNS))
+    if ignored:
+        print(f"Ignored column(s): {', '.join(ignored)}", file=sys.stderr)
+    if rows.empty or args.dry_run:
+        print(f"{len(rows)} new members{' (dry run)' if args.dry_run else ''}.")
+        return 0
+    return _commit(store, "Users", rows, key="user_id")
+
+def import_licences(store, args) -> int:
+    raw = _read_csv(args.file)
+    today = pd.Timestamp.today().normalize()
+    if "user_id" in raw.columns:
+        uid = pd.to_numeric(raw["user_id"], errors="coerce")
+    elif "email" in raw.columns:
+        by_email = labels(store, "Users", "email").dropna().astype(str).str.lower()
+        uid = raw["email"].str.lower().map(pd.Series(by_email.index, index=by_email.to_numpy()))
+    else:
+        print("Missing column: user_id or email", file=sys.stderr)
+        return 1
+    if "licence_id" in raw.columns:
+        lid = pd.to_numeric(raw["licence_id"], errors="coerce")
+    elif "licence_name" in raw.columns:
+        by_name = labels(store, "Licences", "licence_name").dropna().astype(str).str.lower()
+        lid = raw["licence_name"].str.lower().map(pd.Series(by_name.index, index=by_name.to_numpy()))
+    else:
+        print("Missing column: licence_id or licence_name", file=sys.stderr)
+        return 1
+    vf = pd.to_datetime(raw.get("valid_from", pd.Series("", index=raw.index)).replace("", None), dayfirst=True, errors="coerce")
+    vt = pd.to_datetime(raw.get("valid_to", pd.Series("", index=raw.index)).replace("", None), dayfirst=True, errors="coerce")
+    vf = vf.fillna(today)
+    vt = vt.fillna(vf + pd.Timedelta(days=365))  # the app's default grant length
+    rows = pd.DataFrame({"user_id": uid, "licence_id": lid, "valid_from": vf, "valid_to": vt})
+    bad = {
+        "unknown member": ~rows["user_id"].isin(labels(store, "Users", "name").index),
+        "unknown licence": ~rows["licence_id"].isin(labels(store, "Licences", "licence_name").index),
+        "valid_to before valid_from": rows["valid_to"] < rows["valid_from"],
+    }
+    rows = rows[_skip(bad)].astype({"user_id": int, "licence_id": int})
+    if rows.empty or args.dry_run:
+        print(f"{len(rows)} licence grants{' (dry run)' if args.dry_run else ''}.")
+        return 0
+    return _commit(store, "UserLicences", rows)
+
+# ---------- Validation ----------
+def _table(store, name: str) -> pd.DataFrame:
+    """A sheet as the checks see it; Bookings includes the archived months."""
+    return store.bookings_history() if name == "Bookings" else store.table(name)
+
+def validation_problems(store) -> pd.DataFrame:
+    """One row per problem found in the data: sheet, row id or position, and what is wrong."""
+    found = []
+
+    def report(sheet, mask, ids, what):
+        mask = mask.fillna(False).to_numpy(dtype=bool) if isinstance(mask, pd.Series) else np.asarray(mask, dtype=bool)
+        for i in np.flatnonzero(mask):
+            found.append((sheet, ids.iloc[i], what))
+
+    for sheet, key in KEYED_SHEETS.items():
+        T = _table(store, sheet)
+        if key not in T.columns:
+            continue
+        report(sheet, T[key].isna(), pd.Series(T.index + 2), f"missing {key}")
+        report(sheet, T[key].notna() & T[key].duplicated(keep=False), T[key], f"duplicate {key}")
+    for (sheet, col), target in REFERENCES.items():
+        T = _table(store, sheet)
+        known = store.table(target, [KEYED_SHEETS[target]]).get(KEYED_SHEETS[target], pd.Series(dtype=float))
+        if col in T.columns:
+            ids = T[KEYED_SHEETS[sheet]] if KEYED_SHEETS.get(sheet) in T.columns else pd.Series(T.index + 2)
+            report(sheet, T[col].notna() & ~T[col].isin(known.dropna()), ids, f"unknown {col}")
+    B = _table(store, "Bookings")
+    if {"booking_id", "machine_id", "start", "end"} <= set(B.columns):
+        report("Bookings", B["start"].isna() | B["end"].isna(), B["booking_id"], "missing start or end")
+        report("Bookings", B["end"] <= B["start"], B["booking_id"], "ends before it starts")
+        S = B.dropna(subset=["machine_id", "start", "end"]).sort_values(["machine_id", "start"])
+        prev_end = S.groupby("machine_id")["end"].transform(lambda e: e.cummax().shift())
+        report("Bookings", (S["start"] < prev_end).to_numpy(), S["booking_id"], "overlaps an earlier booking on the same machine")
+    UL = store.table("UserLicences")
+    if {"valid_from", "valid_to"} <= set(UL.columns):
+        report("UserLicences", UL["valid_to"] < UL["valid_from"], pd.Series(UL.index + 2), "valid_to before valid_from")
+    OH = store.table("OperatingHours")
+    if {"_open_time_min", "_close_time_min"} <= set(OH.columns):
+        pos = pd.Series(OH.index + 2)
+        # both blank is a closed day; one missing means it was left out or couldn't be read
+        report("OperatingHours", OH["_open_time_min"].isna() != OH["_close_time_min"].isna(), pos, "open or close time missing or unreadable")
+        report("OperatingHours", OH["_close_time_min"] <= OH["_open_time_min"], pos, "closes before it opens")
+    CD = store.table("ClosedDates")
+    if {"_start_time_min", "_end_time_min"} <= set(CD.columns):
+        pos = pd.Series(CD.index + 2)
+        # blank times close from the start or to the end of the day
+        report("ClosedDates", CD["_end_time_min"] <= CD["_start_time_min"], pos, "ends before it starts")
+    return pd.DataFrame(found, columns=["sheet", "row", "problem"])
+
+def validate(store, args) -> int:
+    problems = validation_problems(store)
+    if problems.empty:
+        print("No problems found.")
+        return 0
+    _show(problems)
+    print(f"{len(problems)} problems.", file=sys.stderr)
+    return 1
+
+# ---------- Exports ----------
+def export_bookings(store, args) -> int:
+    lo, hi = _day(args.date_from).normalize(), _day(args.date_to).normalize() + pd.Timedelta(days=1)
+    B = store.bookings_history(lo, hi)
+    if args.machine is not None and not B.empty:
+        B = B[B["machine_id"] == args.machine]
+    B = make_human(B.sort_values("start"), store) if not B.empty else B
+    cols = [c for c in ["booking_id", "start", "end", "machine_id", "machine_name", "user_id", "name", "purpose", "notes", "status"] if c in B.columns]
+    B[cols].to_csv(args.out or sys.stdout, index=False, date_format="%Y-%m-%d %H:%M")
+    if args.out:
+        print(f"Wrote {len(B)} bookings to {args.out}.")
+    return 0
+
+def export_utilisation(store, args) -> int:
+    first = _day(args.date_from) if args.date_from else None
+    last = _day(args.date_to) if args.date_to else None
+    R = utilisation_report(store, args.by, first, last, args.machine, args.limit)
+    R.to_csv(args.out or sys.stdout, index=False)
+    if args.out:
+        print(f"Wrote {len(R)} rows to {args.out}.")
+    return 0
+
+# ---------- Headless checks ----------
+def check_slot(store, args) -> int:
+    rows = booking_rows(None, args.machine, [_day(args.start)], args.minutes)
+    clash = batch_conflicts(store, rows)
+    if clash.empty:
+        print("Free.")
+        return 0
+    print(clash["reason"].iloc[0] + ".")
+    return 1
+
+def find_free(store, args) -> int:
+    found = find_slots(store, args.user, args.minutes, args.days, args.limit)
+    _show(found)
+    return 0 if not found.empty else 1
+
+def check_bookings(store, args) -> int:
+    rows, problems = parse_booking_csv(args.file, store)
+    for msg in problems:
+        print(msg, file=sys.stderr)
+    clash = batch_conflicts(store, rows)
+    if not clash.empty:
+        _show(make_human(clash, store)[["date", "start", "end", "machine_name", "reason"]])
+    accepted = rows.drop(index=clash["row"])
+    print(f"{len(accepted)} of {len(rows)} bookings can be made.")
+    if not args.commit or accepted.empty:
+        return 0 if clash.empty and not problems else 1
+    try:
+        ids = commit_booking(store, accepted)
+    except (BookingConflict, TimeoutError) as e:
+        print(f"Nothing booked: {e}", file=sys.stderr)
+        return 1
+    print(f"Booked {len(ids)} (ids {ids[0]}–{ids[-1]}).")
+    return 0
+
+# ---------- Reminders ----------
+def send_reminders(store, args) -> int:
+    run = run_reminders(store, today=_day(args.date) if args.date else None, dry_run=args.dry_run)
+    for msg in run.pop("preview", []):
+        print(f"To: {', '.join(msg['to'])}\nSubject: {msg['subject']}\n\n{msg['body']}\n")
+    print(", ".join(f"{k} {v}" for k, v in run.items() if k != "started"))
+    return 1 if run["failed"] else 0
+
+# ---------- Archive ----------
+def archive_bookings(store, args) -> int:
+    if store.kind != "excel":
+        print("The SQLite backend keeps all bookings in one indexed table; nothing to archive.", file=sys.stderr)
+        return 1
+    try:
+        moved = archive.roll_up(_day(args.before) if args.before else None)
+    except TimeoutError as e:
+        print(f"Nothing archived: {e}", file=sys.stderr)
+        return 1
+    for month, n in moved.items():
+        print(f"{month}: {n} bookings archived.")
+    print(f"{sum(moved.values())} bookings moved to {archive.ARCHIVE_DIR}." if moved else "No finished months to archive.")
+    return 0
+
+def compact_journal(store, args) -> int:
+    if store.kind != "excel":
+        print("The SQLite backend has no journal to compact.", file=sys.stderr)
+        return 1
+    try:
+        done = compact(due_only=args.if_due)
+    except TimeoutError as e:
+        print(f"Nothing compacted: {e}", file=sys.stderr)
+        return 1
+    print("Journal folded into db.xlsx." if done else "Nothing to compact.")
+    return 0
+
+# ---------- Synthetic data and benchmarks ----------
+def synth(args) -> int:
+    from pathlib import Path
+
+    from .bench import SIZES
+    from .synth import write_synthetic
+
+    if (Path(args.folder) / "db.xlsx").exists() and not args.force:
+        print(f"{args.folder} already has a db.xlsx; pass --force to replace it.", file=sys.stderr)
+        return 1
+    sizes = dict(SIZES[args.size])
+    sizes.update({k: getattr(args, k) for k in ("users", "machines", "bookings", "years") if getattr(args, k) is not None})
+    try:
+        sheets = write_synthetic(args.folder, seed=args.seed, **sizes)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Wrote {args.folder}/db.xlsx: " + ", ".join(f"{len(sheets[n])} {n}" for n in ("Users", "Machines", "Bookings", "UserLicences")) + ".")
+    print(f"Use it with SCHEDULER_DATA={args.folder}")
+    return 0
+
+def bench(args) -> int:
+    import json
+
+    from . import bench as b
+
+    result = b.run(args.size or ["small"], repeat=args.repeat, seed=args.seed, storage=args.storage)
+    _show(b.summary(result))
+    for size, res in result["sizes"].items():
+        st = res["stress"]
+        print(f"{size}: {st['attempts']} concurrent bookings of one slot, {st['wins']} won, {st['conflicts']} conflicts, {st['timeouts']} timeouts.")
+    print(f"Saved {b.save_result(result, args.out)}")
+    failed = not all(res["stress"]["ok"] for res in result["sizes"].values())
+    if args.compare:
+        diff = b.compare(json.loads(open(args.compare, encoding="utf-8").read()), result)
+        _show(diff)
+        failed |= bool(diff["regressed"].any())
+    return 1 if failed else 0
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m scheduler", description="Woodturners scheduler batch jobs.")
+    sub = p.add_subparsers(dest="command", required=True)
+    c = sub.add_parser("import-members", help="add members from a CSV (name, role, email, phone, ...)")
+    c.add_argument("file")
+    c.add_argument("--dry-run", action="store_true")
+    c.set_defaults(run=import_members)
+    c = sub.add_parser("import-licences", help="grant licences from a CSV (user_id or email, licence_id or licence_name, valid_from, valid_to)")
+    c.add_argument("file")
+    c.add_argument("--dry-run", action="store_true")
+    c.set_defaults(run=import_licences)
+    c = sub.add_parser("validate", help="check ids, references, bookings and opening hours")
+    c.set_defaults(run=validate)
+    c = sub.add_parser("export-bookings", help="write bookings overlapping a date range as CSV")
+    c.add_argument("--from", dest="date_from", required=True)
+    c.add_argument("--to", dest="date_to", required=True)
+    c.add_argument("--machine", type=int)
+    c.add_argument("-o", "--out")
+    c.set_defaults(run=export_bookings)
+    c = sub.add_parser("export-utilisation", help="booked vs open hours per machine, month, weekday or hour, or the top members, as CSV")
+    c.add_argument("--by", choices=BREAKDOWNS, default="machine")
+    c.add_argument("--from", dest="date_from", help="first month (default: 11 months before --to)")
+    c.add_argument("--to", dest="date_to", help="last month (default: this month)")
+    c.add_argument("--machine", type=int, action="append", help="repeatable; default every machine")
+    c.add_argument("--limit", type=int, default=20, help="members listed with --by user")
+    c.add_argument("-o", "--out")
+    c.set_defaults(run=export_utilisation)
+    c = sub.add_parser("check-slot", help="is a machine free and the workshop open for this slot?")
+    c.add_argument("--machine", type=int, required=True)
+    c.add_argument("--start", required=True)
+    c.add_argument("--minutes", type=int, required=True)
+    c.set_defaults(run=check_slot)
+    c = sub.add_parser("find-slots", help="earliest free slots on the machines a member is licensed for")
+    c.add_argument("--user", type=int, required=True)
+    c.add_argument("--minutes", type=int, required=True)
+    c.add_argument("--days", type=int, default=28)
+    c.add_argument("--limit", type=int, default=10)
+    c.set_defaults(run=find_free)
+    c = sub.add_parser("check-bookings", help="check a bookings CSV for clashes; --commit books the rest")
+    c.add_argument("file")
+    c.add_argument("--commit", action="store_true")
+    c.set_defaults(run=check_bookings)
+    c = sub.add_parser("send-reminders", help="send licence, renewal, service and newsletter reminders that are due (what the app's worker does)")
+    c.add_argument("--dry-run", action="store_true", help="print the messages instead of sending them")
+    c.add_argument("--date", help="check as of this day (default: today)")
+    c.set_defaults(run=send_reminders)
+    c = sub.add_parser("archive-bookings", help="move bookings from finished months out of db.xlsx into data/archive")
+    c.add_argument("--before", help="archive months before this date's month (default: this month)")
+    c.set_defaults(run=archive_bookings)
+    c = sub.add_parser("compact-journal", help="fold data/db.journal.jsonl into db.xlsx (what the app's compactor does)")
+    c.add_argument("--if-due", action="store_true", help="only once the journal is big or old enough")
+    c.set_defaults(run=compact_journal)
+    c = sub.add_parser("synth", help="write a synthetic db.xlsx of a given size into a folder")
+    c.add_argument("folder")
+    c.add_argument("--size", choices=["small", "medium", "large"], default="small")
+    for name in ("users", "machines", "bookings", "years"):
+        c.add_argument(f"--{name}", type=int, help="overrides the size preset")
+    c.add_argument("--seed", type=int, default=0)
+    c.add_argument("--force", action="store_true")
+    c.set_defaults(run=synth, store=False)
+    c = sub.add_parser("bench", help="time the hot paths on synthetic data and save the results as JSON")
+    c.add_argument("--size", action="append", choices=["small", "medium", "large"], help="repeatable; default small")
+    c.add_argument("--repeat", type=int, default=20, help="calls timed per operation")
+    c.add_argument("--seed", type=int, default=0)
+    c.add_argument("--storage", choices=["excel", "sqlite"], default="excel")
+    c.add_argument("-o", "--out", help="results file (default benchmarks/<time>-<commit>.json)")
+    c.add_argument("--compare", help="an earlier results file; slower medians are flagged")
+    c.set_defaults(run=bench, store=False)
+    return p
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if not getattr(args, "store", True):
+        return args.run(args)
+    return args.run(open_store(), args)
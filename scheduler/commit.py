@@ -0,0 +1,136 @@
+"""Commits: id allocation, conflict checks and revision bumps, all under the commit lock."""
+import json
+import os
+import threading
+
+import pandas as pd
+
+from .batch import batch_conflicts
+from .db import META, commit_lock, compact_journal, read_meta
+from .indexes import _index_commit
+from .perf import timed
+from .storage import STORAGE, _backend
+
+PUBLISH_HOOKS = {}  # name → callable run after every commit
+COMPACT_EVERY = 60.0  # seconds between the Compactor's checks for a due journal
+
+class StaleDataError(Exception):
+    """Someone else committed since this snapshot was read."""
+
+class BookingConflict(Exception):
+    """A booking overlaps one that was committed after the form was drawn."""
+
+def _publish(meta: dict, changed) -> tuple:
+    """Bump the revision and the version of each *changed* sheet; returns their versions (before, after)."""
+    versions = meta["sheets"]
+    before = {name: versions.get(name, 0) for name in changed}
+    after = {name: v + 1 for name, v in before.items()}
+    versions.update(after)
+    meta["rev"] += 1
+    tmp = META.with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp, META)
+    for hook in list(PUBLISH_HOOKS.values()):
+        try:
+            hook()  # e.g. the app dropping snapshots cached for superseded revisions
+        except Exception:
+            pass
+    return before, after
+
+def allocate_ids(meta: dict, store, name: str, key: str, n: int) -> list:
+    """Reserve *n* contiguous ids for *name*; the caller must hold the commit lock."""
+    top = max(int(meta["seq"].get(name, 0)), store.max_id(name, key))
+    meta["seq"][name] = top + n
+    return list(range(top + 1, top + n + 1))
+
+def check_overlaps(store, rows: pd.DataFrame):
+    """Raise BookingConflict if any row overlaps a committed booking or another row on the same machine."""
+    clash = batch_conflicts(store, rows, hours=False)
+    if not clash.empty:
+        first = clash.iloc[0]
+        more = f" ({len(clash) - 1} more conflicts)" if len(clash) > 1 else ""
+        raise BookingConflict(f"Machine {first['machine_id']} is already booked at {first['date']} {first['start']}.{more}")
+
+@timed()
+def commit_rows(store, name: str, rows: pd.DataFrame, key: str = None, check=None) -> list:
+    """Append *rows* atomically: validate against current data, assign ids, write, bump revision."""
+    with commit_lock():
+        meta = read_meta()
+        current = store.fresh()
+        if check is not None:
+            check(current, rows)
+        rows = rows.copy()
+        ids = []
+        if key:
+            ids = allocate_ids(meta, current, name, key, len(rows))
+            rows[key] = ids
+        current.insert(name, rows, key)
+        before, after = _publish(meta, [name])
+        _index_commit({name: rows}, before, after)
+    return ids
+
+def commit_booking(store, rows: pd.DataFrame) -> list:
+    return commit_rows(store, "Bookings", rows, key="booking_id", check=check_overlaps)
+
+@timed()
+def commit_save(sheets: dict, appended: dict = None):
+    """Write the sheets this snapshot changed, refusing if anyone committed to them since it was read.
+
+    Only sheets assigned since the read (Sheets.dirty) are written, so an edit costs what that
+    sheet costs and concurrent commits to other sheets don't make it stale. *appended* (sheet →
+    rows) names rows this save only adds to a sheet, so just those rows are written and that
+    sheet's shared index is updated in place. A plain dict is written whole and must not be
+    older than the current data revision.
+    """
+    with commit_lock():
+        meta = read_meta()
+        dirty = getattr(sheets, "dirty", None)
+        if dirty is None:
+            if getattr(sheets, "revision", meta["rev"]) != meta["rev"]:
+                raise StaleDataError("The data was changed by someone else since this page loaded. Reload and try again.")
+            _backend().save(sheets)
+            before, after = _publish(meta, [n for n, df in dict.items(sheets) if isinstance(df, pd.DataFrame)])
+        else:
+            appended = appended or {}
+            names = sorted(dirty | set(appended))
+            if not names:
+                return
+            replaced = [n for n in names if n not in appended]  # appending is safe whatever others did
+            stale = [n for n in replaced if meta["sheets"].get(n, 0) != sheets.versions.get(n, 0)]
+            if stale:
+                raise StaleDataError(f"{', '.join(stale)} changed since this page loaded. Reload and try again.")
+            _backend().save(sheets, names, appended)
+            before, after = _publish(meta, names)
+            sheets.versions.update({n: after[n] for n in replaced})  # a later save from this snapshot builds on these
+            dirty.clear()
+        _index_commit(appended or {}, before, after)
+
+def compact(due_only: bool = False) -> bool:
+    """Fold the journal into db.xlsx now rather than when the Compactor finds it due."""
+    return compact_journal(due_only)
+
+class Compactor(threading.Thread):
+    """Folds the journal into db.xlsx once it is due, on a daemon thread off the request path.
+
+    Page loads and commits only ever read the journal; this (or compact()) is what rewrites the
+    workbook. *last* holds the time and outcome of the latest check that did something.
+    """
+
+    def __init__(self, every: float = COMPACT_EVERY):
+        super().__init__(name="compactor", daemon=True)
+        self.every = every
+        self.last = None
+        self._halt = threading.Event()
+
+    def stop(self):
+        self._halt.set()
+
+    def run(self):
+        while not self._halt.wait(self.every):
+            if STORAGE != "excel":
+                return
+            try:
+                if compact(due_only=True):
+                    self.last = (pd.Timestamp.now().floor("s"), "compacted")
+            except Exception as e:  # busy lock or unreadable file: try again next time
+                self.last = (pd.Timestamp.now().floor("s"), f"{type(e).__name__}: {e}")
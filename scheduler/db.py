@@ -0,0 +1,475 @@
+"""Workbook loading, the append-only journal, and the data revision/lock files."""
+import json
+import os
+import pickle
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, date
+from pathlib import Path
+from time import perf_counter, sleep
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+from pandas.io.parsers import TextParser
+
+from .perf import record, span, timed
+from .schema import SCHEMA_TAG, apply_schema, persisted, _deep_bytes
+
+BASE = Path(__file__).resolve().parent.parent
+DATA = Path(os.environ.get("SCHEDULER_DATA", BASE / "data"))
+DB = DATA / "db.xlsx"
+
+# ---------- Data IO ----------
+CACHE_DIR = DATA / ".cache"  # sidecar pickles of the parsed workbook
+JOURNAL = DATA / "db.journal.jsonl"  # inserts and sheet replacements not yet folded into db.xlsx
+JOURNAL_COMPACT_ROWS = 200
+JOURNAL_COMPACT_AGE = pd.Timedelta(days=1)
+FOLDED_PROP = "journal_folded"  # workbook property: id of the last journal entry db.xlsx holds
+
+_STATS = {}
+
+def load_stats() -> dict:
+    """Process-wide record of the most recent cold (openpyxl) and warm (cache) loads."""
+    return _STATS
+
+def _file_signature(path: Path) -> dict:
+    info = path.stat()
+    return {"mtime_ns": info.st_mtime_ns, "size": info.st_size, "pandas": pd.__version__, "schema": SCHEMA_TAG}
+
+def _cell(v):
+    # Same normalisation pandas' openpyxl reader applies before type inference.
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+def read_workbook(path: Path) -> "Sheets":
+    """Parse every sheet of an xlsx in one streaming openpyxl pass."""
+    from openpyxl import load_workbook  # only needed on a cold load
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    sheets = Sheets()
+    try:
+        sheets.folded = next((p.value for p in wb.custom_doc_props if p.name == FOLDED_PROP), None)
+        for ws in wb.worksheets:
+            ws.reset_dimensions()  # stored dimensions are often stale; let openpyxl scan
+            rows = [[_cell(v) for v in r] for r in ws.iter_rows(values_only=True)]
+            while rows and all(v == "" for v in rows[-1]):
+                rows.pop()
+            if not rows:
+                sheets[ws.title] = pd.DataFrame()
+                continue
+            header = [h if h != "" else f"Unnamed: {i}" for i, h in enumerate(rows[0])]
+            sheets[ws.title] = TextParser([header] + rows[1:], header=0).read()
+    finally:
+        wb.close()
+    return sheets
+
+def _read_cache(sig: dict):
+    """Return the cached sheets if they were written for this exact workbook, else None."""
+    try:
+        manifest = json.loads((CACHE_DIR / "manifest.json").read_text(encoding="utf-8"))
+        if manifest.get("source") != sig:
+            return None
+        sheets = Sheets()
+        sheets.folded = manifest.get("folded")
+        for name, fname in manifest["sheets"]:
+            with open(CACHE_DIR / fname, "rb") as f:
+                sheets[name] = pickle.load(f)
+        return sheets
+    except Exception:
+        return None
+
+def _write_cache(sig: dict, sheets: dict, folded: str = None):
+    """Pickle each sheet, then publish the manifest last so readers never see a partial cache."""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for i, (name, df) in enumerate(sheets.items()):
+            fname = f"sheet_{i:02d}.pkl"
+            with open(CACHE_DIR / fname, "wb") as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            entries.append([name, fname])
+        tmp = CACHE_DIR / "manifest.json.tmp"
+        tmp.write_text(json.dumps({"source": sig, "sheets": entries, "folded": folded}), encoding="utf-8")
+        os.replace(tmp, CACHE_DIR / "manifest.json")
+    except OSError:
+        pass  # cache is an optimisation only
+
+def read_db(path: Path = None) -> "Sheets":
+    """Load the workbook, preferring the sidecar cache when db.xlsx is unchanged."""
+    path = path or DB
+    t0 = perf_counter()
+    sig = _file_signature(path)
+    sheets = _read_cache(sig)
+    stats = load_stats()
+    if sheets is not None:
+        stats["warm_ms"] = (perf_counter() - t0) * 1000
+        stats["last"] = "warm"
+        record("read_db", stats["warm_ms"], rows=_rows(sheets), hit=True)
+        return sheets
+    sheets = read_workbook(path)
+    stats["raw_bytes"] = _deep_bytes(sheets)
+    for name, df in sheets.items():
+        apply_schema(name, df)
+    stats["typed_bytes"] = _deep_bytes(sheets)
+    stats["cold_ms"] = (perf_counter() - t0) * 1000
+    stats["last"] = "cold"
+    _write_cache(sig, sheets, sheets.folded)
+    record("read_db", (perf_counter() - t0) * 1000, rows=_rows(sheets), hit=False)
+    return sheets
+
+def _rows(sheets: dict) -> int:
+    return sum(len(df) for df in sheets.values() if isinstance(df, pd.DataFrame))
+
+class Sheets(dict):
+    """Sheet name → DataFrame, remembering the data revision, workbook and journal position it was read at.
+
+    *versions* holds each sheet's version at read time and *dirty* the sheets assigned since,
+    which are the only ones a save writes. *folded* is the id of the last journal entry the
+    workbook already holds.
+    """
+    revision = None
+    source = None
+    journal_offset = 0
+    folded = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.versions = {}
+        self.dirty = set()
+
+    def __setitem__(self, name, df):
+        super().__setitem__(name, df)
+        if "dirty" in self.__dict__:  # unpickling restores items before attributes
+            self.dirty.add(name)
+
+def _encode(v):
+    if v is None or (not isinstance(v, (list, dict, str)) and pd.isna(v)):
+        return None
+    if isinstance(v, (pd.Timestamp, datetime, date)):
+        return {"$ts": pd.Timestamp(v).isoformat()}
+    if hasattr(v, "item"):  # numpy scalar
+        return v.item()
+    return v
+
+def _decode(v):
+    if isinstance(v, dict) and "$ts" in v:
+        return pd.Timestamp(v["$ts"])
+    return v
+
+def read_journal(since: int = 0, upto: int = None):
+    """Return (entries, end_offset) for the complete journal lines after byte offset *since*
+    (and before *upto*, if given)."""
+    try:
+        with open(JOURNAL, "rb") as f:
+            f.seek(since)
+            data = f.read() if upto is None else f.read(max(upto - since, 0))
+    except FileNotFoundError:
+        return [], 0
+    entries, end = [], since
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break  # torn write from a crash; never acknowledged to the user
+        end += len(line)
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries, end
+
+def unfolded(entries: list, folded: str = None) -> list:
+    """*entries* after the one the workbook was last folded through, or all of them once the
+    journal has been trimmed past it."""
+    ids = [e.get("id") for e in entries]
+    return entries[ids.index(folded) + 1:] if folded and folded in ids else entries
+
+def apply_journal(sheets: dict, entries: list):
+    """Replay journaled sheet replacements and appended rows onto *sheets*."""
+    by_sheet = {}
+    for e in entries:
+        by_sheet.setdefault(e["sheet"], []).append(e)
+    for name, group in by_sheet.items():
+        last = max((i for i, e in enumerate(group) if e.get("replace")), default=None)
+        if last is not None:
+            e = group[last]  # the sheet as saved, earlier entries included
+            rows = [{k: _decode(v) for k, v in r.items()} for r in e["rows"]]
+            sheets[name] = apply_schema(name, pd.DataFrame(rows, columns=e["columns"]))
+            group = group[last + 1:]
+            if not group:
+                continue
+        rows = pd.DataFrame([{k: _decode(v) for k, v in e["row"].items()} for e in group])
+        sheets[name] = _append(name, sheets.get(name), rows)
+
+def _append(name: str, base, rows: pd.DataFrame) -> pd.DataFrame:
+    """Journaled *rows* typed on their own and put below the already-typed *base*.
+
+    Each column keeps base's dtype: categories are unioned, and a side that is all blank (or
+    missing the column) takes the other side's dtype rather than making pandas guess.
+    """
+    rows = apply_schema(name, rows.reset_index(drop=True))
+    if not isinstance(base, pd.DataFrame):
+        return rows
+    out = {}
+    for c in dict.fromkeys([*base.columns, *rows.columns]):
+        b = base[c].reset_index(drop=True) if c in base.columns else None
+        r = rows[c] if c in rows.columns else None
+        if b is None or (r is not None and b.dtype != r.dtype and b.isna().all()):
+            b = r.iloc[:0].reindex(range(len(base)))
+        if r is None or (r.dtype != b.dtype and r.isna().all()):
+            r = b.iloc[:0].reindex(range(len(rows)))
+        if isinstance(b.dtype, pd.CategoricalDtype) and isinstance(r.dtype, pd.CategoricalDtype):
+            out[c] = pd.Series(union_categoricals([b.array, r.array]))
+        else:
+            out[c] = pd.concat([b, r], ignore_index=True)
+    return pd.DataFrame(out, copy=False)
+
+def _insert_lines(name: str, rows: pd.DataFrame, now: str) -> str:
+    return "".join(
+        json.dumps({"sheet": name, "id": uuid.uuid4().hex, "at": now, "row": {c: _encode(v) for c, v in r.items()}}) + "\n"
+        for r in rows.to_dict("records")
+    )
+
+def _replace_line(name: str, df: pd.DataFrame, now: str) -> str:
+    df = persisted(df)
+    rows = [{c: _encode(v) for c, v in r.items()} for r in df.to_dict("records")]
+    return json.dumps({"sheet": name, "id": uuid.uuid4().hex, "replace": True, "at": now, "columns": [str(c) for c in df.columns], "rows": rows}) + "\n"
+
+@timed()
+def journal_insert(name: str, rows: pd.DataFrame):
+    """Durably append new rows for *name* without rewriting db.xlsx."""
+    _journal_append(_insert_lines(name, rows, pd.Timestamp.now().isoformat()))
+
+@timed()
+def journal_save(replace: dict, insert: dict = None):
+    """Durably record whole sheets (*replace*) and appended rows (*insert*) in one journal write."""
+    now = pd.Timestamp.now().isoformat()
+    lines = "".join(_replace_line(name, df, now) for name, df in replace.items())
+    lines += "".join(_insert_lines(name, rows, now) for name, rows in (insert or {}).items())
+    _journal_append(lines)
+
+def _journal_append(lines: str):
+    with open(JOURNAL, "a+b") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                lines = "\n" + lines  # seal off a torn tail so this entry stays readable
+        f.write(lines.encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+def journal_due(entries: list) -> bool:
+    """Has the journal grown or aged enough to fold into db.xlsx?"""
+    if len(entries) >= JOURNAL_COMPACT_ROWS:
+        return True
+    oldest = pd.Timestamp(entries[0]["at"]) if entries else None
+    return oldest is not None and pd.Timestamp.now() - oldest > JOURNAL_COMPACT_AGE
+
+@timed(rows=_rows)
+def read_sheets() -> Sheets:
+    """Workbook plus replayed journal. Reading never writes: folding the journal back into
+    db.xlsx is compact_journal's job."""
+    meta = read_meta()
+    rev = meta["rev"]
+    sheets = read_db()
+    sheets.revision = rev
+    sheets.versions = dict(meta["sheets"])
+    sheets.source = _file_signature(DB)
+    entries, end = read_journal()
+    entries = unfolded(entries, sheets.folded)  # a crash before the last trim leaves folded entries behind
+    apply_journal(sheets, entries)
+    sheets.journal_offset = end
+    sheets.dirty.clear()
+    return sheets
+
+def catch_up(sheets: Sheets):
+    """*sheets* brought up to the current revision by replaying only the journal written since
+    they were read: (new Sheets sharing the untouched frames, sheet → rows the replay appended
+    to a sheet it didn't replace). None when that isn't possible, i.e. db.xlsx was rewritten
+    since or the snapshot has unsaved edits, and a full read_sheets is needed."""
+    meta = read_meta()
+    if sheets.revision == meta["rev"]:
+        return sheets, {}
+    if sheets.dirty or sheets.source is None or sheets.source != _file_signature(DB):
+        return None
+    tail, end = read_journal(sheets.journal_offset)
+    out = Sheets(sheets)
+    apply_journal(out, tail)
+    out.revision, out.versions = meta["rev"], dict(meta["sheets"])
+    out.source, out.journal_offset, out.folded = sheets.source, end, sheets.folded
+    out.dirty.clear()
+    replaced = {e["sheet"] for e in tail if e.get("replace")}
+    appended = {}
+    for name in {e["sheet"] for e in tail} - replaced:
+        before = sheets.get(name)
+        appended[name] = out[name].iloc[len(before) if isinstance(before, pd.DataFrame) else 0:]
+    return out, appended
+
+def _trim_journal(upto: int):
+    """Drop the first *upto* bytes of the journal, keeping anything appended since."""
+    try:
+        with open(JOURNAL, "rb") as f:
+            f.seek(upto)
+            rest = f.read()
+    except FileNotFoundError:
+        return
+    tmp = JOURNAL.with_suffix(".tmp")
+    tmp.write_bytes(rest)
+    os.replace(tmp, JOURNAL)
+
+def write_db(sheets: dict):
+    """Write *sheets* (plus entries journaled since they were read) to db.xlsx, trim the journal and
+    refresh the sidecar cache so the next load stays warm."""
+    since = getattr(sheets, "journal_offset", 0)
+    if getattr(sheets, "source", None) != _file_signature(DB):
+        since = 0  # workbook was compacted since this snapshot; its offset no longer applies
+    tail, end = read_journal(since)
+    apply_journal(sheets, tail)
+    last = (tail or read_journal()[0])[-1:]  # the newest entry the workbook now holds
+    folded = last[0].get("id") if last else None
+    with span("write_db", rows=_rows(sheets)):
+        write_workbook(sheets, DB, folded)
+    _trim_journal(end)
+    sig = _file_signature(DB)
+    _write_cache(sig, _stored(sheets), folded)
+    if isinstance(sheets, Sheets):
+        sheets.source = sig
+        sheets.journal_offset = 0
+        sheets.folded = folded
+
+def _stored(sheets: dict) -> dict:
+    """The sheets as the next load would type them, for the sidecar cache."""
+    return {name: apply_schema(name, persisted(df).copy()) for name, df in sheets.items() if isinstance(df, pd.DataFrame)}
+
+@timed()
+def compact_journal(due_only: bool = False) -> bool:
+    """Fold the journal into db.xlsx; with *due_only*, only once journal_due says so.
+
+    The new workbook is written before taking the commit lock, so commits carry on during the
+    slow part; under the lock it is only swapped in and the folded entries trimmed (entries
+    appended meanwhile stay for the next replay). Returns False if there was nothing to do, or
+    db.xlsx was rewritten by someone else while this one was being written.
+    """
+    sheets = read_sheets()
+    pending = unfolded(read_journal(upto=sheets.journal_offset)[0], sheets.folded)
+    if not pending or (due_only and not journal_due(pending)):
+        return False
+    folded = pending[-1].get("id")
+    with span("write_db", rows=_rows(sheets)):
+        tmp = _workbook_tmp(sheets, DB, folded)
+    try:
+        with commit_lock():
+            if _file_signature(DB) != sheets.source:
+                return False
+            os.replace(tmp, DB)
+            _trim_journal(sheets.journal_offset)
+            _write_cache(_file_signature(DB), _stored(sheets), folded)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return True
+
+def write_workbook(sheets: dict, path: Path, folded: str = None):
+    """Replace *path* atomically with one worksheet per DataFrame, stamped with the id of the last
+    journal entry it holds (*folded*) so a replay after a crash before the trim skips it."""
+    os.replace(_workbook_tmp(sheets, path, folded), path)
+
+def _workbook_tmp(sheets: dict, path: Path, folded: str = None) -> Path:
+    """Write the workbook to a uniquely named file next to *path* and return that file."""
+    from openpyxl.packaging.custom import StringProperty
+
+    tmp = path.with_name(f"{path.stem}.{uuid.uuid4().hex[:8]}.tmp.xlsx")
+    with pd.ExcelWriter(tmp, engine="openpyxl", mode="w") as w:
+        for name, df in sheets.items():
+            if isinstance(df, pd.DataFrame):
+                persisted(df).to_excel(w, sheet_name=name, index=False)
+        if folded:
+            w.book.custom_doc_props.append(StringProperty(name=FOLDED_PROP, value=folded))
+    return tmp
+
+# ---------- Revision and lock ----------
+# Sessions read cached snapshots freely; writes take a cross-process lock, check the
+# data revision (or re-validate against current data) and bump it.
+META = DATA / "db.meta.json"  # data revision, per-sheet versions + id sequences; only written under LOCK
+LOCK = DATA / "db.lock"
+LOCK_TIMEOUT = 5.0  # seconds a commit waits for another one to finish
+
+_lock_state = threading.local()
+
+def _try_lock(fd: int) -> bool:
+    """Take the OS lock on *fd* without waiting. The OS drops it when the holder exits, so a
+    crashed writer never leaves the lock behind and a slow one (a full save) is never broken."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def commit_lock():
+    """Hold the lock on data/db.lock for the duration of one commit; re-entrant within a thread.
+
+    The file itself stays put: removing it while another process waits on it would let two
+    writers lock two different files.
+    """
+    if getattr(_lock_state, "depth", 0):
+        _lock_state.depth += 1
+        try:
+            yield
+        finally:
+            _lock_state.depth -= 1
+        return
+    t0 = perf_counter()
+    deadline = t0 + LOCK_TIMEOUT
+    fd = os.open(LOCK, os.O_CREAT | os.O_RDWR)
+    try:
+        while not _try_lock(fd):
+            if perf_counter() > deadline:
+                record("lock_timeout", (perf_counter() - t0) * 1000)
+                raise TimeoutError("The database is busy, please try again.")
+            sleep(0.002)
+    except BaseException:
+        os.close(fd)
+        raise
+    held = perf_counter()
+    record("lock_wait", (held - t0) * 1000)
+    _lock_state.depth = 1
+    try:
+        yield
+    finally:
+        _lock_state.depth = 0
+        _unlock(fd)
+        os.close(fd)
+        record("lock_held", (perf_counter() - held) * 1000)
+
+def read_meta() -> dict:
+    try:
+        meta = json.loads(META.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        meta = {}
+    meta.setdefault("rev", 0)
+    meta.setdefault("seq", {})
+    meta.setdefault("sheets", {})  # sheet → version, bumped by every commit that changes it
+    return meta
+
+def revision() -> int:
+    """Monotonic data revision; bumped by every commit."""
+    return read_meta()["rev"]
@@ -0,0 +1,76 @@
+"""Whole-workshop occupancy: booked minutes per machine and time bin."""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from .hours import NS_PER_MIN
+from .indexes import _ns
+from .perf import timed
+
+def occupancy_grid(bookings: pd.DataFrame, machine_ids, start: pd.Timestamp, n_bins: int, bin_min: int) -> np.ndarray:
+    """Booked minutes per machine (rows, in *machine_ids* order) and time bin, in one pass.
+
+    Each booking adds its exact overlap to its first and last bin; whole bins in between go
+    through a difference array, so a booking costs O(1) however many bins it covers.
+    """
+    machine_ids = np.asarray(machine_ids, dtype=np.int64)
+    n_rows = len(machine_ids)
+    partial = np.zeros(n_rows * n_bins, dtype=np.int64)
+    diff = np.zeros(n_rows * (n_bins + 1), dtype=np.int64)
+    if not bookings.empty and n_rows:
+        w = bin_min * NS_PER_MIN
+        lo = _ns(start)
+        hi = lo + n_bins * w
+        row = bookings["machine_id"].map(pd.Series(np.arange(n_rows), index=machine_ids))
+        row = row.to_numpy(dtype=float, na_value=np.nan)
+        s = bookings["start"].to_numpy("datetime64[ns]").view(np.int64)
+        e = bookings["end"].to_numpy("datetime64[ns]").view(np.int64)
+        ok = ~np.isnan(row) & (s < hi) & (e > lo) & (e > s)
+        row = row[ok].astype(np.int64)
+        s, e = np.clip(s[ok], lo, hi) - lo, np.clip(e[ok], lo, hi) - lo
+        first, last = s // w, (e - 1) // w
+        same = first == last
+        np.add.at(partial, row * n_bins + first, np.where(same, e, (first + 1) * w) - s)
+        span = ~same
+        np.add.at(partial, row[span] * n_bins + last[span], e[span] - last[span] * w)
+        inner = last - first > 1
+        np.add.at(diff, row[inner] * (n_bins + 1) + first[inner] + 1, w)
+        np.add.at(diff, row[inner] * (n_bins + 1) + last[inner], -w)
+    grid = partial.reshape(n_rows, n_bins) + np.cumsum(diff.reshape(n_rows, n_bins + 1), axis=1)[:, :-1]
+    return grid / NS_PER_MIN
+
+GRID_PERIODS = {"Day": 30, "Week": 24 * 60, "Month": 24 * 60}  # bin width in minutes
+
+def grid_window(base_day: date, period: str):
+    """(start, number of bins, bin minutes) covering the day, Monday-based week or month of *base_day*."""
+    day = pd.Timestamp(base_day).normalize()
+    if period == "Week":
+        return day - pd.Timedelta(days=day.dayofweek), 7, GRID_PERIODS[period]
+    if period == "Month":
+        return day.replace(day=1), day.days_in_month, GRID_PERIODS[period]
+    return day, 24 * 60 // GRID_PERIODS["Day"], GRID_PERIODS["Day"]
+
+@timed(rows=len)
+def workshop_grid(store, base_day: date, period: str) -> pd.DataFrame:
+    """Machines × bins booked-minutes table for the day, week or month of *base_day*."""
+    start, n_bins, bin_min = grid_window(base_day, period)
+    M = store.table("Machines", ["machine_id", "machine_name"]).dropna(subset=["machine_id"])
+    B = store.bookings_in_range(start, start + pd.Timedelta(minutes=n_bins * bin_min))
+    grid = occupancy_grid(B, M["machine_id"].astype(int), start, n_bins, bin_min)
+    bins = start + pd.to_timedelta(np.arange(n_bins) * bin_min, unit="min")
+    labels = bins.strftime("%H:%M") if period == "Day" else bins.strftime("%a %d/%m")
+    rows = M["machine_id"].astype(int).astype(str) + " - " + M["machine_name"].astype(str)
+    out = pd.DataFrame(grid, index=rows.to_numpy(), columns=labels)
+    if period == "Day":
+        # trim to the hours anything is open or booked, keeping the table readable
+        oh = store.table("OperatingHours")
+        if {"_open_time_min", "_close_time_min"} <= set(oh.columns) and oh["_open_time_min"].notna().any():
+            lo, hi = int(oh["_open_time_min"].min()), int(oh["_close_time_min"].max())
+        else:
+            lo, hi = 8 * 60, 18 * 60
+        busy = np.flatnonzero(grid.sum(axis=0))
+        if len(busy):
+            lo, hi = min(lo, busy[0] * bin_min), max(hi, (busy[-1] + 1) * bin_min)
+        out = out.iloc[:, lo // bin_min:-(-hi // bin_min)]
+    return out
@@ -0,0 +1,184 @@
+"""Opening hours compiled into sorted open spans, shared by the booking checks and the slot search.
+
+OperatingHours may hold several rows per weekday (e.g. a morning and an evening session); rows
+with a machine_id give that machine its own weekly hours instead of the shed's. ClosedDates
+rows close the whole day, or only start_time–end_time when given, for the shed or, with a
+machine_id, for one machine. The calendar covers a window of days around today and is only
+recompiled when either sheet changes or a check reaches outside that window.
+"""
+from datetime import date, time
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from .indexes import _version, derived_cache
+from .perf import record, timed
+
+NS_PER_MIN = 60_000_000_000
+DAY_MIN = 24 * 60
+HOURS_PAST_DAYS = 31  # the compiled window starts this far back ...
+HOURS_AHEAD_MONTHS = 12  # ... and runs this far ahead
+
+def free_intervals(open_s, open_e, busy_s, busy_e):
+    """Open spans minus busy spans (int64 arrays) via one sort and two running counts."""
+    n_open, n_busy = len(open_s), len(busy_s)
+    t = np.concatenate([open_s, open_e, busy_s, busy_e])
+    d_open = np.concatenate([np.ones(n_open, np.int64), -np.ones(n_open, np.int64), np.zeros(2 * n_busy, np.int64)])
+    d_busy = np.concatenate([np.zeros(2 * n_open, np.int64), np.ones(n_busy, np.int64), -np.ones(n_busy, np.int64)])
+    order = np.argsort(t, kind="stable")
+    t = t[order]
+    free = (np.cumsum(d_open[order]) > 0) & (np.cumsum(d_busy[order]) == 0)
+    seg = free[:-1] & (t[1:] > t[:-1])  # state after the last event at t[i] holds until t[i+1]
+    fs, fe = t[:-1][seg], t[1:][seg]
+    if not len(fs):
+        return fs, fe
+    first = np.r_[True, fs[1:] != fe[:-1]]  # join pieces split only by a boundary event
+    return fs[first], fe[np.r_[first[1:], True]]
+
+def _floats(df: pd.DataFrame, col: str) -> np.ndarray:
+    """*col* as floats with NaN for blanks (or all NaN if the column is missing)."""
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+class OpeningCalendar:
+    """Open spans as sorted int64 ns arrays over the days [first, last), closures already removed.
+
+    Spans are kept per schedule: None for the shed, plus every machine that has its own hours or
+    its own closures. Each check is a binary search, vectorized over a batch of windows.
+    """
+
+    def __init__(self, hours: pd.DataFrame, closed: pd.DataFrame, first, last, version=None):
+        self.version = version
+        self.first, self.last = pd.Timestamp(first).normalize(), pd.Timestamp(last).normalize()
+        days = pd.date_range(self.first, self.last, freq="D", inclusive="left")
+        base, dow = days.values.view(np.int64), days.dayofweek.to_numpy()
+
+        h_mid, h_dow = _floats(hours, "machine_id"), _floats(hours, "day_of_week")
+        h_open, h_close = _floats(hours, "_open_time_min"), _floats(hours, "_close_time_min")
+        usable = ~np.isnan(h_dow) & ~np.isnan(h_open) & ~np.isnan(h_close) & (h_close > h_open)
+
+        c_day = pd.to_datetime(closed.get("date", pd.Series(dtype="datetime64[ns]")), errors="coerce").dt.normalize()
+        c_day = c_day.to_numpy("datetime64[ns]").view(np.int64)
+        c_mid = _floats(closed, "machine_id")
+        c_from = np.nan_to_num(_floats(closed, "_start_time_min"), nan=0)
+        c_to = np.nan_to_num(_floats(closed, "_end_time_min"), nan=DAY_MIN)
+        c_to = np.where(c_to > c_from, c_to, DAY_MIN)  # an unreadable window closes the whole day
+        c_ok = c_day != np.iinfo(np.int64).min  # NaT
+        c_s = c_day + (c_from * NS_PER_MIN).astype(np.int64)
+        c_e = c_day + (c_to * NS_PER_MIN).astype(np.int64)
+
+        def weekly(rows):
+            starts, ends = [], []
+            for d, o, c in zip(h_dow[rows], h_open[rows], h_close[rows]):
+                on = base[dow == int(d)]
+                starts.append(on + int(o) * NS_PER_MIN)
+                ends.append(on + int(c) * NS_PER_MIN)
+            empty = np.empty(0, np.int64)
+            return (np.concatenate(starts), np.concatenate(ends)) if starts else (empty, empty)
+
+        def closures(rows):
+            order = np.argsort(c_s[rows], kind="stable")
+            s, e = c_s[rows][order], c_e[rows][order]
+            return s, e, np.maximum.accumulate(e) if len(e) else e
+
+        shed_hours = weekly(usable & np.isnan(h_mid))
+        shed_closed = c_ok & np.isnan(c_mid)
+        own_hours = {int(m) for m in np.unique(h_mid[usable & ~np.isnan(h_mid)])}
+        own_closed = {int(m) for m in np.unique(c_mid[c_ok & ~np.isnan(c_mid)])}
+        self._spans, self._closed = {}, {}
+        for key in [None] + sorted(own_hours | own_closed):
+            open_s, open_e = shed_hours if key not in own_hours else weekly(usable & (h_mid == key))
+            rows = shed_closed if key is None else shed_closed | (c_ok & (c_mid == key))
+            cs, ce, run = self._closed[key] = closures(rows)
+            self._spans[key] = free_intervals(open_s, open_e, cs, ce)  # also merges overlapping rows
+
+    def covers(self, start, end) -> bool:
+        return self.first <= pd.Timestamp(start) and pd.Timestamp(end) <= self.last
+
+    def key(self, machine_id=None):
+        """The schedule *machine_id* follows: its own if it has one, else the shed's (None)."""
+        if machine_id is None or pd.isna(machine_id):
+            return None
+        return int(machine_id) if int(machine_id) in self._spans else None
+
+    def spans(self, key=None, start=None, end=None):
+        """(starts, ends) of the open spans of schedule *key* overlapping [start, end)."""
+        s, e = self._spans[key]
+        a = 0 if start is None else np.searchsorted(e, pd.Timestamp(start).value, "right")
+        b = len(s) if end is None else np.searchsorted(s, pd.Timestamp(end).value, "left")
+        return s[a:b], e[a:b]
+
+    def contains(self, key, starts, ends) -> np.ndarray:
+        """For each window [starts[i], ends[i]) (int64 ns): does one open span hold all of it?"""
+        s, e = self._spans[key]
+        starts, ends = np.asarray(starts, np.int64), np.asarray(ends, np.int64)
+        if not len(s):
+            return np.zeros(len(starts), bool)
+        i = np.searchsorted(s, starts, "right") - 1
+        return (i >= 0) & (ends <= e[np.maximum(i, 0)]) & (ends > starts)
+
+    def closed(self, key, starts, ends) -> np.ndarray:
+        """For each window: does a closure (holiday or maintenance) overlap it?"""
+        cs, _, run = self._closed[key]
+        starts, ends = np.asarray(starts, np.int64), np.asarray(ends, np.int64)
+        k = np.searchsorted(cs, ends, "left")
+        return (k > 0) & (run[np.maximum(k - 1, 0)] > starts) if len(cs) else np.zeros(len(starts), bool)
+
+    def open_on(self, key, days) -> np.ndarray:
+        """For each day (int64 ns at midnight): is schedule *key* open at any time that day?"""
+        s, e = self._spans[key]
+        days = np.asarray(days, np.int64)
+        i = np.searchsorted(e, days, "right")
+        return (i < len(s)) & (s[np.minimum(i, len(s) - 1)] < days + DAY_MIN * NS_PER_MIN) if len(s) else np.zeros(len(days), bool)
+
+    def describe(self, key, day) -> str:
+        """The open spans on *day* as text, e.g. "09:00–12:00, 18:00–21:00"."""
+        day = pd.Timestamp(day).normalize()
+        s, e = self.spans(key, day, day + pd.Timedelta(days=1))
+        return ", ".join(f"{pd.Timestamp(a):%H:%M}–{pd.Timestamp(b):%H:%M}" for a, b in zip(s, e))
+
+def opening_calendar(store, start=None, end=None) -> OpeningCalendar:
+    """The shared calendar, compiled once per version of OperatingHours and ClosedDates and widened
+    when a check reaches outside it; [start, end) defaults to today."""
+    t0 = perf_counter()
+    today = pd.Timestamp.today().normalize()
+    lo = pd.Timestamp(start if start is not None else today)
+    hi = pd.Timestamp(end) if end is not None else lo + pd.Timedelta(days=1)
+    ver = (_version(store, "OperatingHours"), _version(store, "ClosedDates"))
+    reg = derived_cache()
+    cal = reg.get("hours")
+    if cal is not None and None not in ver and cal.version == ver and cal.covers(lo, hi):
+        record("opening_calendar", (perf_counter() - t0) * 1000, hit=True)
+        return cal
+    first, last = today - pd.Timedelta(days=HOURS_PAST_DAYS), today + pd.DateOffset(months=HOURS_AHEAD_MONTHS)
+    if lo < first:  # reaching outside: go a good way past it, so nearby checks don't recompile again
+        first = lo.normalize() - pd.DateOffset(months=HOURS_AHEAD_MONTHS)
+    if hi > last:
+        last = hi.ceil("D") + pd.DateOffset(months=HOURS_AHEAD_MONTHS)
+    if cal is not None and cal.version == ver:
+        first, last = min(first, cal.first), max(last, cal.last)  # widen rather than move
+    fresh = OpeningCalendar(store.table("OperatingHours"), store.table("ClosedDates"), first, last, ver)
+    record("opening_calendar", (perf_counter() - t0) * 1000, rows=(last - first).days, hit=False)
+    if None not in ver and (cal is None or all(a >= b for a, b in zip(ver, cal.version))):
+        reg["hours"] = fresh
+    return fresh
+
+@timed()
+def is_open(store, d: date, start_t: time, end_t: time, machine_id=None):
+    """Check a window on day *d* against the opening calendar (hours, closures and, given
+    *machine_id*, that machine's own hours); returns (ok, the day's hours or why it's closed)."""
+    day = pd.Timestamp(d).normalize()
+    s = day + pd.Timedelta(minutes=start_t.hour * 60 + start_t.minute)
+    e = day + pd.Timedelta(minutes=end_t.hour * 60 + end_t.minute)
+    if e <= s:
+        e += pd.Timedelta(days=1)  # runs past midnight
+    cal = opening_calendar(store, day, e)
+    key = cal.key(machine_id)
+    hours = cal.describe(key, day)
+    if cal.contains(key, [s.value], [e.value])[0]:
+        return True, hours
+    if cal.closed(key, [s.value], [e.value])[0]:
+        return False, "Closed (holiday/maintenance)"
+    return False, hours or "Closed"
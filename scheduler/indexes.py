@@ -0,0 +1,238 @@
+"""Shared indexes derived from the data: bookings per machine, entitlements and label maps."""
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from .perf import record
+
+_DERIVED = {}
+
+def derived_cache() -> dict:
+    """Process-wide indexes derived from the data, each tagged with the version of its source sheet."""
+    return _DERIVED
+
+def _version(store, name: str):
+    """Sheet *name*'s version in this store's snapshot, or None if the snapshot isn't versioned."""
+    versions = getattr(store.sheets, "versions", None)
+    return None if versions is None else versions.get(name, 0)
+
+def _ns(ts) -> int:
+    return pd.Timestamp(ts).value
+
+class BookingIndex:
+    """Per-machine bookings as start-sorted int64 arrays for O(log n) range and overlap queries.
+
+    Alongside starts/ends it keeps a running max of ends, so "everything before i ends by t"
+    is a single searchsorted even if legacy data contains overlapping bookings.
+    """
+
+    def __init__(self, bookings: pd.DataFrame, version: int = None):
+        self.version = version
+        self.size = len(bookings)  # row positions handed out so far
+        self._by_machine = {}
+        if bookings.empty or not {"machine_id", "start", "end"} <= set(bookings.columns):
+            return
+        mid = pd.to_numeric(bookings["machine_id"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        s = pd.to_datetime(bookings["start"], errors="coerce")
+        e = pd.to_datetime(bookings["end"], errors="coerce")
+        ok = ~np.isnan(mid) & s.notna().to_numpy() & e.notna().to_numpy()
+        pos = np.flatnonzero(ok)
+        if not len(pos):
+            return
+        mid = mid[ok].astype(np.int64)
+        s = s.to_numpy("datetime64[ns]").view(np.int64)[ok]
+        e = e.to_numpy("datetime64[ns]").view(np.int64)[ok]
+        order = np.lexsort((s, mid))
+        mid, s, e, pos = mid[order], s[order], e[order], pos[order]
+        cuts = np.flatnonzero(np.diff(mid)) + 1
+        for m, ss, ee, pp in zip(mid[np.r_[0, cuts]], np.split(s, cuts), np.split(e, cuts), np.split(pos, cuts)):
+            self._by_machine[int(m)] = (ss, ee, np.maximum.accumulate(ee), pp)
+
+    def query(self, machine_id: int, start, end) -> np.ndarray:
+        """Row positions of bookings on *machine_id* overlapping [start, end), ordered by start."""
+        part = self._by_machine.get(int(machine_id))
+        if part is None:
+            return np.empty(0, dtype=np.int64)
+        s, e, run_max, pos = part
+        lo, hi = _ns(start), _ns(end)
+        a = np.searchsorted(run_max, lo, "right")  # before a, every booking ends by lo
+        b = np.searchsorted(s, hi, "left")  # from b on, every booking starts at/after hi
+        if a >= b:
+            return np.empty(0, dtype=np.int64)
+        return pos[a:b][e[a:b] > lo]
+
+    def intervals(self, machine_id: int, start, end):
+        """(starts, ends) as int64 ns for bookings on *machine_id* overlapping [start, end)."""
+        part = self._by_machine.get(int(machine_id))
+        if part is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        s, e, run_max, _ = part
+        lo, hi = _ns(start), _ns(end)
+        a, b = np.searchsorted(run_max, lo, "right"), np.searchsorted(s, hi, "left")
+        hit = e[a:b] > lo
+        return s[a:b][hit], e[a:b][hit]
+
+    def overlaps(self, machine_id: int, start, end) -> bool:
+        part = self._by_machine.get(int(machine_id))
+        if part is None:
+            return False
+        s, _, run_max, _ = part
+        b = np.searchsorted(s, _ns(end), "left")
+        return bool(b and run_max[b - 1] > _ns(start))
+
+    def add(self, machine_id, start, end):
+        """Insert one booking appended at the next row position, without rebuilding."""
+        pos = self.size
+        self.size += 1
+        if pd.isna(machine_id) or pd.isna(start) or pd.isna(end):
+            return
+        m = int(machine_id)
+        empty = np.empty(0, dtype=np.int64)
+        s, e, _, p = self._by_machine.get(m, (empty, empty, empty, empty))
+        lo, hi = _ns(start), _ns(end)
+        i = np.searchsorted(s, lo, "right")
+        e = np.insert(e, i, hi)
+        # swap in a whole new tuple so concurrent readers see either the old or the new arrays
+        self._by_machine[m] = (np.insert(s, i, lo), e, np.maximum.accumulate(e), np.insert(p, i, pos))
+
+def booking_index(store) -> BookingIndex:
+    """The shared index for this store's snapshot, built once per version of the Bookings sheet."""
+    t0 = perf_counter()
+    ver = _version(store, "Bookings")
+    reg = derived_cache()
+    idx = reg.get("bookings")
+    if idx is not None and ver is not None and idx.version == ver:
+        record("booking_index", (perf_counter() - t0) * 1000, hit=True)
+        return idx
+    B = store.table("Bookings")
+    idx = BookingIndex(B, ver)
+    record("booking_index", (perf_counter() - t0) * 1000, rows=len(B), hit=False)
+    current = reg.get("bookings")
+    if ver is not None and (current is None or current.version is None or current.version < ver):
+        reg["bookings"] = idx
+    return idx
+
+class EntitlementIndex:
+    """Active licences per member and active holders per licence on one day.
+
+    valid_until is the next day any licence starts or lapses; the index is stale from then on
+    even if no one has committed anything.
+    """
+
+    def __init__(self, user_licences: pd.DataFrame, version: int = None, today: pd.Timestamp = None):
+        self.version = version
+        self.today = pd.Timestamp(today).normalize() if today is not None else pd.Timestamp.today().normalize()
+        self.valid_until = None
+        self.by_user, self.by_licence = {}, {}
+        cols = ["user_id", "licence_id", "valid_from", "valid_to"]
+        if user_licences.empty or not set(cols) <= set(user_licences.columns):
+            return
+        UL = user_licences[cols].dropna(subset=["user_id", "licence_id"])
+        vf, vt = pd.to_datetime(UL["valid_from"], errors="coerce"), pd.to_datetime(UL["valid_to"], errors="coerce")
+        active = UL[(vf <= self.today) & (vt >= self.today)].astype({"user_id": int, "licence_id": int})
+        self.by_user = {int(k): frozenset(v) for k, v in active.groupby("user_id")["licence_id"]}
+        self.by_licence = {int(k): frozenset(v) for k, v in active.groupby("licence_id")["user_id"]}
+        # a licence counts from the first day on/after valid_from until the day after valid_to
+        starts = vf[vf > self.today].dt.ceil("D")
+        lapses = vt[vt >= self.today].dt.floor("D") + pd.Timedelta(days=1)
+        upcoming = pd.concat([starts, lapses]).dropna()
+        self.valid_until = upcoming.min() if not upcoming.empty else None
+
+    def current(self, today: pd.Timestamp = None) -> bool:
+        today = pd.Timestamp(today).normalize() if today is not None else pd.Timestamp.today().normalize()
+        return today >= self.today and (self.valid_until is None or today < self.valid_until)
+
+    def licences(self, user_id: int) -> frozenset:
+        return self.by_user.get(int(user_id), frozenset())
+
+    def holders(self, licence_id: int) -> frozenset:
+        return self.by_licence.get(int(licence_id), frozenset())
+
+    def add(self, user_id, licence_id, valid_from, valid_to):
+        """Fold in one newly granted licence without rebuilding."""
+        if pd.isna(user_id) or pd.isna(licence_id):
+            return
+        u, l = int(user_id), int(licence_id)
+        vf, vt = pd.Timestamp(valid_from), pd.Timestamp(valid_to)
+        if pd.notna(vf) and pd.notna(vt) and vf <= self.today <= vt:
+            self.by_user[u] = self.licences(u) | {l}
+            self.by_licence[l] = self.holders(l) | {u}
+        for edge in (vf.ceil("D") if pd.notna(vf) and vf > self.today else None,
+                     vt.floor("D") + pd.Timedelta(days=1) if pd.notna(vt) and vt >= self.today else None):
+            if edge is not None and (self.valid_until is None or edge < self.valid_until):
+                self.valid_until = edge
+
+def entitlements(store) -> EntitlementIndex:
+    """The shared entitlement index for this snapshot; rebuilt per UserLicences version or licence boundary."""
+    t0 = perf_counter()
+    ver = _version(store, "UserLicences")
+    reg = derived_cache()
+    idx = reg.get("entitlements")
+    if idx is not None and ver is not None and idx.version == ver and idx.current():
+        record("entitlements", (perf_counter() - t0) * 1000, hit=True)
+        return idx
+    today = pd.Timestamp.today().normalize()
+    UL = store.licences_from(today)  # lapsed grants can't matter from today on
+    idx = EntitlementIndex(UL, ver, today)
+    record("entitlements", (perf_counter() - t0) * 1000, rows=len(UL), hit=False)
+    current = reg.get("entitlements")
+    if ver is not None and (current is None or current.version is None or current.version <= ver):
+        reg["entitlements"] = idx
+    return idx
+
+LABEL_KEYS = {"Users": "user_id", "Machines": "machine_id", "Licences": "licence_id"}  # lookup sheet → id column
+
+def labels(store, sheet: str, column: str) -> pd.Series:
+    """id → *column* Series for one of the LABEL_KEYS sheets, shared across sessions.
+
+    The maps are tagged with the version of *sheet* they were built from, so commits to other
+    sheets leave them alone.
+    """
+    t0 = perf_counter()
+    ver = _version(store, sheet)
+    reg = derived_cache().setdefault("labels", {})
+    entry = reg.get(sheet)
+    if entry is None or ver is None or entry[0] != ver:
+        entry = (ver, {})
+        current = reg.get(sheet)
+        if ver is not None and (current is None or current[0] < ver):
+            reg[sheet] = entry
+    maps = entry[1]
+    hit = column in maps
+    if not hit:
+        key = LABEL_KEYS[sheet]
+        T = store.table(sheet, [key, column])
+        if {key, column} <= set(T.columns):
+            maps[column] = T.dropna(subset=[key]).drop_duplicates(key).set_index(key)[column]
+        else:
+            maps[column] = pd.Series(dtype=object)
+    record("labels", (perf_counter() - t0) * 1000, rows=None if hit else len(maps[column]), hit=hit)
+    return maps[column]
+
+def label_of(store, sheet: str, column: str, key, default: str = "") -> str:
+    """Single-row label lookup, e.g. a member's name from their user_id."""
+    value = labels(store, sheet, column).get(key)
+    return default if value is None or pd.isna(value) else str(value)
+
+def _index_commit(changes: dict, before: dict, after: dict):
+    """Fold freshly committed rows (sheet → appended rows) into the shared indexes current before the commit.
+
+    *before*/*after* are the changed sheets' versions around the commit. Indexes over sheets that
+    did not change stay valid as they are; those over sheets that were replaced rebuild on demand.
+    """
+    reg = derived_cache()
+    idx = reg.get("bookings")
+    if "Bookings" in changes and idx is not None and idx.version == before.get("Bookings"):
+        for r in changes["Bookings"].itertuples(index=False):
+            idx.add(r.machine_id, r.start, r.end)
+        idx.version = after["Bookings"]
+    use = reg.get("utilisation")
+    if "Bookings" in changes and use is not None and use.version == before.get("Bookings"):
+        use.add(changes["Bookings"])
+        use.version = after["Bookings"]
+    ent = reg.get("entitlements")
+    if "UserLicences" in changes and ent is not None and ent.version == before.get("UserLicences"):
+        for r in changes["UserLicences"].itertuples(index=False):
+            ent.add(r.user_id, r.licence_id, r.valid_from, r.valid_to)
+        ent.version = after["UserLicences"]
@@ -0,0 +1,132 @@
+"""Timing hooks for data IO and helpers: a bounded in-memory ring, optionally mirrored to JSON lines.
+
+Each record is one call: name, wall time, and where it applies whether a cache was hit and
+how many rows were scanned. The ring is process-wide, so in the app it covers every session.
+Set SCHEDULER_PERF_LOG to a file path to append records there as well.
+"""
+import atexit
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+import pandas as pd
+
+PERF_RING = int(os.environ.get("SCHEDULER_PERF_RING", 5000))  # most recent calls kept in memory
+LOG_BATCH = 200  # records buffered before they are appended to the log
+
+_RING = deque(maxlen=PERF_RING)
+_LOG = {"path": os.environ.get("SCHEDULER_PERF_LOG") or None, "pending": []}
+_log_lock = threading.Lock()
+
+def record(name: str, ms: float, rows: int = None, hit: bool = None, **fields):
+    rec = {"at": round(time.time(), 3), "name": name, "ms": round(ms, 3)}
+    if rows is not None:
+        rec["rows"] = int(rows)
+    if hit is not None:
+        rec["hit"] = bool(hit)
+    rec.update(fields)
+    _RING.append(rec)
+    if _LOG["path"]:
+        _LOG["pending"].append(rec)
+        if len(_LOG["pending"]) >= LOG_BATCH:
+            flush()
+
+@contextmanager
+def span(name: str, **fields):
+    """Time the block; set rec["rows"] / rec["hit"] inside it to record them too."""
+    rec = dict(fields)
+    t0 = perf_counter()
+    try:
+        yield rec
+    finally:
+        record(name, (perf_counter() - t0) * 1000, **rec)
+
+def timed(name: str = None, rows=None):
+    """Decorator recording each call under *name* (default the function name).
+
+    *rows* maps the return value to a row count, e.g. ``len``.
+    """
+    def wrap(fn):
+        label = name or fn.__name__
+
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = perf_counter()
+            result = fn(*args, **kwargs)
+            n = rows(result) if rows is not None and result is not None else None
+            record(label, (perf_counter() - t0) * 1000, rows=n)
+            return result
+        return inner
+    return wrap
+
+def records() -> list:
+    return list(_RING)
+
+def clear():
+    _RING.clear()
+
+def log_path():
+    return _LOG["path"]
+
+def log_to(path):
+    """Start appending records to *path* (JSON lines), or stop with None."""
+    flush()
+    _LOG["path"] = str(path) if path else None
+
+def flush():
+    """Append buffered records to the log file."""
+    with _log_lock:
+        pending, _LOG["pending"] = _LOG["pending"], []
+        if not pending or not _LOG["path"]:
+            return
+        try:
+            with open(_LOG["path"], "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r) + "\n" for r in pending))
+        except OSError:
+            pass  # timing is best effort
+
+atexit.register(flush)
+
+def summary(recs: list = None) -> pd.DataFrame:
+    """Per name: calls, p50/p95/max/total ms, cache hit rate and mean rows per call."""
+    cols = ["name", "calls", "p50_ms", "p95_ms", "max_ms", "total_ms", "hit_rate", "rows_per_call"]
+    df = pd.DataFrame(records() if recs is None else recs)
+    if df.empty:
+        return pd.DataFrame(columns=cols)
+    for c in ("hit", "rows"):
+        if c not in df.columns:
+            df[c] = None
+    g = df.groupby("name")
+    out = pd.DataFrame({
+        "calls": g.size(),
+        "p50_ms": g["ms"].median(),
+        "p95_ms": g["ms"].quantile(0.95),
+        "max_ms": g["ms"].max(),
+        "total_ms": g["ms"].sum(),
+        "hit_rate": g["hit"].apply(lambda h: h.dropna().astype(float).mean() if h.notna().any() else None),
+        "rows_per_call": g["rows"].apply(lambda r: r.dropna().astype(float).mean() if r.notna().any() else None),
+    }).reset_index()
+    return out[cols].sort_values("total_ms", ascending=False).round(2)
+
+def start_profile() -> cProfile.Profile:
+    prof = cProfile.Profile()
+    prof.enable()
+    return prof
+
+def profile_report(prof: cProfile.Profile, limit: int = 40) -> dict:
+    """Stop *prof*; return the top *limit* functions by cumulative time as text, plus a .prof dump."""
+    prof.disable()
+    out = io.StringIO()
+    stats = pstats.Stats(prof, stream=out)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+    prof.create_stats()
+    return {"text": out.getvalue(), "prof": marshal.dumps(prof.stats), "at": pd.Timestamp.now().isoformat(timespec="seconds")}
@@ -0,0 +1,309 @@
+"""Licence-expiry, service-due, renewal and newsletter reminders, sent by a background worker.
+
+Each run scans UserLicences, Subscriptions and Machines in a few vectorized passes, groups
+what's due into one message per member plus one digest for the admins, and hands them to a
+sender: .eml files in data/outbox by default, or SMTP. Every item has a key (e.g.
+"licence:7:3:2026-11-01"), and the Reminders sheet records which keys were claimed and
+whether their message went out. A key is claimed under the commit lock before sending, so two
+runs never send it twice, and only a failed send is retried. A run that dies between claiming
+and sending loses those reminders rather than repeating them.
+"""
+import smtplib
+import threading
+from collections import deque
+from email.message import EmailMessage
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from .commit import commit_rows
+from .db import DATA, commit_lock
+from .indexes import labels
+from .perf import record
+from .rules import get_setting
+from .storage import open_store
+
+OUTBOX = DATA / "outbox"
+RECORD_COLUMNS = ["reminder_id", "key", "kind", "user_id", "to", "result", "at", "detail"]
+# Settings keys and their defaults
+DEFAULTS = {
+    "reminders_enabled": "true",
+    "reminder_interval_minutes": "60",
+    "reminder_sender": "outbox",  # or "smtp"
+    "reminder_licence_days": "14",
+    "reminder_renewal_days": "30",
+    "reminder_service_days": "7",
+    "reminder_admin_email": "",  # blank: every admin with an email address
+    "smtp_host": "localhost",
+    "smtp_port": "1025",  # a local stand-in such as `python -m aiosmtpd -n` listens here
+    "smtp_from": "scheduler@localhost",
+    "smtp_user": "",
+    "smtp_password": "",
+    "smtp_starttls": "false",
+}
+TEMPLATES = {
+    "reminder_member": "Hi {name},\n\n{items}\n\n{org}",
+    "reminder_digest": "Due soon at {org}:\n\n{items}\n",
+}
+FIRST_RUN_DELAY = 60  # seconds after the app starts, so starting up stays quick
+RUN_HISTORY = 50
+
+def setting(store, key: str) -> str:
+    value = get_setting(store.sheets, key, DEFAULTS.get(key, ""))
+    return DEFAULTS.get(key, "") if value in ("", "nan", "None") else value
+
+def template(store, key: str) -> str:
+    """Templates sheet text for *key*, else the built-in default (blank if there is none)."""
+    T = store.table("Templates", ["key", "text"])
+    row = T[T["key"] == key] if "key" in T.columns else T.iloc[:0]
+    return TEMPLATES.get(key, "") if row.empty or pd.isna(row.iloc[0]["text"]) else str(row.iloc[0]["text"])
+
+def _fill(text: str, **values) -> str:
+    """*text* with {name}-style placeholders replaced; other braces are left alone."""
+    for k, v in values.items():
+        text = text.replace("{" + k + "}", str(v))
+    return text
+
+def _day(s: pd.Series) -> pd.Series:
+    return pd.to_datetime(s, errors="coerce").dt.strftime("%d/%m/%Y")
+
+def _ids(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(s, errors="coerce").astype("Int64").astype(str)
+
+ITEM_COLUMNS = ["key", "kind", "user_id", "line"]
+
+def due_items(store, today=None) -> pd.DataFrame:
+    """Everything due a reminder on *today*, one row per item: key, kind, user_id (blank for the
+    admin digest) and the line that goes in the message."""
+    today = pd.Timestamp(today if today is not None else pd.Timestamp.today()).normalize()
+    days = {k: int(float(setting(store, f"reminder_{k}_days"))) for k in ("licence", "renewal", "service")}
+    parts = []
+    # licences: the latest grant per member and licence, ending within the window
+    UL = store.table("UserLicences", ["user_id", "licence_id", "valid_to"]).dropna()
+    if len(UL.columns) == 3 and not UL.empty:
+        last = UL.groupby(["user_id", "licence_id"], as_index=False, observed=True)["valid_to"].max()
+        due = last[last["valid_to"].between(today, today + pd.Timedelta(days=days["licence"]))]
+        name = due["licence_id"].map(labels(store, "Licences", "licence_name")).fillna("machine").astype(str)
+        parts.append(pd.DataFrame({
+            "key": "licence:" + _ids(due["user_id"]) + ":" + _ids(due["licence_id"]) + ":" + due["valid_to"].dt.strftime("%Y-%m-%d"),
+            "kind": "licence",
+            "user_id": due["user_id"].astype("Int32"),
+            "line": "Your " + name + " licence expires on " + _day(due["valid_to"]) + ".",
+        }))
+    # memberships: the latest subscription per member, ending within the window
+    S = store.table("Subscriptions", ["user_id", "end_date"]).dropna()
+    if len(S.columns) == 2 and not S.empty:
+        last = S.groupby("user_id", as_index=False, observed=True)["end_date"].max()
+        due = last[last["end_date"].between(today, today + pd.Timedelta(days=days["renewal"]))]
+        parts.append(pd.DataFrame({
+            "key": "renewal:" + _ids(due["user_id"]) + ":" + due["end_date"].dt.strftime("%Y-%m-%d"),
+            "kind": "renewal",
+            "user_id": due["user_id"].astype("Int32"),
+            "line": "Your membership ends on " + _day(due["end_date"]) + "; renew to keep booking.",
+        }))
+    # machines due (or overdue) a service, for the admins
+    M = store.table("Machines", ["machine_id", "machine_name", "next_service_due"]).dropna(subset=["machine_id", "next_service_due"])
+    if "next_service_due" in M.columns and not M.empty:
+        due = M[M["next_service_due"] <= today + pd.Timedelta(days=days["service"])]
+        late = np.where(due["next_service_due"] < today, " (overdue)", "")
+        parts.append(pd.DataFrame({
+            "key": "service:" + _ids(due["machine_id"]) + ":" + due["next_service_due"].dt.strftime("%Y-%m-%d"),
+            "kind": "service",
+            "user_id": pd.array([pd.NA] * len(due), dtype="Int32"),
+            "line": due["machine_name"].astype(str) + " (#" + _ids(due["machine_id"]) + ") service due " + _day(due["next_service_due"]) + late,
+        }))
+    # the monthly newsletter, from its issue day on
+    issue_day = pd.to_numeric(get_setting(store.sheets, "newsletter_issue_day", ""), errors="coerce")
+    if pd.notna(issue_day) and today.day >= issue_day:
+        prompt = template(store, "newsletter_prompt")
+        line = "This month's newsletter is due." + (f" Prompt:\n{prompt}" if prompt else "")
+        parts.append(pd.DataFrame({"key": [f"newsletter:{today:%Y-%m}"], "kind": "newsletter", "user_id": pd.array([pd.NA], dtype="Int32"), "line": line}))
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=ITEM_COLUMNS)
+    return pd.concat(parts, ignore_index=True)[ITEM_COLUMNS]
+
+def settled_keys(store) -> set:
+    """Keys whose latest record is a claim or a send; failed ones may go again."""
+    R = store.table("Reminders", ["reminder_id", "key", "result"])
+    if R.empty or "key" not in R.columns:
+        return set()
+    latest = R.sort_values("reminder_id", kind="stable").drop_duplicates("key", keep="last")
+    return set(latest.loc[latest["result"] != "failed", "key"])
+
+def admin_emails(store) -> list:
+    fixed = setting(store, "reminder_admin_email")
+    if fixed:
+        return [e.strip() for e in fixed.replace(";", ",").split(",") if e.strip()]
+    U = store.table("Users", ["role", "email"]).dropna()
+    return sorted(set(U.loc[U["role"].astype(object) == "admin", "email"].astype(str))) if "email" in U.columns else []
+
+def build_messages(store, items: pd.DataFrame) -> list:
+    """One message per member with their items, plus one digest of the admin items.
+
+    Each message is a dict: to (list), subject, body, and items (the rows it covers).
+    """
+    org = get_setting(store.sheets, "org_name", "the workshop")
+    messages = []
+    mine = items[items["user_id"].notna()]
+    if not mine.empty:
+        email, name = labels(store, "Users", "email"), labels(store, "Users", "name")
+        for uid, group in mine.groupby("user_id", sort=True):
+            to = email.get(uid)
+            messages.append({
+                "to": [str(to)] if pd.notna(to) and str(to).strip() else [],
+                "subject": f"{org}: reminder" + ("s" if len(group) > 1 else ""),
+                "body": _fill(template(store, "reminder_member"), name=name.get(uid, "member"), items="\n".join("- " + group["line"]), org=org),
+                "items": group,
+            })
+    digest = items[items["user_id"].isna()]
+    if not digest.empty:
+        messages.append({
+            "to": admin_emails(store),
+            "subject": f"{org}: admin digest {pd.Timestamp.today():%d/%m/%Y}",
+            "body": _fill(template(store, "reminder_digest"), items="\n".join("- " + digest["line"]), org=org),
+            "items": digest,
+        })
+    return messages
+
+def _email(msg: dict, sender: str) -> EmailMessage:
+    out = EmailMessage()
+    out["From"], out["To"], out["Subject"] = sender, ", ".join(msg["to"]), msg["subject"]
+    out.set_content(msg["body"])
+    return out
+
+class OutboxSender:
+    """Writes each message as an .eml file under data/outbox instead of sending it."""
+
+    def __init__(self, folder=OUTBOX, sender: str = DEFAULTS["smtp_from"]):
+        self.folder, self.sender = folder, sender
+
+    def send(self, messages: list) -> list:
+        self.folder.mkdir(parents=True, exist_ok=True)
+        stamp = pd.Timestamp.now().strftime("%Y%m%d-%H%M%S")
+        errors = []
+        for i, msg in enumerate(messages):
+            try:
+                (self.folder / f"{stamp}-{i:04d}.eml").write_bytes(bytes(_email(msg, self.sender)))
+                errors.append(None)
+            except OSError as e:
+                errors.append(str(e))
+        return errors
+
+class SmtpSender:
+    """Sends every message of a run over one SMTP connection."""
+
+    def __init__(self, host: str, port: int, sender: str, user: str = "", password: str = "", starttls: bool = False):
+        self.host, self.port, self.sender = host, port, sender
+        self.user, self.password, self.starttls = user, password, starttls
+
+    def send(self, messages: list) -> list:
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+        except (OSError, smtplib.SMTPException) as e:
+            return [f"Can't send through {self.host}:{self.port}: {e}"] * len(messages)
+        errors = []
+        with smtp:
+            for msg in messages:
+                try:
+                    smtp.send_message(_email(msg, self.sender))
+                    errors.append(None)
+                except smtplib.SMTPException as e:
+                    errors.append(str(e))
+        return errors
+
+SENDERS = {
+    "outbox": lambda store: OutboxSender(sender=setting(store, "smtp_from")),
+    "smtp": lambda store: SmtpSender(
+        setting(store, "smtp_host"),
+        int(float(setting(store, "smtp_port"))),
+        setting(store, "smtp_from"),
+        setting(store, "smtp_user"),
+        setting(store, "smtp_password"),
+        setting(store, "smtp_starttls").strip().lower() in ("true", "yes", "1"),
+    ),
+}  # name → factory(store); a sender's send(messages) returns an error (or None) per message
+
+def _records(items: pd.DataFrame, to: list, result: str, detail: str = "") -> pd.DataFrame:
+    return pd.DataFrame({
+        "reminder_id": None,
+        "key": items["key"].to_numpy(),
+        "kind": items["kind"].to_numpy(),
+        "user_id": items["user_id"].to_numpy(),
+        "to": ", ".join(to),
+        "result": result,
+        "at": pd.Timestamp.now().floor("s"),
+        "detail": detail,
+    }, columns=RECORD_COLUMNS)
+
+def run_reminders(store=None, sender=None, today=None, dry_run: bool = False) -> dict:
+    """One pass: claim the items not already settled, send their messages and record the outcome.
+
+    Returns a summary of the run; with *dry_run* nothing is claimed or sent.
+    """
+    t0 = perf_counter()
+    run = {"started": pd.Timestamp.now().floor("s"), "items": 0, "messages": 0, "sent": 0, "failed": 0, "no_address": 0}
+    store = store or open_store()
+    with commit_lock():
+        store = store.fresh()
+        items = due_items(store, today)
+        items = items[~items["key"].isin(settled_keys(store))]
+        messages = build_messages(store, items)
+        run["no_address"] = sum(len(m["items"]) for m in messages if not m["to"])  # left unclaimed until there's an address
+        messages = [m for m in messages if m["to"]]
+        run["items"], run["messages"] = sum(len(m["items"]) for m in messages), len(messages)
+        if dry_run:
+            run["preview"] = messages
+        elif messages:
+            commit_rows(store, "Reminders", pd.concat([_records(m["items"], m["to"], "claimed") for m in messages], ignore_index=True), key="reminder_id")
+    if messages and not dry_run:
+        sender = sender or SENDERS.get(setting(store, "reminder_sender"), SENDERS["outbox"])(store)
+        errors = sender.send(messages)
+        done = [_records(m["items"], m["to"], "failed" if err else "sent", err or "") for m, err in zip(messages, errors)]
+        commit_rows(open_store(), "Reminders", pd.concat(done, ignore_index=True), key="reminder_id")
+        run["failed"] = sum(len(m["items"]) for m, err in zip(messages, errors) if err)
+        run["sent"] = run["items"] - run["failed"]
+    run["ms"] = round((perf_counter() - t0) * 1000, 1)
+    record("reminders_run", run["ms"], rows=run["sent"])
+    return run
+
+class ReminderWorker(threading.Thread):
+    """Runs run_reminders every reminder_interval_minutes on a daemon thread, off the request path.
+
+    run_now() wakes it early; runs keeps the summaries of the latest runs, newest last.
+    """
+
+    def __init__(self, first_delay: float = FIRST_RUN_DELAY):
+        super().__init__(name="reminders", daemon=True)
+        self.runs = deque(maxlen=RUN_HISTORY)
+        self.next_run = pd.Timestamp.now() + pd.Timedelta(seconds=first_delay)
+        self._wake, self._halt = threading.Event(), threading.Event()
+
+    def run_now(self):
+        self._wake.set()
+
+    def stop(self):
+        self._halt.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._halt.is_set():
+            self._wake.wait(max(0.0, (self.next_run - pd.Timestamp.now()).total_seconds()))
+            if self._halt.is_set():
+                break
+            forced = self._wake.is_set()
+            self._wake.clear()
+            try:
+                store = open_store()
+                interval = float(setting(store, "reminder_interval_minutes"))
+                if forced or setting(store, "reminders_enabled").strip().lower() in ("true", "yes", "1"):
+                    self.runs.append(run_reminders(store))
+            except Exception as e:  # keep the worker alive; the failure shows in the run history
+                interval = float(DEFAULTS["reminder_interval_minutes"])
+                self.runs.append({"started": pd.Timestamp.now().floor("s"), "error": f"{type(e).__name__}: {e}"})
+            self.next_run = pd.Timestamp.now() + pd.Timedelta(minutes=max(interval, 1))
@@ -0,0 +1,105 @@
+"""Booking rules and lookups shared by the app and the CLI."""
+import re
+from datetime import date, time, timedelta
+
+import pandas as pd
+
+from .indexes import entitlements, labels
+from .perf import timed
+
+def ensure_sheet(sheets: dict, name: str, columns: list) -> pd.DataFrame:
+    if name not in sheets or not isinstance(sheets[name], pd.DataFrame):
+        sheets[name] = pd.DataFrame(columns=columns)
+    # add any missing columns (won't drop extras)
+    for c in columns:
+        if c not in sheets[name].columns:
+            sheets[name][c] = None
+    return sheets[name]
+
+def get_setting(sheets: dict, key: str, default: str = "") -> str:
+    S = sheets.get("Settings", pd.DataFrame(columns=["key", "value"]))
+    row = S[S["key"] == key]
+    return default if row.empty else str(row.iloc[0]["value"])
+
+def parse_hhmm_or_ampm(s: str):
+    """Accept '9:00', '09:00', '9am', '5:30pm', '17', '1700' etc → (h, m) or None."""
+    if s is None:
+        return None
+    try:
+        s = str(s).strip()
+        if not s:
+            return None
+        s2 = s.lower().replace(" ", "")
+        ampm = None
+        if s2.endswith("am") or s2.endswith("pm"):
+            ampm = s2[-2:]
+            s2 = s2[:-2]
+        # accept 1700 style
+        if re.fullmatch(r"\d{3,4}", s2):
+            if len(s2) == 3:
+                h = int(s2[0])
+                m = int(s2[1:])
+            else:
+                h = int(s2[:2])
+                m = int(s2[2:])
+            if ampm == "pm" and h != 12:
+                h += 12
+            if ampm == "am" and h == 12:
+                h = 0
+            return h, m
+        parts = re.split(r"[:h]", s2)
+        h = int(parts[0])
+        m = int(parts[1]) if len(parts) > 1 else 0
+        if ampm == "pm" and h != 12:
+            h += 12
+        if ampm == "am" and h == 12:
+            h = 0
+        return h, m
+    except Exception:
+        return None
+
+@timed(rows=len)
+def user_licence_ids(store, uid: int) -> set:
+    return set(entitlements(store).licences(uid))
+
+def machine_lists_for_user(store, uid: int):
+    lids = user_licence_ids(store, uid)
+    M = store.table("Machines", ["machine_id", "machine_name", "licence_id", "max_duration_minutes"])
+    allowed = M[M["licence_id"].isin(lids)]
+    blocked = M[~M["licence_id"].isin(lids)]
+    return allowed, blocked
+
+@timed(rows=len)
+def day_bookings(store, machine_id: int, d: date) -> pd.DataFrame:
+    ds = pd.Timestamp.combine(d, time(0, 0))
+    de = ds + timedelta(days=1)
+    view = store.bookings_between(machine_id, ds, de)
+    return view.sort_values("start") if not view.empty else view
+
+@timed(rows=len)
+def week_bookings(store, machine_id: int, base_day: date) -> pd.DataFrame:
+    """The Calendar's week view: one row per booking on *machine_id* in the week of *base_day*."""
+    start_w = base_day - timedelta(days=base_day.weekday())
+    rows = []
+    for d in range(7):
+        dd = start_w + timedelta(days=d)
+        for r in day_bookings(store, machine_id, dd).itertuples():
+            rows.append([dd.strftime("%d/%m/%Y"), r.start.strftime("%H:%M"), r.end.strftime("%H:%M"), getattr(r, "purpose", ""), r.user_id])
+    W = pd.DataFrame(rows, columns=["day", "start", "end", "purpose", "user_id"])
+    W = make_human(W, store)
+    if "name" in W.columns:
+        W = W[["day", "start", "end", "name", "purpose"]]
+    return W
+
+HUMAN_LABELS = [("user_id", "Users", "name"), ("machine_id", "Machines", "machine_name"), ("licence_id", "Licences", "licence_name")]
+
+@timed(rows=len)
+def make_human(df: pd.DataFrame, store) -> pd.DataFrame:
+    """Add human-friendly labels for user/machine/licence ids where possible."""
+    if df is None or df.empty:
+        return df
+    df = df.copy()
+    for key, sheet, column in HUMAN_LABELS:
+        if key in df.columns:
+            df[column] = df[key].map(labels(store, sheet, column))
+    return df
@@ -0,0 +1,79 @@
+"""Typed sheet schemas applied once at load."""
+import hashlib
+import json
+
+import pandas as pd
+
+from .rules import parse_hhmm_or_ampm
+
+# Column kinds per sheet, applied once at load so helpers compare values directly instead of
+# re-parsing on every rerun. Unlisted columns are left as read. Columns starting with "_" are
+# derived here and are never written back.
+SCHEMAS = {
+    "Users": {"user_id": "id", "role": "category", "birth_date": "date", "joined_date": "date", "newsletter_opt_in": "bool"},
+    "Licences": {"licence_id": "id"},
+    "UserLicences": {"user_id": "id", "licence_id": "id", "valid_from": "date", "valid_to": "date"},
+    "Machines": {"machine_id": "id", "licence_id": "id", "max_duration_minutes": "int", "next_service_due": "date", "hours_used": "int"},
+    "Bookings": {"booking_id": "id", "user_id": "id", "machine_id": "id", "start": "datetime", "end": "datetime", "purpose": "category", "status": "category"},
+    "Issues": {"issue_id": "id", "machine_id": "id", "user_id": "id", "created": "datetime", "status": "category"},
+    "ServiceLog": {"service_id": "id", "machine_id": "id", "date": "date"},
+    "OperatingHours": {"day_of_week": "int", "machine_id": "id", "open_time": "hhmm", "close_time": "hhmm"},
+    "ClosedDates": {"date": "date", "machine_id": "id", "start_time": "hhmm", "end_time": "hhmm"},
+    "Subscriptions": {"user_id": "id", "start_date": "date", "end_date": "date", "amount": "float", "paid": "bool", "discount_pct": "float"},
+    "AssistanceRequests": {
+        "request_id": "id", "requester_user_id": "id", "licence_id": "id", "created": "datetime",
+        "status": "category", "handled_by": "id", "handled_on": "datetime", "outcome": "category",
+    },
+    "UserEvents": {"event_id": "id", "user_id": "id", "event_date": "date"},
+    "Reminders": {"reminder_id": "id", "user_id": "id", "at": "datetime"},
+}
+# Values the app itself writes, so assigning them to a categorical column never fails.
+CATEGORIES = {
+    "role": ["member", "superuser", "admin"],
+    "status": ["open", "in_review", "in_progress", "confirmed", "cancelled", "closed"],
+    "outcome": ["pass", "more_training", "fail"],
+    "purpose": ["use"],
+}
+SCHEMA_TAG = hashlib.sha1(json.dumps([SCHEMAS, CATEGORIES], sort_keys=True).encode()).hexdigest()[:8]
+
+def _to_bool(v):
+    if isinstance(v, str):
+        return {"true": True, "yes": True, "1": True, "false": False, "no": False, "0": False}.get(v.strip().lower())
+    return None if pd.isna(v) else bool(v)
+
+def apply_schema(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Coerce *df* in place to the typed layout registered for sheet *name*."""
+    schema = SCHEMAS.get(name)
+    if not schema or not isinstance(df, pd.DataFrame):
+        return df
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if kind in ("id", "int"):
+            df[col] = pd.to_numeric(s, errors="coerce").round().astype("Int32")
+        elif kind == "float":
+            df[col] = pd.to_numeric(s, errors="coerce").astype("float64")
+        elif kind in ("date", "datetime"):
+            s = pd.to_datetime(s, errors="coerce")
+            df[col] = s.dt.normalize() if kind == "date" else s
+        elif kind == "bool":
+            df[col] = (s if pd.api.types.is_bool_dtype(s) else s.map(_to_bool)).astype("boolean")
+        elif kind == "category":
+            s = s.astype(object)  # re-typing an already categorical column starts from its values
+            s = s.where(s.isna(), s.astype(str))
+            cats = list(dict.fromkeys(CATEGORIES.get(col, []) + sorted(s.dropna().unique())))
+            df[col] = s.astype(pd.CategoricalDtype(cats))
+        elif kind == "hhmm":
+            parsed = s.map(parse_hhmm_or_ampm)
+            df[col] = parsed.map(lambda t: f"{t[0]:02d}:{t[1]:02d}" if t else None)
+            df[f"_{col}_min"] = parsed.map(lambda t: t[0] * 60 + t[1] if t else None).astype("Int32")
+    return df
+
+def persisted(df: pd.DataFrame) -> pd.DataFrame:
+    """*df* without the derived "_" columns."""
+    keep = [c for c in df.columns if not str(c).startswith("_")]
+    return df if len(keep) == len(df.columns) else df[keep]
+
+def _deep_bytes(sheets: dict) -> int:
+    return int(sum(df.memory_usage(deep=True).sum() for df in sheets.values() if isinstance(df, pd.DataFrame)))
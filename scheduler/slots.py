@@ -0,0 +1,55 @@
+"""Free-slot search across machines."""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from .hours import NS_PER_MIN, free_intervals, opening_calendar
+from .indexes import _ns
+from .perf import timed
+from .rules import machine_lists_for_user
+
+DEFAULT_MAX_MINUTES = 240  # machines without max_duration_minutes
+SLOT_STEP_MIN = 30  # suggested starts sit on the booking form's 30-minute grid
+
+def open_intervals(store, first_day: date, days: int, machine_id=None):
+    """Opening spans for *days* days from *first_day* as sorted int64 ns (starts, ends), from the
+    opening calendar; *machine_id* gives that machine's hours where it has its own."""
+    lo = pd.Timestamp(first_day).normalize()
+    hi = lo + pd.Timedelta(days=days)
+    cal = opening_calendar(store, lo, hi)
+    return cal.spans(cal.key(machine_id), lo, hi)
+
+@timed(rows=len)
+def find_slots(store, uid: int, duration_min: int, days: int = 28, limit: int = 10, now=None) -> pd.DataFrame:
+    """Earliest free slots of *duration_min* across every machine *uid* is licensed for.
+
+    One suggestion per free gap: the first grid-aligned start that fits, never in the past.
+    """
+    now = pd.Timestamp(now) if now is not None else pd.Timestamp.now()
+    allowed, _ = machine_lists_for_user(store, uid)
+    cap = allowed["max_duration_minutes"].fillna(DEFAULT_MAX_MINUTES) if "max_duration_minutes" in allowed.columns else DEFAULT_MAX_MINUTES
+    machines = allowed[cap >= duration_min]
+    cols = ["machine_id", "machine_name", "start", "end"]
+    if machines.empty:
+        return pd.DataFrame(columns=cols)
+    lo = now.normalize()
+    hi = lo + pd.Timedelta(days=days)
+    cal = opening_calendar(store, lo, hi)
+    step, dur, now_ns = SLOT_STEP_MIN * NS_PER_MIN, duration_min * NS_PER_MIN, _ns(now)
+    starts, ids = [np.empty(0, np.int64)], [np.empty(0, np.int64)]
+    for mid in machines["machine_id"].dropna().astype(int):
+        open_s, open_e = cal.spans(cal.key(mid), lo, hi)
+        if not len(open_s):
+            continue
+        fs, fe = free_intervals(open_s, open_e, *store.busy_intervals(mid, pd.Timestamp(open_s[0]), pd.Timestamp(open_e[-1])))
+        cand = -(-np.maximum(fs, now_ns) // step) * step
+        cand = cand[cand + dur <= fe][:limit]
+        starts.append(cand)
+        ids.append(np.full(len(cand), mid))
+    starts, ids = np.concatenate(starts), np.concatenate(ids)
+    order = np.lexsort((ids, starts))[:limit]
+    out = pd.DataFrame({"machine_id": ids[order], "start": pd.to_datetime(starts[order])})
+    out["end"] = out["start"] + pd.Timedelta(minutes=duration_min)
+    out["machine_name"] = out["machine_id"].map(machines.set_index("machine_id")["machine_name"])
+    return out[cols]
@@ -0,0 +1,354 @@
+"""Storage backends: the Excel workbook plus journal, or an indexed SQLite file.
+
+Helpers query through a backend rather than scanning the sheets dict themselves.
+"""
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import archive
+from .db import DATA, DB, JOURNAL, Sheets, catch_up, journal_insert, journal_save, read_meta, read_sheets, revision, write_db, write_workbook
+from .indexes import _index_commit, booking_index
+from .perf import span
+from .schema import apply_schema, persisted
+
+STORAGE = os.environ.get("SCHEDULER_STORAGE", "excel").lower()  # "excel" or "sqlite"
+SQLITE_DB = DATA / "db.sqlite"
+SQLITE_INDEXES = {
+    "ix_bookings_machine_start": ("Bookings", ["machine_id", "start"]),
+    "ix_userlicences_user_valid_to": ("UserLicences", ["user_id", "valid_to"]),
+    "ix_issues_machine": ("Issues", ["machine_id"]),
+}
+LICENCE_COLS = ["user_id", "licence_id", "valid_from", "valid_to"]
+SQL_TS = "%Y-%m-%d %H:%M:%S"  # one fixed width so timestamps compare correctly as text
+
+class ExcelStorage:
+    """db.xlsx plus journal; queries are answered from the run's in-memory snapshot.
+
+    Booking queries that reach back before the workbook's oldest month also read the monthly
+    archive partitions they touch.
+    """
+    kind = "excel"
+
+    def __init__(self, sheets: dict = None):
+        self.sheets = sheets if sheets is not None else {}
+
+    def table(self, name: str, columns: list = None) -> pd.DataFrame:
+        df = self.sheets.get(name)
+        if not isinstance(df, pd.DataFrame):
+            return pd.DataFrame(columns=columns or [])
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+    def bookings_between(self, machine_id: int, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        B = self.table("Bookings")
+        hot = B.copy() if B.empty else B.iloc[booking_index(self).query(machine_id, start, end)]
+        if not archive.months_between(start, end):
+            return hot
+        return archive.merge(archive.between(machine_id, start, end), hot)
+
+    def overlaps(self, machine_id: int, start: pd.Timestamp, end: pd.Timestamp) -> bool:
+        return booking_index(self).overlaps(machine_id, start, end) or archive.overlaps(machine_id, start, end)
+
+    def bookings_in_range(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """All machines' bookings overlapping [start, end) in one vectorized pass."""
+        cols = ["machine_id", "start", "end"]
+        with span("bookings_in_range") as rec:
+            B = self.table("Bookings", ["booking_id"] + cols)
+            rec["rows"] = len(B)  # a full scan
+            hot = B if B.empty else B[(B["start"] < end) & (B["end"] > start)]
+        if not archive.months_between(start, end):
+            return hot[[c for c in cols if c in hot.columns]]
+        return archive.merge(archive.in_range(start, end), hot)[cols]
+
+    def bookings_history(self, start: pd.Timestamp = None, end: pd.Timestamp = None) -> pd.DataFrame:
+        """Full booking rows overlapping [start, end), archived months included; everything if unbounded."""
+        B = self.table("Bookings")
+        if not B.empty and start is not None:
+            B = B[B["end"] > start]
+        if not B.empty and end is not None:
+            B = B[B["start"] < end]
+        return archive.merge(archive.in_range(start, end), B)
+
+    def busy_intervals(self, machine_id: int, start: pd.Timestamp, end: pd.Timestamp):
+        if not archive.months_between(start, end):
+            return booking_index(self).intervals(machine_id, start, end)
+        B = self.bookings_between(machine_id, start, end).dropna(subset=["start", "end"])
+        return B["start"].to_numpy("datetime64[ns]").view(np.int64), B["end"].to_numpy("datetime64[ns]").view(np.int64)
+
+    def busy_by_machine(self, machine_ids, start: pd.Timestamp, end: pd.Timestamp) -> dict:
+        """machine_id → busy_intervals over [start, end), each from the booking index."""
+        return {int(m): self.busy_intervals(m, start, end) for m in machine_ids}
+
+    def licences_from(self, day: pd.Timestamp) -> pd.DataFrame:
+        """UserLicences grants not lapsed by *day* (in force or still to start), the ones an EntitlementIndex reads."""
+        UL = self.table("UserLicences", LICENCE_COLS)
+        return UL if UL.empty or "valid_to" not in UL.columns else UL[UL["valid_to"] >= day]
+
+    def max_id(self, name: str, key: str) -> int:
+        ids = pd.to_numeric(self.table(name, [key]).get(key, pd.Series(dtype=float)), errors="coerce")
+        top = int(ids.max()) if ids.notna().any() else 0
+        return max(top, int(archive.manifest().get("max_id", 0))) if name == "Bookings" else top
+
+    def fresh(self):
+        """This store if nothing was committed since its snapshot, else one over the current data.
+
+        Commits run this under the lock, usually one revision behind, so it replays just the
+        journal written since the snapshot and folds the rows it appended into the shared
+        indexes; only a rewritten db.xlsx or unsaved edits cost a full read.
+        """
+        if getattr(self.sheets, "revision", None) == revision():
+            return self
+        caught = catch_up(self.sheets) if isinstance(self.sheets, Sheets) else None
+        if caught is None:
+            return ExcelStorage(read_sheets())
+        sheets, appended = caught
+        before = {n: self.sheets.versions.get(n, 0) for n in appended}
+        _index_commit(appended, before, {n: sheets.versions.get(n, 0) for n in appended})
+        return ExcelStorage(sheets)
+
+    def insert(self, name: str, rows: pd.DataFrame, key: str = None):
+        journal_insert(name, rows)
+
+    def save(self, sheets: dict, names: list = None, appended: dict = None):
+        """Rewrite db.xlsx with every sheet, or journal just *names*: sheets in *appended* as their
+        new rows, the rest as whole-sheet replacements folded in at the next compaction."""
+        if names is None:
+            write_db(sheets)
+            return
+        appended = appended or {}
+        journal_save({n: sheets[n] for n in names if n not in appended}, {n: appended[n] for n in names if n in appended})
+
+class LazySheets(Sheets):
+    """Sheets mapping that reads each table from its backend on first access."""
+
+    def __init__(self, loader, names: list):
+        super().__init__()
+        self._loader = loader
+        self._names = list(names)
+
+    def __missing__(self, name):
+        if name not in self._names:
+            raise KeyError(name)
+        df = self._loader(name)
+        dict.__setitem__(self, name, df)  # a read, not an edit: stays out of dirty
+        return df
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self._names
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def keys(self):
+        return list(dict.fromkeys(self._names + list(dict.keys(self))))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+def _q(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _sql_frame(df: pd.DataFrame):
+    """Column kinds and DB-ready rows (timestamps as fixed-width text, nulls as None)."""
+    kinds, out = {}, df.copy()
+    for c in out.columns:
+        if pd.api.types.is_datetime64_any_dtype(out[c]):
+            kinds[c] = "datetime"
+            out[c] = out[c].dt.strftime(SQL_TS)
+        elif pd.api.types.is_bool_dtype(out[c]):
+            kinds[c] = "bool"
+        elif pd.api.types.is_integer_dtype(out[c]):
+            kinds[c] = "int"
+        elif pd.api.types.is_float_dtype(out[c]):
+            kinds[c] = "float"
+        else:
+            kinds[c] = "text"
+            out[c] = out[c].map(lambda v: pd.Timestamp(v).strftime(SQL_TS) if isinstance(v, (datetime, date)) and not pd.isna(v) else v)
+    out = out.astype(object).where(out.notna(), None)
+    rows = [tuple(v.item() if hasattr(v, "item") else v for v in r) for r in out.itertuples(index=False, name=None)]
+    return kinds, rows
+
+SQL_AFFINITY = {"datetime": "TEXT", "bool": "INTEGER", "int": "INTEGER", "float": "REAL", "text": ""}
+
+class SQLiteStorage:
+    """Indexed SQLite file; only the tables a run touches are read, queries hit indexes."""
+    kind = "sqlite"
+
+    def __init__(self, path: Path = None):
+        self.path = path or SQLITE_DB
+        self.sheets = LazySheets(self.table, self.table_names())
+        meta = read_meta()
+        self.sheets.revision, self.sheets.versions = meta["rev"], dict(meta["sheets"])
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=10)
+        con.execute("CREATE TABLE IF NOT EXISTS _sheets (name TEXT PRIMARY KEY, pos INTEGER)")
+        con.execute("CREATE TABLE IF NOT EXISTS _schema (sheet TEXT, col TEXT, kind TEXT, PRIMARY KEY (sheet, col))")
+        return con
+
+    def table_names(self) -> list:
+        with closing(self._connect()) as con:
+            return [r[0] for r in con.execute("SELECT name FROM _sheets ORDER BY pos")]
+
+    def _read(self, name: str, sql: str, params=()) -> pd.DataFrame:
+        with span("sqlite_read", sheet=name) as rec, closing(self._connect()) as con:
+            kinds = dict(con.execute("SELECT col, kind FROM _schema WHERE sheet = ?", (name,)))
+            if not kinds:
+                return pd.DataFrame()
+            df = pd.read_sql_query(sql, con, params=params)
+            rec["rows"] = len(df)  # rows returned; SQLite does the scanning
+        for c in df.columns:
+            if kinds.get(c) == "datetime":
+                df[c] = pd.to_datetime(df[c], errors="coerce")
+            elif kinds.get(c) == "bool" and df[c].notna().all():
+                df[c] = df[c].astype(bool)
+        return apply_schema(name, df)
+
+    def table(self, name: str, columns: list = None) -> pd.DataFrame:
+        df = self._read(name, f"SELECT * FROM {_q(name)}")
+        if df.empty and not len(df.columns):
+            return pd.DataFrame(columns=columns or [])
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+    def bookings_between(self, machine_id: int, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        return self._read(
+            "Bookings",
+            'SELECT * FROM Bookings WHERE machine_id = ? AND start < ? AND "end" > ? ORDER BY start',
+            (int(machine_id), pd.Timestamp(end).strftime(SQL_TS), pd.Timestamp(start).strftime(SQL_TS)),
+        )
+
+    def overlaps(self, machine_id: int, start: pd.Timestamp, end: pd.Timestamp) -> bool:
+        hit = self._read(
+            "Bookings",
+            'SELECT 1 AS hit FROM Bookings WHERE machine_id = ? AND start < ? AND "end" > ? LIMIT 1',
+            (int(machine_id), pd.Timestamp(end).strftime(SQL_TS), pd.Timestamp(start).strftime(SQL_TS)),
+        )
+        return not hit.empty
+
+    def bookings_in_range(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        return self._read(
+            "Bookings",
+            'SELECT machine_id, start, "end" FROM Bookings WHERE start < ? AND "end" > ?',
+            (pd.Timestamp(end).strftime(SQL_TS), pd.Timestamp(start).strftime(SQL_TS)),
+        )
+
+    def bookings_history(self, start: pd.Timestamp = None, end: pd.Timestamp = None) -> pd.DataFrame:
+        where, params = [], []
+        if start is not None:
+            where.append('"end" > ?')
+            params.append(pd.Timestamp(start).strftime(SQL_TS))
+        if end is not None:
+            where.append("start < ?")
+            params.append(pd.Timestamp(end).strftime(SQL_TS))
+        sql = "SELECT * FROM Bookings" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY start"
+        return self._read("Bookings", sql, tuple(params))
+
+    def busy_intervals(self, machine_id: int, start: pd.Timestamp, end: pd.Timestamp):
+        B = self._read(
+            "Bookings",
+            'SELECT start, "end" FROM Bookings WHERE machine_id = ? AND start < ? AND "end" > ? ORDER BY start',
+            (int(machine_id), pd.Timestamp(end).strftime(SQL_TS), pd.Timestamp(start).strftime(SQL_TS)),
+        ).dropna(subset=["start", "end"])
+        return B["start"].to_numpy("datetime64[ns]").view(np.int64), B["end"].to_numpy("datetime64[ns]").view(np.int64)
+
+    def busy_by_machine(self, machine_ids, start: pd.Timestamp, end: pd.Timestamp) -> dict:
+        """machine_id → busy_intervals over [start, end), in one query on the (machine_id, start) index."""
+        ids = [int(m) for m in machine_ids]
+        B = self._read(
+            "Bookings",
+            f'SELECT machine_id, start, "end" FROM Bookings WHERE machine_id IN ({", ".join("?" * len(ids))}) AND start < ? AND "end" > ? ORDER BY start',
+            (*ids, pd.Timestamp(end).strftime(SQL_TS), pd.Timestamp(start).strftime(SQL_TS)),
+        ).dropna(subset=["machine_id", "start", "end"])
+        mid = B["machine_id"].to_numpy(dtype=np.int64) if len(B) else np.empty(0, np.int64)
+        s, e = B["start"].to_numpy("datetime64[ns]").view(np.int64), B["end"].to_numpy("datetime64[ns]").view(np.int64)
+        return {m: (s[mid == m], e[mid == m]) for m in ids}
+
+    def licences_from(self, day: pd.Timestamp) -> pd.DataFrame:
+        return self._read(
+            "UserLicences",
+            "SELECT user_id, licence_id, valid_from, valid_to FROM UserLicences WHERE valid_to >= ?",
+            (pd.Timestamp(day).strftime(SQL_TS),),
+        )
+
+    def max_id(self, name: str, key: str) -> int:
+        top = self._read(name, f"SELECT MAX({_q(key)}) AS top FROM {_q(name)}")
+        return int(top["top"].iloc[0]) if not top.empty and pd.notna(top["top"].iloc[0]) else 0
+
+    def fresh(self):
+        return self  # every query already reads committed data
+
+    def _write(self, con, name: str, df: pd.DataFrame, replace: bool):
+        kinds, rows = _sql_frame(persisted(df))
+        known = dict(con.execute("SELECT col, kind FROM _schema WHERE sheet = ?", (name,)))
+        created = replace or not known
+        if created:
+            con.execute(f"DROP TABLE IF EXISTS {_q(name)}")
+            con.execute("DELETE FROM _schema WHERE sheet = ?", (name,))
+            cols = ", ".join(f"{_q(c)} {SQL_AFFINITY[k]}".strip() for c, k in kinds.items())
+            con.execute(f"CREATE TABLE {_q(name)} ({cols})")
+            con.execute("INSERT OR IGNORE INTO _sheets VALUES (?, (SELECT COALESCE(MAX(pos), -1) + 1 FROM _sheets))", (name,))
+            known = {}
+        for c, k in kinds.items():
+            if c not in known:
+                if not created:
+                    con.execute(f"ALTER TABLE {_q(name)} ADD COLUMN {_q(c)} {SQL_AFFINITY[k]}")
+                con.execute("INSERT INTO _schema VALUES (?, ?, ?)", (name, c, k))
+        if rows:
+            marks = ", ".join("?" * len(kinds))
+            con.executemany(f"INSERT INTO {_q(name)} ({', '.join(_q(c) for c in kinds)}) VALUES ({marks})", rows)
+        for ix, (table, cols) in SQLITE_INDEXES.items():
+            if table == name and set(cols) <= set(kinds) | set(known):
+                con.execute(f"CREATE INDEX IF NOT EXISTS {ix} ON {_q(table)} ({', '.join(_q(c) for c in cols)})")
+
+    def insert(self, name: str, rows: pd.DataFrame, key: str = None):
+        with closing(self._connect()) as con, con:
+            self._write(con, name, rows, replace=False)
+
+    def save(self, sheets: dict, names: list = None, appended: dict = None):
+        """Replace *names* (default: the tables this run loaded or assigned) in one transaction;
+        sheets in *appended* only get their new rows. Other tables are left alone."""
+        appended = appended or {}
+        names = [n for n, df in dict.items(sheets) if isinstance(df, pd.DataFrame)] if names is None else names
+        with closing(self._connect()) as con, con:
+            for name in names:
+                if name in appended:
+                    self._write(con, name, appended[name], replace=False)
+                else:
+                    self._write(con, name, sheets[name], replace=True)
+
+def export_to_sqlite(sheets: dict, path: Path = None):
+    """One-shot copy of every sheet into a fresh SQLite file; archived bookings go back into Bookings."""
+    path = path or SQLITE_DB
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    sheets = dict(sheets.items())
+    if archive.months_between():
+        sheets["Bookings"] = archive.merge(archive.in_range(), sheets.get("Bookings", pd.DataFrame()))
+    SQLiteStorage(tmp).save(sheets)
+    os.replace(tmp, path)
+
+def export_to_excel(path: Path = None):
+    """One-shot copy of the SQLite tables into db.xlsx, superseding any pending journal."""
+    src = SQLiteStorage(path)
+    write_workbook({name: src.table(name) for name in src.table_names()}, DB)
+    JOURNAL.unlink(missing_ok=True)
+
+def open_store(load=None):
+    """The configured backend. The Excel one is bound to *load(revision)* if given (the app passes
+    its cached snapshot loader), else to a fresh read."""
+    if STORAGE == "sqlite":
+        if not SQLITE_DB.exists():
+            export_to_sqlite(read_sheets())
+        return SQLiteStorage()
+    return ExcelStorage(load(revision()) if load else read_sheets())
+
+def _backend():
+    return SQLiteStorage() if STORAGE == "sqlite" else ExcelStorage()
@@ -0,0 +1,225 @@
+"""Synthetic workbooks with every sheet the app uses, at any size, for benchmarks and load tests.
+
+Bookings never overlap on a machine and fall inside the opening hours; licences are granted
+when a member joins and renewed yearly. The generated admin signs in as "Admin User" with
+the password "admin".
+"""
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .db import write_workbook
+
+# licence name → machine type it covers
+LICENCES = [
+    ("Lathe - Basic", "Lathe"),
+    ("Lathe - Advanced", "Lathe Pro"),
+    ("Laser Engraver", "Laser Engraver"),
+    ("Bandsaw", "Bandsaw"),
+    ("Table Saw", "Table Saw"),
+    ("Drill Press", "Drill Press"),
+    ("Sanding Station", "Sanding Station"),
+    ("Workshop - General Use", "Benches (General Use)"),
+]
+HOURS = {0: (9, 16), 1: (9, 16), 2: (9, 16), 3: (9, 16), 4: (9, 16), 5: (10, 14)}  # Sunday closed
+HOLIDAYS = [(1, 1, "New Year's Day"), (1, 26, "Australia Day"), (4, 25, "Anzac Day"), (12, 25, "Christmas Day"), (12, 26, "Boxing Day")]
+FIRST = ["Alex", "Sam", "Jo", "Chris", "Pat", "Lee", "Robin", "Kim", "Terry", "Dana", "Morgan", "Jamie", "Casey", "Jordan", "Taylor", "Ash"]
+LAST = ["Smith", "Jones", "Williams", "Brown", "Wilson", "Taylor", "Nguyen", "Martin", "Lee", "Walker", "Harris", "Kelly", "Young", "King"]
+ISSUES = ["Blade dulling", "Coolant low", "Vibration at high RPM", "Laser alignment drift", "Dust extraction weak"]
+SLOT = 30  # minutes; bookings start and end on the half hour
+
+def _dates(rng, lo: pd.Timestamp, hi: pd.Timestamp, n: int) -> pd.DatetimeIndex:
+    days = rng.integers(0, max((hi - lo).days, 1), n)
+    return pd.DatetimeIndex(lo + pd.to_timedelta(days, unit="D"))
+
+def _open_days(lo: pd.Timestamp, hi: pd.Timestamp, closed: pd.DatetimeIndex):
+    """Open days in [lo, hi) with their opening and closing minute."""
+    days = pd.date_range(lo, hi, freq="D", inclusive="left")
+    days = days[days.dayofweek.isin(list(HOURS)) & ~days.isin(closed)]
+    dow = days.dayofweek.to_numpy()
+    open_min = np.array([HOURS[d][0] * 60 for d in dow])
+    close_min = np.array([HOURS[d][1] * 60 for d in dow])
+    return days, open_min, close_min
+
+def _bookings(rng, n: int, machines: pd.DataFrame, days, open_min, close_min, n_users: int) -> pd.DataFrame:
+    """*n* bookings laid out back to back with random gaps on each machine-day, so none overlap."""
+    per_day = (close_min.max() - open_min.min()) // (2 * SLOT) + 1  # most bookings a day can hold
+    md = len(machines) * len(days)
+    gaps = rng.integers(0, 4, (md, per_day)) * SLOT
+    durs = rng.choice([60, 120, 180], (md, per_day), p=[0.45, 0.45, 0.10])
+    cap = np.repeat(machines["max_duration_minutes"].to_numpy(dtype=np.int64), len(days))[:, None]
+    durs = np.minimum(durs, np.maximum(cap // SLOT * SLOT, SLOT))
+    start = np.tile(open_min, len(machines))[:, None] + np.cumsum(gaps, axis=1) + np.cumsum(durs, axis=1) - durs
+    end = start + durs
+    fits = end <= np.tile(close_min, len(machines))[:, None]
+    row, _ = np.nonzero(fits)
+    if len(row) < n:
+        raise ValueError(f"Only {len(row)} bookings fit on {len(machines)} machines over {len(days)} open days; add machines or years.")
+    pick = np.sort(rng.choice(len(row), n, replace=False))
+    row = row[pick]
+    day_ns = days.to_numpy("datetime64[ns]")[row % len(days)]
+    s = day_ns + start[fits][pick].astype("timedelta64[m]")
+    e = day_ns + end[fits][pick].astype("timedelta64[m]")
+    order = np.argsort(s, kind="stable")  # ids follow booking time, as they do in the live sheet
+    return pd.DataFrame({
+        "booking_id": np.arange(1, n + 1),
+        "user_id": rng.integers(1, n_users + 1, n),
+        "machine_id": machines["machine_id"].to_numpy()[row // len(days)][order],
+        "start": s[order],
+        "end": e[order],
+        "purpose": "use",
+        "notes": None,
+        "status": "confirmed",
+    })
+
+def synthetic_sheets(users: int = 200, machines: int = 20, bookings: int = 5_000, years: int = 1, seed: int = 0, today: date = None) -> dict:
+    """Every sheet of db.xlsx filled with *users* members, *machines* machines and *bookings* bookings.
+
+    History covers *years* years up to *today*; bookings also run eight weeks ahead of it.
+    """
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(today or date.today()).normalize()
+    lo, hi = today - pd.DateOffset(years=years), today + pd.Timedelta(weeks=8)
+    closed = pd.DatetimeIndex([pd.Timestamp(y, m, d) for y in range(lo.year, hi.year + 1) for m, d, _ in HOLIDAYS])
+
+    uid = np.arange(1, users + 1)
+    first, last = rng.choice(FIRST, users), rng.choice(LAST, users)
+    first[0], last[0] = "Admin", "User"
+    role = rng.choice(["user", "superuser"], users, p=[0.95, 0.05])
+    role[0] = "admin"
+    joined = _dates(rng, lo, today, users)
+    U = pd.DataFrame({
+        "user_id": uid,
+        "name": np.char.add(np.char.add(first, " "), last),
+        "email": [f"{f}.{s}{i}@example.com".lower() for f, s, i in zip(first, last, uid)],
+        "phone": rng.integers(400_000_000, 500_000_000, users),
+        "address": [f"{n} Hunter St" for n in rng.integers(1, 300, users)],
+        "role": role,
+        "password": np.where(role == "admin", "admin", None),
+        "birth_date": _dates(rng, pd.Timestamp(1940, 1, 1), pd.Timestamp(2005, 1, 1), users),
+        "joined_date": joined,
+        "newsletter_opt_in": rng.random(users) < 0.6,
+    })
+
+    L = pd.DataFrame({"licence_id": np.arange(1, len(LICENCES) + 1), "licence_name": [name for name, _ in LICENCES]})
+    mid = np.arange(1, machines + 1)
+    lic = rng.integers(1, len(LICENCES) + 1, machines)
+    M = pd.DataFrame({
+        "machine_id": mid,
+        "machine_name": [f"{LICENCES[l - 1][1]} #{i}" for l, i in zip(lic, mid)],
+        "licence_id": lic,
+        "max_duration_minutes": rng.choice([120, 180, 240], machines),
+        "serial_no": [f"SN{1000 + i}" for i in mid],
+        "next_service_due": _dates(rng, today, today + pd.Timedelta(days=180), machines),
+        "hours_used": rng.integers(0, 2_000, machines),
+    })
+
+    # each member holds 1-4 licences from joining, renewed every year up to today
+    held = rng.integers(1, 5, users)
+    ul_user = np.repeat(uid, held)
+    ul_lic = np.concatenate([rng.choice(len(LICENCES), k, replace=False) + 1 for k in held])
+    ul_from = np.repeat(joined.to_numpy("datetime64[D]"), held)
+    renewals = (today.to_datetime64().astype("datetime64[D]") - ul_from).astype(int) // 365 + 1
+    k = np.arange(renewals.sum()) - np.repeat(np.cumsum(renewals) - renewals, renewals)
+    vf = np.repeat(ul_from, renewals) + (k * 365).astype("timedelta64[D]")
+    UL = pd.DataFrame({
+        "user_id": np.repeat(ul_user, renewals),
+        "licence_id": np.repeat(ul_lic, renewals),
+        "valid_from": vf,
+        "valid_to": vf + np.timedelta64(364, "D"),
+    })
+
+    days, open_min, close_min = _open_days(lo, hi, closed)
+    B = _bookings(rng, bookings, M, days, open_min, close_min, users)
+
+    n_issues = max(machines * years, 1)
+    I = pd.DataFrame({
+        "issue_id": np.arange(1, n_issues + 1),
+        "machine_id": rng.choice(mid, n_issues),
+        "user_id": rng.choice(uid, n_issues),
+        "created": _dates(rng, lo, today, n_issues).sort_values(),
+        "status": rng.choice(["open", "in_progress", "closed"], n_issues, p=[0.1, 0.1, 0.8]),
+        "text": rng.choice(ISSUES, n_issues),
+    })
+    n_service = machines * max(years, 1)
+    SL = pd.DataFrame({
+        "service_id": np.arange(1, n_service + 1),
+        "machine_id": rng.choice(mid, n_service),
+        "date": _dates(rng, lo, today, n_service).sort_values(),
+        "notes": "Routine service",
+    })
+    OH = pd.DataFrame({
+        "day_of_week": range(7),
+        "open_time": [f"{HOURS[d][0]:02d}:00" if d in HOURS else None for d in range(7)],
+        "close_time": [f"{HOURS[d][1]:02d}:00" if d in HOURS else None for d in range(7)],
+    })
+    CD = pd.DataFrame({"date": closed, "reason": [r for _ in range(lo.year, hi.year + 1) for _, _, r in HOLIDAYS]})
+    sub_start = _dates(rng, today - pd.Timedelta(days=365), today, users)
+    SB = pd.DataFrame({
+        "user_id": uid,
+        "start_date": sub_start,
+        "end_date": sub_start + pd.Timedelta(days=365),
+        "amount": rng.choice([50, 60, 75, 100], users),
+        "paid": rng.random(users) < 0.85,
+        "discount_reason": rng.choice(["mentor", "lifetime", "workshop_only", None], users),
+        "discount_pct": rng.choice([0, 10, 15, 20, 25, 50], users),
+    })
+    n_req = max(users // 20, 1)
+    AR = pd.DataFrame({
+        "request_id": np.arange(1, n_req + 1),
+        "requester_user_id": rng.choice(uid, n_req),
+        "licence_id": rng.integers(1, len(LICENCES) + 1, n_req),
+        "message": "I'd like help learning safe operation.",
+        "created": (_dates(rng, today - pd.Timedelta(days=90), today, n_req) + pd.Timedelta(hours=9)).sort_values(),
+        "status": rng.choice(["open", "in_review", "closed"], n_req, p=[0.5, 0.2, 0.3]),
+        "handled_by": None,
+        "handled_on": pd.NaT,
+        "outcome": None,
+        "notes": None,
+    })
+    n_events = max(users // 10, 1)
+    UE = pd.DataFrame({
+        "event_id": np.arange(1, n_events + 1),
+        "user_id": rng.choice(uid, n_events),
+        "event_name": rng.choice(["Anniversary", "Competition Win", "Teaching"], n_events),
+        "event_date": _dates(rng, today - pd.Timedelta(days=30), today + pd.Timedelta(days=30), n_events),
+        "notes": None,
+    })
+    return {
+        "Users": U,
+        "Licences": L,
+        "UserLicences": UL,
+        "Machines": M,
+        "Bookings": B,
+        "Issues": I,
+        "ServiceLog": SL,
+        "OperatingHours": OH,
+        "ClosedDates": CD,
+        "Subscriptions": SB,
+        "DiscountReasons": pd.DataFrame({"reason": ["mentor", "lifetime", "workshop_only", "other"]}),
+        "AssistanceRequests": AR,
+        "Templates": pd.DataFrame({"key": ["newsletter_prompt"], "text": ["<paste your latest prompt here>"]}),
+        "Settings": pd.DataFrame({
+            "key": ["org_name", "active_logo", "app_public_url", "lock_booking_to_member", "newsletter_issue_day"],
+            "value": ["Synthetic Woodturners", "logo1.png", None, "true", "1"],
+        }),
+        "ClubUpdates": pd.DataFrame(columns=["title", "text", "link"]),
+        "Notices": pd.DataFrame(columns=["title", "text", "link"]),
+        "SpotlightSubmissions": pd.DataFrame(columns=["user_id", "title", "text", "image_file"]),
+        "ProjectSubmissions": pd.DataFrame(columns=["user_id", "title", "description", "image_file"]),
+        "UserEvents": UE,
+        "MeetingInfo": pd.DataFrame({
+            "title": ["Monthly Meeting"], "date": [today + pd.Timedelta(days=14)], "location": ["Shed HQ"],
+            "agenda_link": [None], "rsvp_link": [None],
+        }),
+    }
+
+def write_synthetic(folder, **sizes) -> dict:
+    """Write a synthetic db.xlsx into *folder* (created if needed); returns the sheets written."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    sheets = synthetic_sheets(**sizes)
+    write_workbook(sheets, folder / "db.xlsx")
+    return sheets
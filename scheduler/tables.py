@@ -0,0 +1,132 @@
+"""Server-side search, filtering, sorting and paging for the admin and issue tables.
+
+A TableIndex per sheet holds each row's lower-cased search text (with member, machine and
+licence names joined in) and, on first use, the sort order of any column, so a filter or a
+page turn costs a few vectorized passes rather than re-merging and re-sending the whole sheet.
+"""
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from .indexes import _version, derived_cache, labels
+from .perf import record, timed
+from .rules import HUMAN_LABELS
+
+PAGE_SIZES = (25, 50, 100, 250)
+
+# sheet → columns searched as text, the column filtered by value, the date column filtered by
+# range, and the default sort (None keeps the sheet's own order)
+TABLES = {
+    "Users": {"search": ["name", "email", "phone"], "status": "role", "date": "joined_date", "sort": "name"},
+    "UserLicences": {"search": [], "date": "valid_to", "sort": "valid_to", "descending": True},
+    "Subscriptions": {"search": ["type", "discount_reason"], "status": "type", "date": "start_date", "sort": "start_date", "descending": True},
+    "Issues": {"search": ["text", "notes"], "status": "status", "date": "created", "sort": "created", "descending": True},
+    "Machines": {"search": ["machine_name", "serial", "serial_no"], "sort": None},
+    "ClosedDates": {"search": ["reason"], "date": "date", "sort": "date"},
+    "Settings": {"search": ["key", "value"], "sort": None},
+    "Reminders": {"search": ["key", "to", "detail"], "status": "result", "date": "at", "sort": "reminder_id", "descending": True},
+}
+
+def _label_sources(columns) -> list:
+    """(id column, lookup sheet, label column) for the HUMAN_LABELS ids present in *columns*."""
+    return [(key, sheet, col) for key, sheet, col in HUMAN_LABELS if key in columns]
+
+class TableIndex:
+    """Search text and cached sort orders for one sheet, plus the label columns joined in."""
+
+    def __init__(self, store, sheet: str, version=None):
+        self.sheet, self.version = sheet, version
+        spec = TABLES.get(sheet, {})
+        df = store.table(sheet)
+        self.size = len(df)
+        self.frame = df.reset_index(drop=True)
+        for key, src, col in _label_sources(df.columns):
+            if col not in self.frame.columns:
+                self.frame[col] = self.frame[key].map(labels(store, src, col))
+        self.status, self.date = spec.get("status"), spec.get("date")
+        searched = [c for c in spec.get("search", []) if c in self.frame.columns]
+        searched += [col for _, _, col in _label_sources(df.columns) if col not in searched]
+        text = pd.Series("", index=self.frame.index, dtype=object)
+        for c in searched:
+            text = text + " " + self.frame[c].astype(object).where(self.frame[c].notna(), "").astype(str)
+        self.text = text.str.lower()
+        self._orders = {}
+
+    def sortable(self) -> list:
+        return [c for c in self.frame.columns if not str(c).startswith("_")]
+
+    def options(self, column: str) -> list:
+        if column not in self.frame.columns:
+            return []
+        return sorted(self.frame[column].dropna().astype(str).unique())
+
+    def order(self, column: str, descending: bool = False) -> np.ndarray:
+        """Row positions sorted by *column*, blanks last; computed once per column and direction."""
+        if column not in self._orders.setdefault(descending, {}):
+            s = self.frame[column].reset_index(drop=True)
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                s = s.astype(object)  # alphabetical, not category order
+            self._orders[descending][column] = s.sort_values(ascending=not descending, kind="stable", na_position="last").index.to_numpy()
+        return self._orders[descending][column]
+
+    def between(self, column: str, start=None, end=None) -> np.ndarray:
+        """Positions with *column* in [start, end), by binary search over its sorted order."""
+        order = self.order(column)
+        values = pd.to_datetime(self.frame[column], errors="coerce").to_numpy("datetime64[ns]")[order]
+        n = int((~np.isnat(values)).sum())  # NaT sorts last
+        lo = 0 if start is None else np.searchsorted(values[:n], np.datetime64(pd.Timestamp(start), "ns"), "left")
+        hi = n if end is None else np.searchsorted(values[:n], np.datetime64(pd.Timestamp(end), "ns"), "left")
+        return order[lo:hi]
+
+    @timed("table_select", rows=len)
+    def select(self, query: str = "", status=None, start=None, end=None, sort: str = None, descending: bool = False) -> np.ndarray:
+        """Row positions matching every filter, in display order.
+
+        *query* matches rows containing all of its words; *status* is a list of allowed values of
+        the status column; *start*/*end* bound the date column.
+        """
+        keep = np.ones(self.size, dtype=bool)
+        for word in str(query or "").lower().split():
+            keep &= self.text.str.contains(word, regex=False).to_numpy()
+        if status and self.status in self.frame.columns:
+            keep &= self.frame[self.status].astype(object).isin(list(status)).to_numpy()
+        if (start is not None or end is not None) and self.date in self.frame.columns:
+            in_range = np.zeros(self.size, dtype=bool)
+            in_range[self.between(self.date, start, end)] = True
+            keep &= in_range
+        order = self.order(sort, descending) if sort in self.frame.columns else np.arange(self.size)
+        return order[keep[order]]
+
+def table_index(store, sheet: str) -> TableIndex:
+    """The shared TableIndex for *sheet*, rebuilt when it or a sheet its labels come from changes."""
+    t0 = perf_counter()
+    sources = [sheet] + [src for _, src, _ in HUMAN_LABELS if src != sheet]
+    ver = tuple(_version(store, s) for s in sources)
+    reg = derived_cache().setdefault("tables", {})
+    idx = reg.get(sheet)
+    if idx is not None and None not in ver and idx.version == ver:
+        record("table_index", (perf_counter() - t0) * 1000, hit=True)
+        return idx
+    idx = TableIndex(store, sheet, ver)
+    record("table_index", (perf_counter() - t0) * 1000, rows=idx.size, hit=False)
+    current = reg.get(sheet)
+    if None not in ver and (current is None or all(a >= b for a, b in zip(ver, current.version))):
+        reg[sheet] = idx
+    return idx
+
+def page_of(positions: np.ndarray, page: int, size: int):
+    """(positions on *page*, page, number of pages), with *page* clamped to the range."""
+    pages = max(1, -(-len(positions) // size))
+    page = min(max(1, int(page)), pages)
+    return positions[(page - 1) * size:page * size], page, pages
+
+def merge_edits(df: pd.DataFrame, shown, edited: pd.DataFrame) -> pd.DataFrame:
+    """*df* with the rows an editor showed (index labels *shown*, passed to it 0..n-1) replaced by
+    its result: rows deleted there are dropped, rows added there are appended."""
+    shown = pd.Index(shown)
+    pos = edited.index.to_numpy()
+    old = (pos >= 0) & (pos < len(shown))
+    kept = edited[old].set_axis(shown[pos[old]])
+    rest = pd.concat([df.drop(index=shown), kept]).sort_index(kind="stable")
+    return pd.concat([rest, edited[~old]], ignore_index=True)
@@ -0,0 +1,186 @@
+"""Machine utilisation: booked minutes per machine, month, weekday and hour, against opening hours.
+
+The aggregates are built once from the whole booking history (archived months included) with
+a few vectorized passes, then commits fold their new bookings in, so a report costs a sum over
+a small array rather than a scan of Bookings. Open minutes come from the opening calendar as it
+stands now, so past months are measured against today's hours.
+"""
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from .hours import NS_PER_MIN, opening_calendar
+from .indexes import _version, derived_cache, labels
+from .perf import record, timed
+
+NS_PER_HOUR = 60 * NS_PER_MIN
+BREAKDOWNS = ("machine", "month", "weekday", "hour", "user")
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+REPORT_MONTHS = 12  # the default report runs to this month, this many months back
+
+def _month_no(ts) -> int:
+    """Months since 1970-01, the month axis of the aggregates."""
+    return int(np.datetime64(pd.Timestamp(ts), "ns").astype("datetime64[M]").astype(np.int64))
+
+def _hour_pieces(s: np.ndarray, e: np.ndarray):
+    """Split spans (int64 ns) at the hour: (span of each piece, month, weekday, hour, minutes)."""
+    h0, h1 = s // NS_PER_HOUR, -(-e // NS_PER_HOUR)
+    n = np.maximum(h1 - h0, 0)
+    src = np.repeat(np.arange(len(s)), n)
+    hour = np.repeat(h0, n) + np.arange(int(n.sum())) - np.repeat(np.cumsum(n) - n, n)
+    lo, hi = np.maximum(hour * NS_PER_HOUR, s[src]), np.minimum((hour + 1) * NS_PER_HOUR, e[src])
+    at = hour * NS_PER_HOUR
+    month = at.view("datetime64[ns]").astype("datetime64[M]").astype(np.int64)
+    weekday = (at // (24 * NS_PER_HOUR) + 3) % 7  # 1970-01-01 was a Thursday
+    return src, month, weekday, hour % 24, (hi - lo) / NS_PER_MIN
+
+class Utilisation:
+    """Booked minutes as a machines × months × weekdays × hours array, plus minutes per member.
+
+    Cancelled bookings don't count. add() folds in newly committed rows without a rebuild.
+    """
+
+    def __init__(self, bookings: pd.DataFrame, version: int = None):
+        self.version = version
+        self.machines = np.empty(0, np.int64)  # sorted machine ids, the first axis
+        self.m0 = _month_no(pd.Timestamp.today())  # month number of the second axis' first entry
+        self.minutes = np.zeros((0, 0, 7, 24))
+        self.bookings = np.zeros((0, 0), np.int64)  # per machine and start month
+        self._users = pd.DataFrame({"month": [], "machine_id": [], "user_id": [], "minutes": [], "bookings": []}, dtype=np.int64)
+        self._pending = []
+        self.add(bookings)
+
+    def _grow(self, mids: np.ndarray, months: np.ndarray):
+        """Copies of the arrays widened to cover *mids* and *months*; (machines, m0, minutes, bookings)."""
+        machines = np.union1d(self.machines, mids).astype(np.int64)
+        n_old = self.minutes.shape[1]
+        m0 = min([self.m0] + ([int(months.min())] if len(months) else []))
+        m1 = max([self.m0 + n_old] + ([int(months.max()) + 1] if len(months) else []))
+        minutes = np.zeros((len(machines), m1 - m0, 7, 24))
+        bookings = np.zeros((len(machines), m1 - m0), np.int64)
+        rows, off = np.searchsorted(machines, self.machines), self.m0 - m0
+        minutes[rows, off:off + n_old] = self.minutes
+        bookings[rows, off:off + n_old] = self.bookings
+        return machines, m0, minutes, bookings
+
+    def add(self, rows: pd.DataFrame):
+        """Fold booking *rows* into the aggregates."""
+        if rows.empty or not {"machine_id", "start", "end"} <= set(rows.columns):
+            return
+        mid = pd.to_numeric(rows["machine_id"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        s = pd.to_datetime(rows["start"], errors="coerce").to_numpy("datetime64[ns]").view(np.int64)
+        e = pd.to_datetime(rows["end"], errors="coerce").to_numpy("datetime64[ns]").view(np.int64)
+        nat = np.iinfo(np.int64).min
+        ok = ~np.isnan(mid) & (s != nat) & (e != nat) & (e > s)
+        if "status" in rows.columns:
+            ok &= rows["status"].astype(object).ne("cancelled").to_numpy()
+        if not ok.any():
+            return
+        mid, s, e = mid[ok].astype(np.int64), s[ok], e[ok]
+        uid = pd.to_numeric(rows["user_id"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)[ok] if "user_id" in rows.columns else np.full(len(mid), np.nan)
+        src, month, weekday, hour, mins = _hour_pieces(s, e)
+        start_month = s.view("datetime64[ns]").astype("datetime64[M]").astype(np.int64)
+        machines, m0, minutes, bookings = self._grow(mid, np.r_[month, start_month])
+        row = np.searchsorted(machines, mid)
+        np.add.at(minutes, (row[src], month - m0, weekday, hour), mins)
+        np.add.at(bookings, (row, start_month - m0), 1)
+        # swap in whole new arrays so concurrent readers see either the old or the new ones
+        self.machines, self.m0, self.minutes, self.bookings = machines, m0, minutes, bookings
+        per_booking = np.bincount(src, weights=mins, minlength=len(s))
+        self._pending.append(pd.DataFrame({"month": start_month, "machine_id": mid, "user_id": uid, "minutes": per_booking, "bookings": 1}))
+
+    def users(self) -> pd.DataFrame:
+        """Booked minutes and bookings per start month, machine and member."""
+        if self._pending:
+            pending, self._pending = self._pending, []
+            grouped = pd.concat(([self._users] if len(self._users) else []) + pending, ignore_index=True)
+            self._users = grouped.groupby(["month", "machine_id", "user_id"], as_index=False, dropna=False)[["minutes", "bookings"]].sum()
+        return self._users
+
+def utilisation(store) -> Utilisation:
+    """The shared aggregates, built once per version of the Bookings sheet and kept current by commits."""
+    t0 = perf_counter()
+    ver = _version(store, "Bookings")
+    reg = derived_cache()
+    use = reg.get("utilisation")
+    if use is not None and ver is not None and use.version == ver:
+        record("utilisation", (perf_counter() - t0) * 1000, hit=True)
+        return use
+    B = store.bookings_history()
+    use = Utilisation(B, ver)
+    record("utilisation", (perf_counter() - t0) * 1000, rows=len(B), hit=False)
+    current = reg.get("utilisation")
+    if ver is not None and (current is None or current.version is None or current.version < ver):
+        reg["utilisation"] = use
+    return use
+
+def report_months(first=None, last=None) -> tuple:
+    """Month numbers [lo, hi] for the months holding *first* and *last*; by default the last
+    REPORT_MONTHS months up to this one."""
+    hi = _month_no(last if last is not None else pd.Timestamp.today())
+    lo = _month_no(first) if first is not None else hi - REPORT_MONTHS + 1
+    return lo, max(lo, hi)
+
+def open_minutes(store, machine_ids, lo: int, hi: int) -> np.ndarray:
+    """Open minutes as a machines × months × weekdays × hours array for months [lo, hi]."""
+    start = pd.Timestamp(np.datetime64(lo, "M"))
+    end = pd.Timestamp(np.datetime64(hi + 1, "M"))
+    cal = opening_calendar(store, start, end)
+    out = np.zeros((len(machine_ids), hi - lo + 1, 7, 24))
+    per_key = {}
+    for i, m in enumerate(machine_ids):
+        key = cal.key(m)
+        if key not in per_key:
+            grid = per_key[key] = np.zeros(out.shape[1:])
+            s, e = cal.spans(key, start, end)
+            s, e = np.maximum(s, start.value), np.minimum(e, end.value)
+            _, month, weekday, hour, mins = _hour_pieces(s, e)
+            np.add.at(grid, (month - lo, weekday, hour), mins)
+        out[i] = per_key[key]
+    return out
+
+@timed(rows=len)
+def utilisation_report(store, by: str = "machine", first=None, last=None, machine_ids=None, limit: int = 20) -> pd.DataFrame:
+    """Booked and open hours with utilisation %, broken down *by* one of BREAKDOWNS, over the
+    months from *first* to *last*; "user" lists the *limit* members with the most booked hours."""
+    use = utilisation(store)
+    lo, hi = report_months(first, last)
+    names = labels(store, "Machines", "machine_name")
+    known = pd.to_numeric(store.table("Machines", ["machine_id"]).get("machine_id", pd.Series(dtype=float)), errors="coerce").dropna()
+    ids = np.union1d(known.astype(np.int64).to_numpy(), use.machines) if machine_ids is None else np.unique(np.asarray(machine_ids, np.int64))
+    if by == "user":
+        U = use.users()
+        U = U[U["month"].between(lo, hi) & U["machine_id"].isin(ids)]
+        out = U.groupby("user_id", as_index=False)[["minutes", "bookings"]].sum().nlargest(limit, "minutes")
+        total = U["minutes"].sum()
+        out["name"] = out["user_id"].map(labels(store, "Users", "name"))
+        out["booked_hours"] = (out["minutes"] / 60).round(1)
+        out["share_pct"] = (out["minutes"] / total * 100).round(1) if total else 0.0
+        out["user_id"] = out["user_id"].astype("Int32")
+        return out[["user_id", "name", "bookings", "booked_hours", "share_pct"]].reset_index(drop=True)
+    # booked minutes for the chosen machines and months, zero where nothing was ever booked
+    booked = np.zeros((len(ids), hi - lo + 1, 7, 24))
+    count = np.zeros((len(ids), hi - lo + 1), np.int64)
+    have = np.isin(ids, use.machines)
+    rows = np.searchsorted(use.machines, ids[have])
+    a, b = max(lo, use.m0), min(hi + 1, use.m0 + use.minutes.shape[1])
+    if a < b:
+        booked[np.flatnonzero(have), a - lo:b - lo] = use.minutes[rows][:, a - use.m0:b - use.m0]
+        count[np.flatnonzero(have), a - lo:b - lo] = use.bookings[rows][:, a - use.m0:b - use.m0]
+    opened = open_minutes(store, ids, lo, hi)
+    axes = {"machine": (1, 2, 3), "month": (0, 2, 3), "weekday": (0, 1, 3), "hour": (0, 1, 2)}[by]
+    booked_m, open_m = booked.sum(axis=axes), opened.sum(axis=axes)
+    if by == "machine":
+        out = pd.DataFrame({"machine_id": ids, "machine_name": pd.Series(ids).map(names).to_numpy(), "bookings": count.sum(axis=1)})
+    elif by == "month":
+        out = pd.DataFrame({"month": pd.period_range(pd.Timestamp(np.datetime64(lo, "M")), periods=hi - lo + 1, freq="M").strftime("%Y-%m"), "bookings": count.sum(axis=0)})
+    elif by == "weekday":
+        out = pd.DataFrame({"weekday": WEEKDAYS})
+    else:
+        out = pd.DataFrame({"hour": [f"{h:02d}:00" for h in range(24)]})
+    out["booked_hours"] = (booked_m / 60).round(1)
+    out["open_hours"] = (open_m / 60).round(1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["utilisation_pct"] = np.where(open_m > 0, (booked_m / open_m * 100).round(1), np.nan)
+    return out